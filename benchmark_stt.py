@@ -0,0 +1,38 @@
+import argparse
+import importlib
+import json
+from modules.SpeechToTextBenchmark import SpeechToTextBenchmark, write_report
+from modules.engines.EngineRegistry import create_default_engine_registry
+from modules.helpers.logging_helper import logger
+
+
+def import_engine_class(class_path: str):
+    module_name, class_name = class_path.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark speech recognition engines over a corpus of WAV files, "
+                                                 "each with its expected transcript in a .txt file of the same name.")
+    parser.add_argument("corpus_directory")
+    parser.add_argument("--engine", action="append", dest="engines",
+                        help="An engine to benchmark. Can be given more than once. Defaults to sphinx.")
+    parser.add_argument("--engine-class", action="append", default=[], metavar="NAME=MODULE:CLASS",
+                        help="Register a local engine class, e.g. whisper=my_engines:WhisperEngine, to benchmark it.")
+    parser.add_argument("--keyword", default="ringo", help="The character name to measure keyword spotting for.")
+    parser.add_argument("--output", help="Where to write the JSON report. Printed if not specified.")
+    args = parser.parse_args()
+
+    engine_registry = create_default_engine_registry()
+    for engine_class in args.engine_class:
+        name, class_path = engine_class.split("=", 1)
+        engine_registry.register(name, import_engine_class(class_path))
+
+    benchmark = SpeechToTextBenchmark(corpus_directory=args.corpus_directory, engine_registry=engine_registry,
+                                      keyword=args.keyword or None)
+    report = benchmark.run(args.engines or ["sphinx"])
+    if args.output:
+        write_report(report, args.output)
+        logger.info(f"Wrote benchmark report to {args.output}")
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
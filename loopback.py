@@ -33,10 +33,8 @@ if __name__ == "__main__":
     text_to_speech = TextToSpeech()
 
     while True:
-        if speech_to_text.transcription:
-            transcribed_message = speech_to_text.transcription.pop(0)
-            logger.info(f"Transcribed message: {transcribed_message}")
-            text_to_speech.speak_on_device(transcribed_message, speaking_device)
-        time.sleep(0.001)
+        transcription_record = speech_to_text.transcription.get()
+        logger.info(f"Transcribed message: {transcription_record.text}")
+        text_to_speech.speak_on_device(transcription_record.text, speaking_device)
 
     pass
\ No newline at end of file
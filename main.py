@@ -1,20 +1,30 @@
 import time
 import random
 from modules.helpers.logging_helper import logger
+from modules.helpers.tracing_helper import tracer
 from modules.SpeechToText import SpeechToText
+from modules.engines.EngineRegistry import create_default_engine_registry
+from modules.KeywordSpotter import KeywordSpotter
+from modules.VoiceActivityDetector import VoiceActivityDetector
 from modules.TextToSpeech import TextToSpeech
+from modules.TextToSpeechService import TextToSpeechService
 from modules.PyAudioWrapper import PyAudioWrapper
-from modules.OpenAIAPIClient import APIClient
+from modules.AudioPlayer import AudioPlayer
+from modules.AudioCache import AudioCache
+from modules.AsyncAPIClient import AsyncAPIClient
 from modules.enums.ActionEnum import ActionEnum
+from modules.TurnRunner import AsyncTurnRunner
 from modules.Character import Character, WanderingState, ConversingState, PerformingActionState
 from modules.Config import Config
+from modules.RetryPolicy import RetryPolicy
 from uuid import uuid4
+import asyncio
+import atexit
 import os
 from typing import List, Optional, Tuple, Union
 from modules.AudioDevice import AudioDevice
 
-def get_audio_devices(speaking_device_name: str, listening_device_name: str) -> Tuple[AudioDevice, AudioDevice]:
-    py_audio_wrapper = PyAudioWrapper()
+def get_audio_devices(py_audio_wrapper: PyAudioWrapper, speaking_device_name: str, listening_device_name: str) -> Tuple[AudioDevice, AudioDevice]:
     audio_devices = py_audio_wrapper.get_audio_devices()
     # Speak into the game (Cable A)
     speaking_device = audio_devices.get_input_device_by_name("cable-a")
@@ -27,31 +37,67 @@ def get_audio_devices(speaking_device_name: str, listening_device_name: str) ->
 if __name__ == "__main__":
     CHARACTER_NAME = "ringo"
 
-    speaking_device, listening_device = get_audio_devices(speaking_device_name="cable-a", listening_device_name="cable-b")
+    # A single PortAudio instance is shared by device discovery and speech playback
+    py_audio_wrapper = PyAudioWrapper()
+    speaking_device, listening_device = get_audio_devices(py_audio_wrapper=py_audio_wrapper,
+                                                          speaking_device_name="cable-a", listening_device_name="cable-b")
     logger.info(f"Speaking device: {speaking_device}")
     logger.info(f"Listening device: {listening_device}")
 
-    # Create a TextToSpeech object
-    text_to_speech = TextToSpeech()
+    config = Config(os.path.join('config.ini'))
+    tracer.configure(enabled=config.tracing_enabled, ring_buffer_size=config.tracing_ring_buffer_size,
+                     jsonl_file_path=config.tracing_jsonl_path)
+    atexit.register(tracer.log_summary)
+
+    # Create a TextToSpeechService, which creates its TextToSpeech on its own thread
+    audio_cache = AudioCache(max_bytes=int(config.audio_cache_max_megabytes * 1024 * 1024),
+                             directory=config.audio_cache_directory,
+                             max_disk_bytes=int(config.audio_cache_max_disk_megabytes * 1024 * 1024))
+    audio_player = AudioPlayer(py_audio_wrapper)
+    text_to_speech_service = TextToSpeechService(
+        text_to_speech_factory=lambda: TextToSpeech(audio_player=audio_player, audio_cache=audio_cache),
+        audio_player=audio_player,
+        prerendered_phrases=config.prerendered_phrases)
+    text_to_speech_service.start()
     # Create a SpeechToText object
+    # Speech recognition engines are loaded once and kept warm
+    engine_registry = create_default_engine_registry(keyword_entries=[(CHARACTER_NAME, 1)],
+                                                     credentials_json_file_path='google_cloud_credentials.json',
+                                                     sphinx_timeout_seconds=config.sphinx_timeout_seconds,
+                                                     google_timeout_seconds=config.google_timeout_seconds)
     speech_to_text = SpeechToText(device_index=listening_device.device_index,
                                   credentials_json_file_path='google_cloud_credentials.json',
-                                  keyword_entries=[(CHARACTER_NAME, 1)]) # Listen for the character name only
+                                  keyword_entries=[(CHARACTER_NAME, 1)], # Listen for the character name only
+                                  engine_registry=engine_registry,
+                                  max_buffered_audio_chunks=config.max_buffered_audio_chunks,
+                                  buffer_overflow_policy=config.buffer_overflow_policy,
+                                  max_transcriptions=config.max_transcriptions,
+                                  transcription_overflow_policy=config.transcription_overflow_policy,
+                                  num_transcription_workers=config.num_transcription_workers,
+                                  use_worker_processes=config.use_worker_processes,
+                                  keyword_spotter=KeywordSpotter(keyword_entries=[(CHARACTER_NAME, 1)]) if config.use_keyword_spotter else None,
+                                  voice_activity_detector=VoiceActivityDetector(hangover_ms=config.vad_hangover_ms,
+                                                                                min_segment_ms=config.vad_min_segment_ms,
+                                                                                max_segment_ms=config.vad_max_segment_ms)
+                                  if config.use_voice_activity_detector else None,
+                                  speculative_engine="google" if config.speculative_transcription else None)
+    # With the keyword spotter, only utterances containing the name are transcribed, so they go straight to Google Cloud
+    speech_to_text.set_engine("google" if config.use_keyword_spotter else "sphinx")
     speech_to_text.start()
-    speech_to_text.set_engine("sphinx")
     logger.info("Listening for audio")
 
     character = Character(name=CHARACTER_NAME,
                           window_title="NeosVR",
                           #window_title="VRChat",
-                          text_to_speech=text_to_speech,
+                          text_to_speech_service=text_to_speech_service,
                           speech_to_text=speech_to_text,
                           speaking_device=speaking_device,
                           listening_device=listening_device)
     logger.info(f"Bot name: {character.name}")
+    # Speculate on every utterance while conversing, since most of them will be answered
+    speech_to_text.speculate_while = lambda: character.state.is_conversing
 
-    config = Config(os.path.join('config.ini'))
-    openai_api_client = APIClient(base_url=config.base_url,
+    openai_api_client = AsyncAPIClient(base_url=config.base_url,
                      path=config.path,
                      api_key=config.api_key,
                      model=config.model,
@@ -60,129 +106,20 @@ if __name__ == "__main__":
                      temperature=config.temperature,
                      conversation_prune_after_seconds=config.conversation_prune_after_seconds,
                      max_dialogues_per_conversation=config.max_dialogues_per_conversation,
+                     max_retained_conversation_tokens=config.max_retained_conversation_tokens,
+                     pool_size=config.pool_size,
+                     connect_timeout=config.connect_timeout,
+                     read_timeout=config.read_timeout,
+                     pre_connect=config.pre_connect,
+                     retry_policy=RetryPolicy(max_attempts=config.max_attempts,
+                                              deadline_seconds=config.request_deadline_seconds),
                      system_message=config.system_message,
                      forced_system_message=config.forced_system_message
                      )
 
-    while True:
-        # Check if the transcription queue has any messages
-        if speech_to_text.transcription:
-            transcribed_message = speech_to_text.transcription.pop(0)
-            transcribed_message = transcribed_message.strip().lower()
-            logger.info(f"Sphinx transcription: {transcribed_message}")
-
-            if character.name not in transcribed_message.lower():
-                continue
-
-            logger.info(f"Character name {character.name} detected with Sphinx transcription")
-
-            try:
-                transcribed_message = speech_to_text._transcribe_from_audio_data(speech_to_text.latest_audio_chunk,
-                                                                                 engine="google")
-            except Exception as e:
-                logger.error(f"Error transcribing audio with Google Cloud: {e}")
-                continue
-
-            logger.info(f"Google Cloud transcription: {transcribed_message}")
-
-            # Currently only requiring character name to be detected with Sphinx,
-            # if character.name not in transcribed_message.lower():
-            #     continue
-            # logger.info(f"Character name {character.name} detected with Google Cloud transcription")
-
-            if character.state.is_wandering:
-                logger.info("Starting new conversation because character name was detected with Google Cloud transcription.")
-                character.start_conversation()
-            else:
-                end_keywords = ["bye", "quit", "exit"]
-                #transcribed_message_words = transcribed_message.split()
-                if character.state.is_conversing and any(end_keyword in transcribed_message for end_keyword in end_keywords):
-                    logger.info(f"Ending conversation due to goodbye.")
-                    character.end_conversation()
-                    continue
-
-                stop_action_keywords = ["stop", "wait", "hold", "pause"]
-                if character.state.is_performing_action and any(stop_action_keyword in transcribed_message for stop_action_keyword in stop_action_keywords):
-                    logger.info(f"Stopping action due to stop keyword.")
-                    character.actions.stop_flag = True
-                    logger.info("Set stop flag to True")
-                    character.actions.unset_stop_flag_after_action_finishes()
-                    logger.info("Action finished")
-                    character.set_state(character.previous_state)
-                    continue
-
-            if not character.state.is_conversing:
-                continue
-
-            # Character nods once to indicate it heard the message
-            character.actions.enqueue_action(ActionEnum.NOD_HEAD)
-
-            openai_response = openai_api_client.send_prompt(
-                prompt=transcribed_message,
-                conversation_id=character.conversation_uuid
-            )
-
-            logger.info(f"OpenAI response: {openai_response}")
-
-            conversation_end_needed = False
-            transition_to_performing_action_state_needed = False
-
-            if openai_response.startswith("TYPE_NORMAL"):
-                # Remove the TYPE_NORMAL prefix
-                openai_response = openai_response.replace("TYPE_NORMAL", "")
-                character.consecutive_confused_responses = 0
-            elif openai_response.startswith("TYPE_ENDING"):
-                openai_response = openai_response.replace("TYPE_ENDING", "")
-                conversation_end_needed = True
-                logger.info(f"Ending conversation due to TYPE_ENDING: {character.conversation_uuid}")
-            elif openai_response.startswith("TYPE_CONFUSED"):
-                openai_response = openai_response.replace("TYPE_CONFUSED", "")
-                character.consecutive_confused_responses += 1
-            elif openai_response.startswith("TYPE_YES"):
-                openai_response = openai_response.replace("TYPE_YES", "")
-                character.actions.enqueue_action(ActionEnum.NOD_HEAD_TWICE)
-            elif openai_response.startswith("TYPE_NO"):
-                openai_response = openai_response.replace("TYPE_NO", "")
-                character.actions.enqueue_action(ActionEnum.SHAKE_HEAD)
-            elif openai_response.startswith("TYPE_CMD"):
-                # Sometimes the AI will identify a command, but claim it cannot perform it.
-                # In this case, just don't say anything.
-                if "sorry" in transcribed_message.lower():
-                    transcribed_message = ""
-                if not character.actions.window_is_focused:
-                    openai_response = "Sorry, I cannot move right now."
-                elif openai_response.startswith("TYPE_CMD_TURN"):
-                    openai_response = openai_response.replace("TYPE_CMD_TURN", "")
-                    left_turn_keywords = ["left", "counter"]
-                    if any(left_turn_keyword in transcribed_message for left_turn_keyword in left_turn_keywords):
-                        character.actions.enqueue_action(ActionEnum.TURN_LEFT_UNTIL_STOP_FLAG)
-                    else:
-                        character.actions.enqueue_action(ActionEnum.TURN_RIGHT_UNTIL_STOP_FLAG)
-                    transition_to_performing_action_state_needed = True
-                elif openai_response.startswith("TYPE_CMD_FORWARD"):
-                    openai_response = openai_response.replace("TYPE_CMD_FORWARD", "")
-                    character.actions.enqueue_action(ActionEnum.MOVE_FORWARD_UNTIL_STOP_FLAG)
-                    transition_to_performing_action_state_needed = True
-                elif openai_response.startswith("TYPE_CMD_BACK"):
-                    openai_response = openai_response.replace("TYPE_CMD_BACK", "")
-                    character.actions.enqueue_action(ActionEnum.MOVE_BACK_UNTIL_STOP_FLAG)
-                    transition_to_performing_action_state_needed = True
-
-            character.state.speak(text_to_speech=text_to_speech, text=openai_response, speaking_device=speaking_device)
-
-            if conversation_end_needed:
-                logger.info(f"Ending conversation: {character.conversation_uuid}")
-                character.end_conversation()
-            if transition_to_performing_action_state_needed:
-                character.set_state(PerformingActionState())
-
-            # Clear the transcription queue right after we have processed a message
-            # This means any messages that come in while we are processing a message will be ignored
-            # But this also means we won't have to worry about processing now-irrelevant messages
-            speech_to_text.transcription.clear()
-
-        character.update()
-
-        time.sleep(0.001)
-
-    pass
\ No newline at end of file
+    turn_runner = AsyncTurnRunner(character=character,
+                                  speech_to_text=speech_to_text,
+                                  api_client=openai_api_client,
+                                  stream=config.stream,
+                                  max_transcription_age_seconds=config.max_transcription_age_seconds)
+    asyncio.run(turn_runner.run())
@@ -1,12 +1,20 @@
+import heapq
+import sys
 import time
-import ctypes
-import pygetwindow as gw
 import threading
-from typing import Optional
-from collections import deque
-from enum import Enum
+from concurrent.futures import CancelledError, Future
+from typing import List, Optional, Tuple
 from modules.helpers.logging_helper import logger
+from modules.helpers.tracing_helper import tracer
 from modules.enums.ActionEnum import ActionEnum
+from modules.enums.ActionPriorityEnum import ActionPriorityEnum
+from modules.CancellationToken import CancellationToken
+from modules.MotionEngine import MotionEngine
+from modules.WindowFocusTracker import WindowFocusTracker
+from modules.input_backends.InputBackend import InputBackend
+from modules.input_backends.RecordingInputBackend import RecordingInputBackend
+from modules.input_backends.UInputBackend import UInputBackend
+from modules.input_backends.WindowsInputBackend import WindowsInputBackend
 import random
 
 # Constants for commonly used keys (using scancodes)
@@ -15,155 +23,282 @@ A = 0x1E
 S = 0x1F
 D = 0x20
 
-# C struct redefinitions
-PUL = ctypes.POINTER(ctypes.c_ulong)
 
-class KeyBdInput(ctypes.Structure):
-    _fields_ = [("wVk", ctypes.c_ushort),
-                ("wScan", ctypes.c_ushort),
-                ("dwFlags", ctypes.c_ulong),
-                ("time", ctypes.c_ulong),
-                ("dwExtraInfo", PUL)]
-
-class HardwareInput(ctypes.Structure):
-    _fields_ = [("uMsg", ctypes.c_ulong),
-                ("wParamL", ctypes.c_short),
-                ("wParamH", ctypes.c_ushort)]
-
-class MouseInput(ctypes.Structure):
-    _fields_ = [("dx", ctypes.c_long),
-                ("dy", ctypes.c_long),
-                ("mouseData", ctypes.c_ulong),
-                ("dwFlags", ctypes.c_ulong),
-                ("time", ctypes.c_ulong),
-                ("dwExtraInfo", PUL)]
-
-class Input_I(ctypes.Union):
-    _fields_ = [("ki", KeyBdInput),
-                ("mi", MouseInput),
-                ("hi", HardwareInput)]
-
-class Input(ctypes.Structure):
-    _fields_ = [("type", ctypes.c_ulong),
-                ("ii", Input_I)]
+def create_default_input_backend() -> InputBackend:
+    """
+    :return: SendInput on Windows, otherwise uinput. If uinput isn't available, e.g. without the evdev package or write
+    access to /dev/uinput, input is only recorded instead of sent.
+    """
+    if sys.platform == "win32":
+        return WindowsInputBackend()
+    try:
+        return UInputBackend()
+    except Exception as e:
+        logger.warning(f"Could not create the uinput input backend, so input will only be recorded: {e}")
+        return RecordingInputBackend()
+
+
+class QueuedAction:
+    def __init__(self, action: ActionEnum, priority: ActionPriorityEnum, trace_id: Optional[str],
+                 cancellation_token: CancellationToken):
+        self.action = action
+        self.priority = priority
+        self.trace_id = trace_id
+        self.cancellation_token = cancellation_token
+        self.enqueue_epoch = time.time()
+        # Completes once the action has been performed, and is cancelled if the action is cancelled
+        self.future = Future()
 
 
 class Actions:
-    def __init__(self, window_title: Optional[str] = None):
-        """Initialize the Actions class with an optional window title substring."""
+    """
+    Performs queued actions on the action thread, while the game window is focused.
+    The action thread sleeps until an action is enqueued, the window loses focus, or the actions are closed,
+    instead of polling the queue. Queued actions run in priority order, and between the frames of a running action,
+    queued actions of higher priority are performed first, e.g. a nod while walking.
+    """
+
+    def __init__(self, window_title: Optional[str] = None, input_backend: Optional[InputBackend] = None,
+                 window_focus_tracker: Optional[WindowFocusTracker] = None):
+        """
+        Initialize the Actions class with an optional window title substring.
+        :param input_backend: Optional. Sends the actions' input. Defaults to the platform's backend.
+        :param window_focus_tracker: Optional. Tracks the focus of the window. Defaults to a tracker of the window
+        with the title.
+        """
         if not window_title:
             raise ValueError("A window title is required.")
         self.window_title = window_title
-        self.window_is_focused = self.is_window_focused(self.window_title)
-        self.action_queue = deque()
+        self.input_backend = input_backend if input_backend is not None else create_default_input_backend()
+        # Guards the action queue and is notified whenever it, the running actions or the window focus change
+        self.condition = threading.Condition()
+        self.closed = threading.Event()
+        self.window_focus_tracker = window_focus_tracker if window_focus_tracker is not None else \
+            WindowFocusTracker(window_title=window_title)
+        with self.condition:
+            # Subscribed before reading the focus, so no change is missed in between
+            self.window_focus_tracker.subscribe(self._on_window_focus_changed)
+            self._window_is_focused = self.window_focus_tracker.is_focused
+        # A heap of (priority, sequence number, queued action), so actions of the same priority run in order
+        self.action_queue = []
+        self.num_enqueued_actions = 0
+        # The running action, and the actions interleaved with it on top
+        self.running_actions: List[QueuedAction] = []
         self.thread = None
-        self.window_focus_thread = None
-        self.stop_flag = False
-        self.action_is_ongoing = False
+        self.motion_engine = MotionEngine(send_mouse_moves=self.send_mouse_moves)
+
+    @property
+    def window_is_focused(self) -> bool:
+        return self._window_is_focused
+
+    def _on_window_focus_changed(self, window_is_focused: bool):
+        with self.condition:
+            self._window_is_focused = window_is_focused
+            self.condition.notify_all()
+
+    @property
+    def action_is_ongoing(self) -> bool:
+        return len(self.running_actions) > 0
 
     def start(self):
         if self.thread is None:
             self.thread = threading.Thread(target=self._execute_actions)
             self.thread.start()
             logger.info(f"Started Actions thread")
-        if self.window_focus_thread is None:
-            self.window_focus_thread = threading.Thread(target=self._check_window_focus)
-            self.window_focus_thread.start()
-            logger.info(f"Started window focus thread")
+        self.window_focus_tracker.start()
 
-    def enqueue_random_action(self):
+    def close(self):
+        """
+        Stop the action thread and the window focus tracker. Queued and running actions are cancelled.
+        """
+        self.window_focus_tracker.unsubscribe(self._on_window_focus_changed)
+        self.window_focus_tracker.close()
+        with self.condition:
+            self.closed.set()
+        self.cancel_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def enqueue_random_action(self) -> Future:
         random_action = random.choice([
             ActionEnum.TURN_LEFT_RANDOMLY,
             ActionEnum.TURN_RIGHT_RANDOMLY,
             ActionEnum.MOVE_FORWARD_RANDOMLY,
             ActionEnum.MOVE_BACK_RANDOMLY])
-        self.enqueue_action(random_action)
-
-    def unset_stop_flag_after_action_finishes(self):
-        self.wait_for_action_to_finish()
-        self.stop_flag = False
-        logger.info("Set stop flag to False after action finished.")
-
-    def wait_for_action_to_finish(self):
-        while self.action_is_ongoing:
-            time.sleep(0.01)
+        return self.enqueue_action(random_action)
 
-    def _check_window_focus(self):
-        prev_window_is_focused = None  # To keep track of previous state
-        while True:
-            self.window_is_focused = self.is_window_focused(self.window_title)
-
-            if self.window_is_focused != prev_window_is_focused:  # Check if state changed
-                if self.window_is_focused:
-                    logger.info(f"Window '{self.window_title}' is now focused.")
-                else:
-                    logger.info(f"Window '{self.window_title}' is no longer focused.")
+    def cancel_all(self):
+        """
+        Cancel all queued actions, and stop the running ones at their next frame.
+        Returns right away, without waiting for the running actions to stop.
+        """
+        with self.condition:
+            self._clear_action_queue()
+            for queued_action in self.running_actions:
+                queued_action.cancellation_token.cancel()
+            self.condition.notify_all()
+        logger.info("Cancelled all actions")
+
+    def wait_for_action_to_finish(self, timeout: Optional[float] = None) -> bool:
+        """
+        :return: Whether the ongoing action, if any, finished before the timeout
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.action_is_ongoing, timeout=timeout)
 
-            prev_window_is_focused = self.window_is_focused  # Update previous state
-            time.sleep(0.01)
+    def enqueue_action(self, action: ActionEnum, trace_id: Optional[str] = None,
+                       priority: Optional[ActionPriorityEnum] = None,
+                       cancellation_token: Optional[CancellationToken] = None) -> Future:
+        """
+        :param trace_id: Optional. The trace to record the time the action waited in the queue, and its execution, in.
+        :param priority: Optional. Defaults to the action's priority.
+        :param cancellation_token: Optional. Cancelling it cancels the action, even once it's running.
+        :return: A future that completes once the action has been performed. It's cancelled if the action is
+        cancelled, or cleared from the queue because the window lost focus.
+        """
+        queued_action = QueuedAction(action=action, priority=priority if priority is not None else action.priority,
+                                     trace_id=trace_id,
+                                     cancellation_token=cancellation_token if cancellation_token is not None
+                                     else CancellationToken())
+        with self.condition:
+            heapq.heappush(self.action_queue, (queued_action.priority.value, self.num_enqueued_actions, queued_action))
+            self.num_enqueued_actions += 1
+            num_queued_actions = len(self.action_queue)
+            self.condition.notify_all()
+        logger.info(f"Enqueued action: {action.value}. Total actions in queue: {num_queued_actions}")
+        return queued_action.future
+
+    def _clear_action_queue(self):
+        """
+        Cancel all queued actions. Must be called with the condition held.
+        """
+        for _, _, queued_action in self.action_queue:
+            queued_action.cancellation_token.cancel()
+            queued_action.future.cancel()
+        self.action_queue.clear()
 
-    def enqueue_action(self, action: ActionEnum):
-        self.action_queue.append(action)
-        logger.info(f"Enqueued action: {action.value}. Total actions in queue: {len(self.action_queue)}")
+    def _next_action(self) -> Optional[QueuedAction]:
+        """
+        Wait until there's an action to perform while the window is focused, and mark it as running.
+        :return: The action, or None once the actions are closed
+        """
+        with self.condition:
+            while True:
+                if self.closed.is_set():
+                    self._clear_action_queue()
+                    return None
+                if self.action_queue and not self.window_is_focused:
+                    self._clear_action_queue()
+                if self.action_queue:
+                    _, _, queued_action = heapq.heappop(self.action_queue)
+                    self.running_actions.append(queued_action)
+                    return queued_action
+                self.condition.wait()
+
+    def _next_preempting_action(self) -> Optional[QueuedAction]:
+        """
+        Mark the next queued action as running if it has a higher priority than the running action.
+        :return: The action, or None if there isn't one
+        """
+        with self.condition:
+            if not self.action_queue or not self.running_actions or not self.window_is_focused:
+                return None
+            priority, _, queued_action = self.action_queue[0]
+            if priority >= self.running_actions[-1].priority.value:
+                return None
+            heapq.heappop(self.action_queue)
+            self.running_actions.append(queued_action)
+            return queued_action
+
+    def _finish_action(self, queued_action: QueuedAction):
+        with self.condition:
+            self.running_actions.remove(queued_action)
+            self.condition.notify_all()
+
+    def _perform(self, queued_action: QueuedAction):
+        action = queued_action.action
+        if queued_action.cancellation_token.is_cancelled:
+            queued_action.future.cancel()
+            return
+        if not queued_action.future.set_running_or_notify_cancel():
+            return
+        tracer.record("action.queue_wait", queued_action.trace_id, queued_action.enqueue_epoch, action=action.value)
+        try:
+            with tracer.span("action.execute", queued_action.trace_id, action=action.value):
+                getattr(self, action.value)()
+            if queued_action.cancellation_token.is_cancelled:
+                queued_action.future.set_exception(CancelledError())
+            else:
+                queued_action.future.set_result(None)
+        except Exception as e:
+            logger.error(f"Error performing action {action.value}: {e}")
+            queued_action.future.set_exception(e)
+        logger.info(f"Executed action: {action.value}")
 
     def _execute_actions(self):
         while True:
-            if self.window_is_focused:
-                while self.action_queue and self.window_is_focused:
-                    self.action_is_ongoing = True
-                    action = self.action_queue.popleft()
-                    getattr(self, action.value)()
-                    logger.info(f"Executed action: {action.value}")
-                    if self.stop_flag:
-                        logger.info(f"Stop flag set. Stopping current actions and clearing action queue")
-                        self.action_queue.clear()
-                        self.action_is_ongoing = False
-                        break
-                    self.action_is_ongoing = False
-            else:
-                self.action_queue.clear()
-            time.sleep(0.001)
+            queued_action = self._next_action()
+            if queued_action is None:
+                return
+            try:
+                self._perform(queued_action)
+            finally:
+                self._finish_action(queued_action)
 
-    @staticmethod
-    def is_window_focused(title: str):
-        """Check if a window with the title is currently focused."""
-        try:
-            active_window = gw.getActiveWindow()
-            if active_window is None:
-                return False
-            #return title.lower() in active_window.title.lower()
-            return title.lower() == active_window.title.lower()
-        except Exception as e:
-            print(f"An error occurred in is_window_focused(): {e}")
-            return False
+    def _should_stop(self) -> bool:
+        """
+        Called by the running action between its frames. Queued actions of higher priority are performed first.
+        :return: Whether the running action should stop, because it was cancelled or the window lost focus
+        """
+        if threading.current_thread() is not self.thread:
+            # Called directly instead of as a queued action
+            return not self.window_is_focused
+        while True:
+            queued_action = self._next_preempting_action()
+            if queued_action is None:
+                break
+            logger.info(f"Interleaving action: {queued_action.action.value}")
+            try:
+                self._perform(queued_action)
+            finally:
+                self._finish_action(queued_action)
+        return self.running_actions[-1].cancellation_token.is_cancelled or not self.window_is_focused
+
+    def _wait(self, duration: float) -> bool:
+        """
+        Wait as part of the running action, checking whether it should stop every frame.
+        :return: Whether the wait completed, as opposed to the action being stopped
+        """
+        deadline = time.monotonic() + duration
+        while not self._should_stop():
+            remaining_seconds = deadline - time.monotonic()
+            if remaining_seconds <= 0:
+                return True
+            time.sleep(min(remaining_seconds, self.motion_engine.frame_seconds))
+        return False
 
     def press_key(self, hex_key_code):
-        extra = ctypes.c_ulong(0)
-        ii_ = Input_I()
-        ii_.ki = KeyBdInput(0, hex_key_code, 0x0008, 0, ctypes.pointer(extra))
-        x = Input(ctypes.c_ulong(1), ii_)
-        ctypes.windll.user32.SendInput(1, ctypes.pointer(x), ctypes.sizeof(x))
+        self.input_backend.press_key(hex_key_code)
 
     def release_key(self, hex_key_code):
-        extra = ctypes.c_ulong(0)
-        ii_ = Input_I()
-        ii_.ki = KeyBdInput(0, hex_key_code, 0x0008 | 0x0002, 0, ctypes.pointer(extra))
-        x = Input(ctypes.c_ulong(1), ii_)
-        ctypes.windll.user32.SendInput(1, ctypes.pointer(x), ctypes.sizeof(x))
-
-    def move_forward(self, duration: float = 0.5, do_until_stop_flag: bool = False):
-        if do_until_stop_flag:
-            while self.stop_flag is False and self.window_is_focused:
+        self.input_backend.release_key(hex_key_code)
+
+    def send_mouse_moves(self, moves: List[Tuple[int, int]]):
+        self.input_backend.send_mouse_moves(moves)
+
+    def move_forward(self, duration: float = 0.5, do_until_cancelled: bool = False):
+        if do_until_cancelled:
+            while not self._should_stop():
                 self.press_and_release_key(W, duration)
-                time.sleep(0.5)
+                self._wait(0.5)
         else:
             self.press_and_release_key(W, duration)
 
-    def move_back(self, duration: float = 0.5, do_until_stop_flag: bool = False):
-        if do_until_stop_flag:
-            while self.stop_flag is False and self.window_is_focused:
+    def move_back(self, duration: float = 0.5, do_until_cancelled: bool = False):
+        if do_until_cancelled:
+            while not self._should_stop():
                 self.press_and_release_key(S, duration)
-                time.sleep(0.5)
+                self._wait(0.5)
         else:
             self.press_and_release_key(S, duration)
 
@@ -175,8 +310,10 @@ class Actions:
 
     def press_and_release_key(self, hex_key_code, duration: float = 0.5):
         self.press_key(hex_key_code)
-        time.sleep(duration)
-        self.release_key(hex_key_code)
+        try:
+            self._wait(duration)
+        finally:
+            self.release_key(hex_key_code)
 
     def move_mouse(self, direction, distance: int = 50, duration: float = 1):
         """
@@ -185,43 +322,33 @@ class Actions:
         :param duration: Total time in seconds it should take to move the mouse the specified distance.
         :return: None
         """
-        if duration <= 0:
-            raise ValueError("Invalid duration value. Must be greater than 0.")
-
-        step_delay = duration / distance  # Time to sleep between each step
-        step_x, step_y = 0, 0
-
         if direction == 'left':
-            step_x = -1
+            dx, dy = -distance, 0
         elif direction == 'right':
-            step_x = 1
+            dx, dy = distance, 0
         elif direction == 'up':
-            step_y = -1
+            dx, dy = 0, -distance
         elif direction == 'down':
-            step_y = 1
+            dx, dy = 0, distance
         else:
             raise ValueError("Invalid direction. Must be 'left', 'right', 'up', or 'down'.")
 
-        for _ in range(distance):
-            if self.stop_flag:
-                logger.info(f"Stop flag set, so early exiting move_mouse()")
-                return
-            elif not self.window_is_focused:
+        if not self.motion_engine.move(dx, dy, duration, should_stop=self._should_stop):
+            if self.window_is_focused:
+                logger.info(f"Action cancelled, so early exiting move_mouse()")
+            else:
                 logger.info(f"Window is no longer focused, so early exiting move_mouse()")
-                return
-            ctypes.windll.user32.mouse_event(0x0001, step_x, step_y, 0, 0)
-            time.sleep(step_delay)
 
-    def move_mouse_left(self, distance: int = 50, duration: float = 1, do_until_stop_flag: bool = False):
-        if do_until_stop_flag:
-            while self.stop_flag is False and self.window_is_focused:
+    def move_mouse_left(self, distance: int = 50, duration: float = 1, do_until_cancelled: bool = False):
+        if do_until_cancelled:
+            while not self._should_stop():
                 self.move_mouse('left', distance, duration)
         else:
             self.move_mouse('left', distance, duration)
 
-    def move_mouse_right(self, distance: int = 50, duration: float = 1, do_until_stop_flag: bool = False):
-        if do_until_stop_flag:
-            while self.stop_flag is False and self.window_is_focused:
+    def move_mouse_right(self, distance: int = 50, duration: float = 1, do_until_cancelled: bool = False):
+        if do_until_cancelled:
+            while not self._should_stop():
                 self.move_mouse('right', distance, duration)
         else:
             self.move_mouse('right', distance, duration)
@@ -253,16 +380,16 @@ class Actions:
         self.move_mouse_left(distance=1000, duration=0.5)
 
     def turn_right_until_stop_flag(self):
-        self.move_mouse_right(do_until_stop_flag=True)
+        self.move_mouse_right(do_until_cancelled=True)
 
     def turn_left_until_stop_flag(self):
-        self.move_mouse_left(do_until_stop_flag=True)
+        self.move_mouse_left(do_until_cancelled=True)
 
     def move_forward_until_stop_flag(self):
-        self.move_forward(duration=0.25, do_until_stop_flag=True)
+        self.move_forward(duration=0.25, do_until_cancelled=True)
 
     def move_back_until_stop_flag(self):
-        self.move_back(duration=0.25, do_until_stop_flag=True)
+        self.move_back(duration=0.25, do_until_cancelled=True)
 
     def turn_right_randomly(self):
         self.move_mouse_right(distance=random.randint(100, 1000), duration=random.uniform(0.1, 0.5))
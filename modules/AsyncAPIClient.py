@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+import requests
+from typing import AsyncIterator, Optional
+from modules.helpers.logging_helper import logger
+from modules.helpers.tracing_helper import tracer
+from modules.OpenAIAPIClient import APIClient, iter_server_sent_events, get_text_chunk_from_event
+
+
+class AsyncAPIClient(APIClient):
+    """
+    An APIClient that can be awaited from an event loop. The blocking HTTP calls run on worker threads,
+    over the same pooled session, and retries wait with asyncio.sleep, so the event loop keeps running
+    while a request is in flight.
+    Building the request and saving the response stay on the event loop's thread, so conversations are
+    never touched from two threads at once.
+    """
+
+    async def post_async(self, body: dict, headers: dict, path: str, remaining_seconds: Optional[float] = None) -> str:
+        return await asyncio.to_thread(self.post, body, headers, path, remaining_seconds)
+
+    async def post_stream_async(self, body: dict, headers: dict, path: str,
+                                remaining_seconds: Optional[float] = None) -> requests.Response:
+        return await asyncio.to_thread(self.post_stream, body, headers, path, remaining_seconds)
+
+    async def send_prompt_async(self, prompt: str, conversation_id: str = None, trace_id: Optional[str] = None) -> str:
+        with tracer.span("llm.build_request", trace_id):
+            body, conversation, prompt_num_tokens = self._build_body(prompt=prompt, conversation_id=conversation_id)
+
+        with tracer.span("llm.network", trace_id):
+            response = await self.retry_policy.call_async(
+                lambda remaining_seconds: self.post_async(body=body, headers=self._get_headers(), path=self.path,
+                                                          remaining_seconds=remaining_seconds))
+        logger.info(f"Got response: {response}")
+        with tracer.span("llm.parse", trace_id):
+            response_json = json.loads(response)
+            return self._save_response(conversation=conversation, prompt=prompt, prompt_num_tokens=prompt_num_tokens,
+                                       raw_text=response_json["choices"][0]["message"]["content"],
+                                       response_num_tokens=response_json.get("usage", {}).get("completion_tokens"))
+
+    async def stream_prompt_async(self, prompt: str, conversation_id: str = None,
+                                  trace_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Like stream_prompt(), but yields each chunk of response text to the event loop as it arrives.
+        """
+        with tracer.span("llm.build_request", trace_id):
+            body, conversation, prompt_num_tokens = self._build_body(prompt=prompt, conversation_id=conversation_id)
+            body["stream"] = True
+
+        text_chunks = []
+        # Only opening the stream is retried, since text that has already been yielded can't be taken back
+        with tracer.span("llm.network", trace_id):
+            response = await self.retry_policy.call_async(
+                lambda remaining_seconds: self.post_stream_async(body=body, headers=self._get_headers(), path=self.path,
+                                                                 remaining_seconds=remaining_seconds))
+        stream_start_epoch = time.time()
+        try:
+            events = iter_server_sent_events(response)
+            while True:
+                # Waiting for the next event happens on a worker thread
+                event_data = await asyncio.to_thread(next, events, None)
+                if event_data is None or event_data == "[DONE]":
+                    break
+                text_chunk = get_text_chunk_from_event(event_data)
+                if text_chunk:
+                    if not text_chunks:
+                        tracer.record("llm.first_chunk", trace_id, stream_start_epoch)
+                    text_chunks.append(text_chunk)
+                    yield text_chunk
+        finally:
+            response.close()
+        tracer.record("llm.stream", trace_id, stream_start_epoch, num_chunks=len(text_chunks))
+
+        with tracer.span("llm.parse", trace_id):
+            text = self._save_response(conversation=conversation, prompt=prompt, prompt_num_tokens=prompt_num_tokens,
+                                       raw_text="".join(text_chunks))
+        logger.info(f"Got streamed response: {text}")
@@ -0,0 +1,118 @@
+import io
+import wave
+import numpy as np
+from typing import Iterator
+
+# 8-bit PCM is unsigned, wider PCM is signed
+SAMPLE_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+class AudioBuffer:
+    """
+    Uncompressed PCM audio held in memory, along with its format.
+    """
+    def __init__(self, pcm: bytes, sample_width: int, channels: int, frame_rate: int):
+        """
+        :param pcm: The interleaved PCM samples
+        :param sample_width: Bytes per sample, e.g. 2 for 16-bit audio
+        :param channels: The number of channels
+        :param frame_rate: Frames per second
+        """
+        self.pcm = pcm
+        self.sample_width = sample_width
+        self.channels = channels
+        self.frame_rate = frame_rate
+
+    @property
+    def frame_size(self) -> int:
+        return self.sample_width * self.channels
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.pcm) // self.frame_size
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.num_frames / self.frame_rate
+
+    def iter_chunks(self, frames_per_chunk: int = 1024) -> Iterator[memoryview]:
+        """
+        Iterate over the audio in chunks, without copying it.
+        :param frames_per_chunk: The number of frames per chunk. The last chunk may be shorter.
+        :return: An iterator over views of the PCM data
+        """
+        view = memoryview(self.pcm)
+        chunk_size = frames_per_chunk * self.frame_size
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+
+    @classmethod
+    def from_wav_bytes(cls, wav_bytes: bytes) -> "AudioBuffer":
+        with wave.open(io.BytesIO(wav_bytes), 'rb') as wf:
+            return cls(pcm=wf.readframes(wf.getnframes()), sample_width=wf.getsampwidth(),
+                       channels=wf.getnchannels(), frame_rate=wf.getframerate())
+
+    def to_wav_bytes(self) -> bytes:
+        wav_file = io.BytesIO()
+        with wave.open(wav_file, 'wb') as wf:
+            wf.setsampwidth(self.sample_width)
+            wf.setnchannels(self.channels)
+            wf.setframerate(self.frame_rate)
+            wf.writeframes(self.pcm)
+        return wav_file.getvalue()
+
+    def has_format(self, sample_width: int, channels: int, frame_rate: int) -> bool:
+        return (self.sample_width, self.channels, self.frame_rate) == (sample_width, channels, frame_rate)
+
+    def to_float_samples(self) -> np.ndarray:
+        """
+        :return: The samples scaled to [-1, 1), with shape (num_frames, channels)
+        """
+        if self.sample_width not in SAMPLE_DTYPES:
+            raise ValueError(f"Unsupported sample width: {self.sample_width}")
+        samples = np.frombuffer(self.pcm, dtype=SAMPLE_DTYPES[self.sample_width], count=self.num_frames * self.channels)
+        samples = samples.astype(np.float64)
+        if self.sample_width == 1:
+            samples -= 128
+        samples /= 2 ** (8 * self.sample_width - 1)
+        return samples.reshape(-1, self.channels)
+
+    @classmethod
+    def from_float_samples(cls, samples: np.ndarray, sample_width: int, frame_rate: int) -> "AudioBuffer":
+        """
+        :param samples: Samples scaled to [-1, 1), with shape (num_frames, channels)
+        """
+        if sample_width not in SAMPLE_DTYPES:
+            raise ValueError(f"Unsupported sample width: {sample_width}")
+        scale = 2 ** (8 * sample_width - 1)
+        scaled_samples = np.clip(np.round(samples * scale), -scale, scale - 1)
+        if sample_width == 1:
+            scaled_samples += 128
+        pcm = scaled_samples.astype(SAMPLE_DTYPES[sample_width]).tobytes()
+        return cls(pcm=pcm, sample_width=sample_width, channels=samples.shape[1], frame_rate=frame_rate)
+
+    def convert(self, sample_width: int, channels: int, frame_rate: int) -> "AudioBuffer":
+        """
+        Convert the audio to another format, e.g. to play it on a stream that's already open in that format.
+        Channels are mixed down or duplicated, and the audio is resampled with linear interpolation.
+        :return: The converted audio, or this buffer if it's already in the format
+        """
+        if self.has_format(sample_width, channels, frame_rate):
+            return self
+        samples = self.to_float_samples()
+
+        if channels != self.channels:
+            mono_samples = samples.mean(axis=1, keepdims=True)
+            samples = np.repeat(mono_samples, channels, axis=1)
+
+        if frame_rate != self.frame_rate and len(samples) > 0:
+            num_frames = max(1, round(len(samples) * frame_rate / self.frame_rate))
+            source_times = np.arange(len(samples)) / self.frame_rate
+            target_times = np.arange(num_frames) / frame_rate
+            samples = np.column_stack([np.interp(target_times, source_times, samples[:, channel])
+                                       for channel in range(channels)])
+
+        return AudioBuffer.from_float_samples(samples, sample_width=sample_width, frame_rate=frame_rate)
+
+    def __len__(self):
+        return len(self.pcm)
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from modules.AudioBuffer import AudioBuffer
+from modules.helpers.logging_helper import logger
+
+
+class AudioCache:
+    """
+    A content-addressed cache of synthesized speech, keyed by the text and the voice settings it was rendered with.
+    Recently used audio is kept in memory within a byte budget, evicting the least recently used audio first.
+    Optionally, rendered audio is also saved to a directory, which outlives the process. The directory has its own byte
+    budget, and files are evicted least recently used first, by modification time, which is updated when a file is read.
+    """
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, directory: Optional[str] = None,
+                 max_disk_bytes: int = 256 * 1024 * 1024):
+        """
+        :param max_bytes: The budget for audio kept in memory.
+        :param directory: Optional. A directory to also save rendered audio to, as .wav files.
+        :param max_disk_bytes: The budget for audio saved to the directory.
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.num_bytes = 0
+        # The sizes of the files in the directory, least recently used first
+        self.disk_entries = OrderedDict()
+        self.num_disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_disk_entries()
+
+    @staticmethod
+    def get_key(text: str, voice: Optional[str], rate: Optional[int], volume: Optional[float]) -> str:
+        return hashlib.sha256(json.dumps([text, voice, rate, volume]).encode("utf-8")).hexdigest()
+
+    def _get_filepath(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def _load_disk_entries(self):
+        files = []
+        for filename in os.listdir(self.directory):
+            key, extension = os.path.splitext(filename)
+            if extension == ".wav":
+                stat = os.stat(os.path.join(self.directory, filename))
+                files.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(files):
+            self.disk_entries[key] = size
+            self.num_disk_bytes += size
+        with self.lock:
+            self._evict_from_disk()
+
+    def get(self, key: str) -> Optional[AudioBuffer]:
+        """
+        :return: The cached audio, or None if it isn't cached
+        """
+        with self.lock:
+            audio_buffer = self.entries.get(key)
+            if audio_buffer is not None:
+                self.entries.move_to_end(key)
+                if key in self.disk_entries:
+                    self.disk_entries.move_to_end(key)
+                self.hits += 1
+                return audio_buffer
+
+        if self.directory is not None and os.path.exists(self._get_filepath(key)):
+            try:
+                with open(self._get_filepath(key), 'rb') as f:
+                    audio_buffer = AudioBuffer.from_wav_bytes(f.read())
+                # Mark the file as recently used, for eviction after a restart
+                os.utime(self._get_filepath(key))
+            except FileNotFoundError:
+                # Evicted meanwhile
+                audio_buffer = None
+            if audio_buffer is not None:
+                with self.lock:
+                    self.hits += 1
+                    if key in self.disk_entries:
+                        self.disk_entries.move_to_end(key)
+                    self._put_in_memory(key, audio_buffer)
+                return audio_buffer
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, audio_buffer: AudioBuffer):
+        with self.lock:
+            self._put_in_memory(key, audio_buffer)
+        if self.directory is not None:
+            wav_bytes = audio_buffer.to_wav_bytes()
+            if len(wav_bytes) > self.max_disk_bytes:
+                return
+            # Write to a temporary file first, so a reader never sees a partially written file, and a leftover one
+            # is never loaded as a cache entry
+            fd, temp_filepath = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(wav_bytes)
+            os.replace(temp_filepath, self._get_filepath(key))
+            with self.lock:
+                self.num_disk_bytes += len(wav_bytes) - self.disk_entries.pop(key, 0)
+                self.disk_entries[key] = len(wav_bytes)
+                self._evict_from_disk()
+
+    def _put_in_memory(self, key: str, audio_buffer: AudioBuffer):
+        if len(audio_buffer) > self.max_bytes:
+            return
+        previous_audio_buffer = self.entries.pop(key, None)
+        if previous_audio_buffer is not None:
+            self.num_bytes -= len(previous_audio_buffer)
+        self.entries[key] = audio_buffer
+        self.num_bytes += len(audio_buffer)
+        while self.num_bytes > self.max_bytes:
+            _, evicted_audio_buffer = self.entries.popitem(last=False)
+            self.num_bytes -= len(evicted_audio_buffer)
+            logger.debug(f"Evicted {len(evicted_audio_buffer)} bytes of audio from the cache")
+
+    def _evict_from_disk(self):
+        while self.num_disk_bytes > self.max_disk_bytes:
+            key, size = self.disk_entries.popitem(last=False)
+            self.num_disk_bytes -= size
+            try:
+                os.remove(self._get_filepath(key))
+            except FileNotFoundError:
+                pass
+            logger.debug(f"Evicted {size} bytes of audio from the cache directory")
@@ -0,0 +1,113 @@
+import queue
+import threading
+from concurrent.futures import CancelledError, Future
+from typing import Callable, Dict, Optional
+from modules.AudioBuffer import AudioBuffer
+from modules.AudioDevice import AudioDevice
+from modules.PyAudioWrapper import PyAudioWrapper
+from modules.helpers.logging_helper import logger
+
+
+class AudioPlayer:
+    """
+    Plays audio buffers on output devices through long-lived PyAudio streams.
+    PortAudio is initialized once (by the PyAudioWrapper) and each device's stream is opened on first use,
+    then kept open between utterances. Audio in another format than the device's open stream is converted.
+    Queued buffers are played back-to-back by a worker thread, so consecutive sentences play without gaps.
+    """
+    FRAMES_PER_CHUNK = 1024
+
+    def __init__(self, py_audio_wrapper: PyAudioWrapper):
+        self.py_audio_wrapper = py_audio_wrapper
+        # Open streams keyed by device index, along with the format each was opened with
+        self.streams = {}
+        self.stream_formats: Dict[int, tuple] = {}
+        self.playback_queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._play_queued, daemon=True)
+            self.thread.start()
+            logger.info(f"Started audio player thread")
+
+    def enqueue(self, audio_buffer: AudioBuffer, audio_device: AudioDevice,
+                cancel_event: Optional[threading.Event] = None, on_start: Optional[Callable[[], None]] = None) -> Future:
+        """
+        Queue audio to be played after the audio already queued.
+        :param cancel_event: Optional. Setting this event stops the audio, even if it's already playing.
+        :param on_start: Optional. Called on the player's thread right before the audio starts playing.
+        :return: A future that completes once the audio has finished playing, or is cancelled if it was stopped
+        """
+        self.start()
+        future = Future()
+        self.playback_queue.put((audio_buffer, audio_device, future, cancel_event, on_start))
+        return future
+
+    def play(self, audio_buffer: AudioBuffer, audio_device: AudioDevice):
+        """
+        Play audio after the audio already queued, and wait for it to finish.
+        """
+        self.enqueue(audio_buffer, audio_device).result()
+
+    def _play_queued(self):
+        while True:
+            audio_buffer, audio_device, future, cancel_event, on_start = self.playback_queue.get()
+            if cancel_event is not None and cancel_event.is_set():
+                future.cancel()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if on_start is not None:
+                    on_start()
+                if self._write(audio_buffer, audio_device, cancel_event):
+                    future.set_result(None)
+                else:
+                    future.set_exception(CancelledError())
+            except Exception as e:
+                logger.error(f"Error playing audio on {audio_device}: {e}")
+                future.set_exception(e)
+
+    def _get_stream(self, audio_device: AudioDevice, audio_buffer: AudioBuffer):
+        """
+        Get the device's open stream, opening it in the buffer's format if there isn't one yet.
+        """
+        with self.lock:
+            stream = self.streams.get(audio_device.device_index)
+            if stream is None:
+                audio = self.py_audio_wrapper.audio
+                stream = audio.open(format=audio.get_format_from_width(audio_buffer.sample_width),
+                                    channels=audio_buffer.channels,
+                                    rate=audio_buffer.frame_rate,
+                                    output=True,
+                                    output_device_index=audio_device.device_index)
+                self.streams[audio_device.device_index] = stream
+                self.stream_formats[audio_device.device_index] = (audio_buffer.sample_width, audio_buffer.channels,
+                                                                  audio_buffer.frame_rate)
+                logger.info(f"Opened output stream on {audio_device}")
+            return stream, self.stream_formats[audio_device.device_index]
+
+    def _write(self, audio_buffer: AudioBuffer, audio_device: AudioDevice,
+               cancel_event: Optional[threading.Event] = None) -> bool:
+        """
+        :return: Whether the audio played to the end, i.e. wasn't stopped by the cancel event
+        """
+        stream, (sample_width, channels, frame_rate) = self._get_stream(audio_device, audio_buffer)
+        audio_buffer = audio_buffer.convert(sample_width=sample_width, channels=channels, frame_rate=frame_rate)
+        for chunk in audio_buffer.iter_chunks(frames_per_chunk=self.FRAMES_PER_CHUNK):
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            stream.write(chunk)
+        return True
+
+    def close(self):
+        """
+        Close all open streams. PortAudio itself belongs to the PyAudioWrapper and is left initialized.
+        """
+        with self.lock:
+            for stream in self.streams.values():
+                stream.stop_stream()
+                stream.close()
+            self.streams.clear()
+            self.stream_formats.clear()
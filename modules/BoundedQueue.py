@@ -0,0 +1,99 @@
+import queue
+import threading
+from collections import deque
+from typing import Any, Callable, List, Optional
+from modules.enums.OverflowPolicyEnum import OverflowPolicyEnum
+
+
+class BoundedQueue:
+    """
+    A thread-safe FIFO queue with a maximum size. What happens when an item is put into a full queue depends on the
+    overflow policy: the oldest item is dropped, the new item is dropped, or the producer blocks until there's room.
+    """
+    def __init__(self, maxsize: int, overflow_policy: OverflowPolicyEnum = OverflowPolicyEnum.DROP_OLDEST,
+                 on_drop: Optional[Callable[[Any], None]] = None):
+        """
+        :param maxsize: The maximum number of items in the queue.
+        :param overflow_policy: What to do when an item is put into a full queue.
+        :param on_drop: Optional. Called with every item dropped because the queue was full, whichever item that is,
+        so items holding resources can release them.
+        """
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, got {maxsize}")
+        self.maxsize = maxsize
+        self.overflow_policy = overflow_policy
+        self.items = deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.num_put = 0
+        self.num_dropped = 0
+        self.on_drop = on_drop
+
+    @property
+    def depth(self) -> int:
+        with self.lock:
+            return len(self.items)
+
+    def __len__(self) -> int:
+        return self.depth
+
+    def __bool__(self) -> bool:
+        return self.depth > 0
+
+    def put(self, item: Any, timeout: Optional[float] = None) -> bool:
+        """
+        Put an item at the end of the queue.
+        :param timeout: Optional. With the block policy, how long to wait for room before dropping the item.
+        If not specified, wait indefinitely.
+        :return: Whether the item was put into the queue, as opposed to dropped. Evicting the oldest item to make room
+        still counts as putting the item.
+        """
+        dropped_items = []
+        is_put = True
+        with self.lock:
+            if len(self.items) >= self.maxsize:
+                if self.overflow_policy == OverflowPolicyEnum.DROP_OLDEST:
+                    dropped_items.append(self.items.popleft())
+                    self.num_dropped += 1
+                elif self.overflow_policy == OverflowPolicyEnum.DROP_NEWEST or \
+                        not self.not_full.wait_for(lambda: len(self.items) < self.maxsize, timeout=timeout):
+                    dropped_items.append(item)
+                    self.num_dropped += 1
+                    is_put = False
+            if is_put:
+                self.items.append(item)
+                self.num_put += 1
+                self.not_empty.notify()
+        # Called outside the lock, so the callback can use the queue
+        if self.on_drop is not None:
+            for dropped_item in dropped_items:
+                self.on_drop(dropped_item)
+        return is_put
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        Remove and return the item at the front of the queue, waiting for one if the queue is empty.
+        :param timeout: Optional. How long to wait for an item. If not specified, wait indefinitely.
+        :raises queue.Empty: If no item arrived within the timeout.
+        """
+        with self.lock:
+            if not self.not_empty.wait_for(lambda: len(self.items) > 0, timeout=timeout):
+                raise queue.Empty
+            item = self.items.popleft()
+            self.not_full.notify()
+            return item
+
+    def get_nowait(self) -> Any:
+        return self.get(timeout=0)
+
+    def clear(self) -> List[Any]:
+        """
+        Remove all items from the queue.
+        :return: The removed items, oldest first.
+        """
+        with self.lock:
+            items = list(self.items)
+            self.items.clear()
+            self.not_full.notify_all()
+            return items
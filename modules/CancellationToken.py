@@ -0,0 +1,24 @@
+import threading
+from typing import Optional
+
+
+class CancellationToken:
+    """
+    Cancels an action, even once it's running. Running actions check their token between frames.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the token is cancelled, or the timeout passes.
+        :return: Whether the token is cancelled
+        """
+        return self.event.wait(timeout)
@@ -2,9 +2,11 @@ from abc import ABC, abstractmethod
 from modules.Actions import Actions
 from modules.helpers.logging_helper import logger
 from modules.SpeechToText import SpeechToText
-from modules.TextToSpeech import TextToSpeech
+from modules.TextToSpeechService import TextToSpeechService
 from modules.AudioDevice import AudioDevice
 from modules.enums.ActionEnum import ActionEnum
+from concurrent.futures import Future
+from typing import Optional
 from uuid import uuid4
 import time
 
@@ -50,19 +52,29 @@ class ConversingState(State):
     CONVERSATION_MAX_INACTIVITY_SECONDS = 60
     def __init__(self):
         self.latest_speech_start_epoch = 0
-        self.is_speaking = False
+        self.text_to_speech_service = None
         return
 
     @property
     def is_conversing(self):
         return True
 
-    def speak(self, text_to_speech: TextToSpeech, text: str, speaking_device: AudioDevice):
+    @property
+    def is_speaking(self):
+        return self.text_to_speech_service is not None and self.text_to_speech_service.is_speaking
+
+    def speak(self, text_to_speech_service: TextToSpeechService, text: str, speaking_device: AudioDevice,
+              trace_id: Optional[str] = None, block: bool = False) -> Future:
+        """
+        Queue text to be spoken, without waiting for it to be spoken.
+        :param trace_id: Optional. The trace of the turn the text is spoken in.
+        :param block: If True, wait for room in the text to speech service's queue instead of dropping the text.
+        :return: A future that completes once the text has been spoken.
+        """
         self.latest_speech_start_epoch = time.time()
-        self.is_speaking = True
-        text_to_speech.speak_on_device(text, speaking_device)
+        self.text_to_speech_service = text_to_speech_service
         logger.info(f"Speaking: {text}")
-        self.is_speaking = False
+        return text_to_speech_service.speak(text, speaking_device, trace_id=trace_id, block=block)
 
     def is_time_to_end_conversation(self):
         time_since_last_speech = time.time() - self.latest_speech_start_epoch
@@ -92,7 +104,7 @@ class PerformingActionState(State):
 class Character:
 
     def __init__(self, name: str, window_title: str,
-                 text_to_speech: TextToSpeech,
+                 text_to_speech_service: TextToSpeechService,
                  speech_to_text: SpeechToText,
                  speaking_device: AudioDevice,
                  listening_device: AudioDevice
@@ -100,7 +112,7 @@ class Character:
 
         self.speaking_device = speaking_device
         self.listening_device = listening_device
-        self.text_to_speech = text_to_speech
+        self.text_to_speech_service = text_to_speech_service
         self.speech_to_text = speech_to_text
         self.name = name.lower()
 
@@ -109,6 +121,8 @@ class Character:
         self.conversation_uuid = None
         self.consecutive_confused_responses = 0
         self.actions = Actions(window_title=window_title)
+        self.window_is_focused = self.actions.window_focus_tracker.is_focused
+        self.actions.window_focus_tracker.subscribe(self._on_window_focus_changed)
         self.actions.start()
         logger.info(f"Character '{self.name}' targeting window '{window_title}' initialized.")
         self.set_state(WanderingState())
@@ -121,9 +135,13 @@ class Character:
     def end_conversation(self):
         self.conversation_uuid = None
         self.consecutive_confused_responses = 0
-        self.text_to_speech.speak_on_device("Goodbye", self.speaking_device)
+        self.text_to_speech_service.speak("Goodbye", self.speaking_device)
         self.set_state(WanderingState())
 
+    def _on_window_focus_changed(self, window_is_focused: bool):
+        # Called on the window focus tracker's thread
+        self.window_is_focused = window_is_focused
+
     def set_state(self, state: State):
         self.previous_state = self.state
         self.state = state
@@ -132,7 +150,7 @@ class Character:
     def update(self):
         self.state.execute()
 
-        if self.state.is_wandering and self.state.is_time_to_act() and self.actions.window_is_focused and not self.actions.action_is_ongoing:
+        if self.state.is_wandering and self.state.is_time_to_act() and self.window_is_focused and not self.actions.action_is_ongoing:
             logger.info(f"Character '{self.name}' is wandering and it's time to act.")
             self.actions.enqueue_random_action()
             self.state.update_latest_action_epoch()
@@ -1,5 +1,6 @@
 import configparser
 import os
+from modules.enums.OverflowPolicyEnum import OverflowPolicyEnum
 
 class Config:
     def __init__(self, config_file_path: str):
@@ -18,9 +19,51 @@ class Config:
         self.max_response_tokens = int(self.config['openai_api_client']['max_response_tokens'])
         self.max_dialogues_per_conversation = int(self.config['openai_api_client']['max_dialogues_per_conversation'])
         self.conversation_prune_after_seconds = int(self.config['openai_api_client']['conversation_prune_after_seconds'])
+        max_retained_conversation_tokens = self.config['openai_api_client'].get('max_retained_conversation_tokens', '')
+        self.max_retained_conversation_tokens = int(max_retained_conversation_tokens) if len(max_retained_conversation_tokens) > 0 else None
         self.temperature = float(self.config['openai_api_client']['temperature'])
+        self.pool_size = self.config['openai_api_client'].getint('pool_size', fallback=4)
+        self.connect_timeout = self.config['openai_api_client'].getfloat('connect_timeout', fallback=5.0)
+        self.read_timeout = self.config['openai_api_client'].getfloat('read_timeout', fallback=60.0)
+        self.pre_connect = self.config['openai_api_client'].getboolean('pre_connect', fallback=False)
+        self.max_attempts = self.config['openai_api_client'].getint('max_attempts', fallback=5)
+        self.request_deadline_seconds = self.config['openai_api_client'].getfloat('request_deadline_seconds', fallback=60.0)
+        self.stream = self.config['openai_api_client'].getboolean('stream', fallback=False)
         self.max_prompt_chars = int(self.config['openai_api_client']['max_prompt_chars'])
         self.system_message = self.config['openai_api_client']['system_message'] if len(self.config['openai_api_client']['system_message']) > 0 else None
         self.forced_system_message = self.config['openai_api_client']['forced_system_message'] if len(self.config['openai_api_client']['forced_system_message']) > 0 else None
         if self.system_message and self.forced_system_message:
-            raise Exception("Cannot have both system_message and forced_system_message set in config.ini")
\ No newline at end of file
+            raise Exception("Cannot have both system_message and forced_system_message set in config.ini")
+
+        # Optional, so config files without a text_to_speech section still work
+        self.audio_cache_max_megabytes = self.config.getfloat('text_to_speech', 'audio_cache_max_megabytes', fallback=32.0)
+        audio_cache_directory = self.config.get('text_to_speech', 'audio_cache_directory', fallback='')
+        self.audio_cache_directory = audio_cache_directory if len(audio_cache_directory) > 0 else None
+        self.audio_cache_max_disk_megabytes = self.config.getfloat('text_to_speech', 'audio_cache_max_disk_megabytes', fallback=256.0)
+        prerendered_phrases = self.config.get('text_to_speech', 'prerendered_phrases', fallback='')
+        self.prerendered_phrases = [phrase.strip() for phrase in prerendered_phrases.splitlines() if len(phrase.strip()) > 0]
+
+        # Optional, so config files without a speech_to_text section still work
+        self.max_buffered_audio_chunks = self.config.getint('speech_to_text', 'max_buffered_audio_chunks', fallback=32)
+        self.buffer_overflow_policy = OverflowPolicyEnum(self.config.get('speech_to_text', 'buffer_overflow_policy', fallback='drop_oldest'))
+        self.max_transcriptions = self.config.getint('speech_to_text', 'max_transcriptions', fallback=16)
+        self.transcription_overflow_policy = OverflowPolicyEnum(self.config.get('speech_to_text', 'transcription_overflow_policy', fallback='drop_oldest'))
+        self.num_transcription_workers = self.config.getint('speech_to_text', 'num_transcription_workers', fallback=1)
+        self.use_worker_processes = self.config.getboolean('speech_to_text', 'use_worker_processes', fallback=False)
+        max_transcription_age_seconds = self.config.get('speech_to_text', 'max_transcription_age_seconds', fallback='10')
+        self.max_transcription_age_seconds = float(max_transcription_age_seconds) if len(max_transcription_age_seconds) > 0 else None
+        self.use_keyword_spotter = self.config.getboolean('speech_to_text', 'use_keyword_spotter', fallback=False)
+        self.use_voice_activity_detector = self.config.getboolean('speech_to_text', 'use_voice_activity_detector', fallback=False)
+        self.vad_hangover_ms = self.config.getint('speech_to_text', 'vad_hangover_ms', fallback=300)
+        self.vad_min_segment_ms = self.config.getint('speech_to_text', 'vad_min_segment_ms', fallback=250)
+        self.vad_max_segment_ms = self.config.getint('speech_to_text', 'vad_max_segment_ms', fallback=10000)
+        self.speculative_transcription = self.config.getboolean('speech_to_text', 'speculative_transcription', fallback=False)
+        sphinx_timeout_seconds = self.config.get('speech_to_text', 'sphinx_timeout_seconds', fallback='')
+        self.sphinx_timeout_seconds = float(sphinx_timeout_seconds) if len(sphinx_timeout_seconds) > 0 else None
+        self.google_timeout_seconds = self.config.getfloat('speech_to_text', 'google_timeout_seconds', fallback=10.0)
+
+        # Optional, so config files without a tracing section still work
+        self.tracing_enabled = self.config.getboolean('tracing', 'enabled', fallback=False)
+        self.tracing_ring_buffer_size = self.config.getint('tracing', 'ring_buffer_size', fallback=4096)
+        tracing_jsonl_path = self.config.get('tracing', 'jsonl_path', fallback='')
+        self.tracing_jsonl_path = tracing_jsonl_path if len(tracing_jsonl_path) > 0 else None
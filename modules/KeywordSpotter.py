@@ -0,0 +1,87 @@
+import speech_recognition as sr
+from typing import Optional, Tuple
+from modules.engines.SphinxEngine import activate_keyword_search, create_decoder
+from modules.helpers.logging_helper import logger
+
+
+class KeywordDetection:
+    def __init__(self, keyword: str, offset_seconds: float):
+        """
+        :param keyword: The keyword that was spotted.
+        :param offset_seconds: Where the keyword starts, from the start of the utterance.
+        """
+        self.keyword = keyword
+        self.offset_seconds = offset_seconds
+
+    def __repr__(self):
+        return f"KeywordDetection(keyword={self.keyword!r}, offset_seconds={self.offset_seconds:.2f})"
+
+
+class KeywordSpotter:
+    """
+    Spots keywords in audio as it's captured, using a persistent pocketsphinx decoder in keyword search mode.
+    Keyword search only scores the keyphrases, so it's much cheaper than a full decode with the language model,
+    and the decoder's models are loaded once instead of for every utterance.
+    Not thread-safe: use one spotter per capture thread.
+    """
+    # The sample rate and width the included acoustic model expects
+    SAMPLE_RATE = 16000
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, keyword_entries: list[Tuple[str, float]]):
+        """
+        :param keyword_entries: (keyword, sensitivity) pairs, with sensitivities from 0 to 1, like the keyword_entries
+        of recognize_sphinx. Higher sensitivities produce more detections, and more false alarms.
+        """
+        self.keyword_entries = keyword_entries
+        # Keyword search doesn't need the language model
+        self.decoder = create_decoder(use_language_model=False)
+        self.frames_per_second = self.decoder.config["frate"]
+        activate_keyword_search(self.decoder, keyword_entries)
+
+        self.is_in_utterance = False
+        self.num_samples_processed = 0
+        logger.info(f"Keyword spotter listening for: {[keyword for keyword, _ in keyword_entries]}")
+
+    def start_utterance(self):
+        if self.is_in_utterance:
+            self.end_utterance()
+        self.decoder.start_utt()
+        self.is_in_utterance = True
+        self.num_samples_processed = 0
+
+    def end_utterance(self):
+        if self.is_in_utterance:
+            self.decoder.end_utt()
+            self.is_in_utterance = False
+
+    def process(self, audio_data: sr.AudioData) -> Optional[KeywordDetection]:
+        """
+        Feed the next frames of the current utterance to the decoder.
+        :return: The keyword detection, if a keyword has been spotted in the utterance so far.
+        """
+        if not self.is_in_utterance:
+            self.start_utterance()
+        raw_data = audio_data.get_raw_data(convert_rate=self.SAMPLE_RATE, convert_width=self.SAMPLE_WIDTH)
+        self.decoder.process_raw(raw_data, False, False)
+        self.num_samples_processed += len(raw_data) // self.SAMPLE_WIDTH
+
+        hypothesis = self.decoder.hyp()
+        if hypothesis is None:
+            return None
+        segments = [segment for segment in self.decoder.seg() if segment.word.strip() == hypothesis.hypstr.strip()]
+        if segments:
+            offset_seconds = segments[0].start_frame / self.frames_per_second
+        else:
+            offset_seconds = self.num_samples_processed / self.SAMPLE_RATE
+        return KeywordDetection(keyword=hypothesis.hypstr.strip(), offset_seconds=offset_seconds)
+
+    def spot(self, audio_data: sr.AudioData) -> Optional[KeywordDetection]:
+        """
+        Spot a keyword in a whole utterance.
+        """
+        self.start_utterance()
+        try:
+            return self.process(audio_data)
+        finally:
+            self.end_utterance()
@@ -0,0 +1,83 @@
+import math
+import time
+from typing import Callable, List, Optional, Tuple
+
+
+class MotionEngine:
+    """
+    Moves the mouse by a relative distance over a requested duration.
+    Instead of one input and one sleep per pixel, the distance due by each frame is computed from a monotonic clock,
+    and sent as a batch of small relative moves in a single call. Frames that run late just send a larger batch, so
+    the motion keeps the requested duration however coarse the sleep granularity is.
+    """
+    FRAME_SECONDS = 1 / 120
+    MAX_PIXELS_PER_MOVE = 10
+
+    def __init__(self, send_mouse_moves: Callable[[List[Tuple[int, int]]], None],
+                 frame_seconds: float = FRAME_SECONDS, max_pixels_per_move: int = MAX_PIXELS_PER_MOVE,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        :param send_mouse_moves: Sends a batch of relative (dx, dy) mouse moves at once.
+        :param frame_seconds: The interval between batches.
+        :param max_pixels_per_move: A frame's distance is split into moves of at most this many pixels along each
+        axis, since games can treat large relative jumps differently than a stream of small ones.
+        :param clock: A monotonic clock, in seconds.
+        :param sleep: Sleeps for the given number of seconds.
+        """
+        if frame_seconds <= 0:
+            raise ValueError("frame_seconds must be greater than 0.")
+        if max_pixels_per_move < 1:
+            raise ValueError("max_pixels_per_move must be at least 1.")
+        self.send_mouse_moves = send_mouse_moves
+        self.frame_seconds = frame_seconds
+        self.max_pixels_per_move = max_pixels_per_move
+        self.clock = clock
+        self.sleep = sleep
+
+    def split(self, dx: int, dy: int) -> List[Tuple[int, int]]:
+        """
+        Split a relative move into moves of at most max_pixels_per_move along each axis, that add up to it.
+        """
+        num_moves = max(1, math.ceil(max(abs(dx), abs(dy)) / self.max_pixels_per_move))
+        moves = []
+        sent_x, sent_y = 0, 0
+        for index in range(1, num_moves + 1):
+            target_x, target_y = dx * index // num_moves, dy * index // num_moves
+            moves.append((target_x - sent_x, target_y - sent_y))
+            sent_x, sent_y = target_x, target_y
+        return moves
+
+    def move(self, dx: int, dy: int, duration: float, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Move the mouse by (dx, dy) pixels, spread evenly over duration seconds.
+        :param should_stop: Optional. Checked between frames, and the motion stops early if it returns True.
+        :return: Whether the motion completed, as opposed to being stopped early
+        """
+        if duration <= 0:
+            raise ValueError("Invalid duration value. Must be greater than 0.")
+        start = self.clock()
+        sent_x, sent_y = 0, 0
+        is_last_frame = False
+        while True:
+            if should_stop is not None and should_stop():
+                return False
+            progress = 1.0 if is_last_frame else min(1.0, (self.clock() - start) / duration)
+            # Round the target position rather than each step, so rounding errors never accumulate
+            target_x, target_y = round(dx * progress), round(dy * progress)
+            if (target_x, target_y) != (sent_x, sent_y):
+                self.send_mouse_moves(self.split(target_x - sent_x, target_y - sent_y))
+                sent_x, sent_y = target_x, target_y
+            if progress >= 1.0:
+                return True
+            # Sleep until the next frame boundary, so time spent sending doesn't make the motion drift
+            elapsed = self.clock() - start
+            next_frame = (math.floor(elapsed / self.frame_seconds) + 1) * self.frame_seconds
+            if next_frame <= elapsed:
+                # Rounding put the boundary at the current time
+                next_frame += self.frame_seconds
+            if next_frame >= duration:
+                next_frame = duration
+                is_last_frame = True
+            delay = next_frame - elapsed
+            if delay > 0:
+                self.sleep(delay)
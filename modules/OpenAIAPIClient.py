@@ -1,35 +1,158 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import time
+import threading
 import tiktoken
+from collections import deque, OrderedDict
+from typing import Callable, Iterator, List, Optional, Tuple
 from modules.helpers.logging_helper import logger
+from modules.helpers.tracing_helper import tracer
+from modules.RetryPolicy import APIError, RetryPolicy, parse_retry_after
+
+# Every chat message is wrapped as <|start|>{role}\n{content}<|end|>\n, and every reply is primed with <|start|>assistant<|message|>
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+TOKENS_PER_REPLY = 3
+
+# Process-wide tokenizer registry, so each model's encoding is looked up (and its BPE file loaded) only once
+_encodings = {}
+_encodings_lock = threading.Lock()
+# Overhead tokens of a message with empty content, keyed by (role, model)
+_message_overhead_tokens = {}
+
+
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """
+    Get the tokenizer for a model, loading it on first use and caching it for the life of the process.
+    :param model: The model name, e.g. gpt-3.5-turbo
+    :return: The tiktoken encoding for the model
+    """
+    encoding = _encodings.get(model)
+    if encoding is None:
+        with _encodings_lock:
+            encoding = _encodings.get(model)
+            if encoding is None:
+                encoding = tiktoken.encoding_for_model(model)
+                _encodings[model] = encoding
+    return encoding
+
 
 def get_num_tokens_from_string(string: str, encoding_name: str) -> int:
-    encoding = tiktoken.encoding_for_model(encoding_name)
+    encoding = get_encoding(encoding_name)
     num_tokens = len(encoding.encode(string))
     return num_tokens
 
+
+def get_num_tokens_per_message(messages: List[dict], model: str) -> List[int]:
+    """
+    Count the tokens each message occupies in a chat completions request, including the per-message overhead.
+    All message values are encoded in a single batched call.
+    :param messages: Messages in the API format, e.g. [{"role": "user", "content": "hi"}]
+    :param model: The model name
+    :return: The number of tokens of each message, in the same order as the messages
+    """
+    values = []
+    for message in messages:
+        values.extend(message.values())
+    encoded_values = get_encoding(model).encode_batch(values)
+
+    num_tokens_per_message = []
+    value_index = 0
+    for message in messages:
+        num_tokens = TOKENS_PER_MESSAGE
+        for key in message:
+            num_tokens += len(encoded_values[value_index])
+            if key == "name":
+                num_tokens += TOKENS_PER_NAME
+            value_index += 1
+        num_tokens_per_message.append(num_tokens)
+    return num_tokens_per_message
+
+
+def get_num_tokens_from_messages(messages: List[dict], model: str) -> int:
+    """
+    Count the tokens of a whole chat completions request, including the tokens that prime the reply.
+    :param messages: Messages in the API format
+    :param model: The model name
+    :return: The number of prompt tokens the request will use
+    """
+    return sum(get_num_tokens_per_message(messages, model)) + TOKENS_PER_REPLY
+
+
+def get_num_message_overhead_tokens(role: str, model: str) -> int:
+    """
+    Get the tokens a message with the given role occupies in a request, excluding its content.
+    """
+    overhead_tokens = _message_overhead_tokens.get((role, model))
+    if overhead_tokens is None:
+        overhead_tokens = get_num_tokens_per_message([{"role": role, "content": ""}], model)[0]
+        _message_overhead_tokens[(role, model)] = overhead_tokens
+    return overhead_tokens
+
+
 class Dialogue:
-    def __init__(self, prompt: str, response: str, model: str):
+    def __init__(self, prompt: str, response: str, model: str,
+                 prompt_num_tokens: Optional[int] = None, response_num_tokens: Optional[int] = None):
+        """
+        :param prompt_num_tokens: Optional. Pass the token count of the prompt if it's already known, to avoid re-encoding it.
+        :param response_num_tokens: Optional. Pass the token count of the response if it's already known, to avoid re-encoding it.
+        """
         self.prompt = prompt
         self.response = response
-        self.prompt_num_tokens = get_num_tokens_from_string(prompt, model)
-        self.response_num_tokens = get_num_tokens_from_string(response, model)
+        if prompt_num_tokens is None:
+            prompt_num_tokens = get_num_tokens_from_string(prompt, model)
+        if response_num_tokens is None:
+            response_num_tokens = get_num_tokens_from_string(response, model)
+        self.prompt_num_tokens = prompt_num_tokens
+        self.response_num_tokens = response_num_tokens
         self.total_num_tokens = self.prompt_num_tokens + self.response_num_tokens
+        # The tokens this dialogue occupies when sent as a user message and an assistant message
+        self.num_message_tokens = (self.total_num_tokens
+                                   + get_num_message_overhead_tokens("user", model)
+                                   + get_num_message_overhead_tokens("assistant", model))
 
 
 class Conversation:
-    def __init__(self, max_length: int, model: str):
+    def __init__(self, max_length: int, model: str, on_tokens_changed: Optional[Callable[[int], None]] = None):
+        """
+        :param on_tokens_changed: Optional. Called with the change in message tokens whenever a dialogue is added or evicted.
+        """
         self.max_length = max_length
         self.update_epoch = time.time()
-        self.dialogues = []
+        self.dialogues = deque()
         self.model = model
+        self.on_tokens_changed = on_tokens_changed
+        # Running totals, kept in step with every add and eviction so they never have to be recomputed
+        self.total_tokens = 0
+        self.total_message_tokens = 0
 
-    def add(self, prompt: str, response: str):
-        dialogue = Dialogue(prompt, response, self.model)
+    def add(self, prompt: str, response: str, prompt_num_tokens: Optional[int] = None,
+            response_num_tokens: Optional[int] = None):
+        dialogue = Dialogue(prompt, response, self.model,
+                            prompt_num_tokens=prompt_num_tokens, response_num_tokens=response_num_tokens)
         if len(self.dialogues) == self.max_length:
-            self.dialogues.pop(0)
+            self.evict_oldest()
         self.dialogues.append(dialogue)
+        self.total_tokens += dialogue.total_num_tokens
+        self.total_message_tokens += dialogue.num_message_tokens
+        self.update_epoch = time.time()
+        if self.on_tokens_changed is not None:
+            self.on_tokens_changed(dialogue.num_message_tokens)
+
+    def evict_oldest(self) -> Dialogue:
+        """
+        Remove the oldest dialogue from the conversation.
+        :return: The removed dialogue
+        """
+        dialogue = self.dialogues.popleft()
+        self.total_tokens -= dialogue.total_num_tokens
+        self.total_message_tokens -= dialogue.num_message_tokens
+        if self.on_tokens_changed is not None:
+            self.on_tokens_changed(-dialogue.num_message_tokens)
+        return dialogue
+
+    def touch(self):
         self.update_epoch = time.time()
 
     def get_messages_for_api(self):
@@ -40,30 +163,100 @@ class Conversation:
         return messages
 
     def get_total_tokens(self):
-        return sum([dialogue.total_num_tokens for dialogue in self.dialogues])
+        return self.total_tokens
+
+    def get_total_message_tokens(self):
+        """
+        :return: The tokens the saved dialogues occupy in a request, including the per-message overhead.
+        """
+        return self.total_message_tokens
 
     def trim(self, prompt_tokens: int, token_limit: int):
         # Remove dialogues until the total number of the prompt and saved dialogues is less than the token limit
-        while len(self.dialogues) > 0 and self.get_total_tokens() + prompt_tokens >= token_limit:
-            self.dialogues.pop(0)
+        while len(self.dialogues) > 0 and self.total_message_tokens + prompt_tokens >= token_limit:
+            self.evict_oldest()
 
 
 class ConversationContainer:
-    def __init__(self, conversation_prune_after_seconds: int, max_dialogues_per_conversation: int, model: str):
+    def __init__(self, conversation_prune_after_seconds: int, max_dialogues_per_conversation: int, model: str,
+                 max_retained_tokens: Optional[int] = None):
+        """
+        :param conversation_prune_after_seconds: Conversations idle for longer than this are removed.
+        :param max_retained_tokens: Optional. A cap on the message tokens retained across all conversations.
+        When exceeded, the least recently used conversations are evicted.
+        """
         self.conversation_prune_after_seconds = conversation_prune_after_seconds
         self.max_dialogues_per_conversation = max_dialogues_per_conversation
-        self.prompt_histories = {}
+        self.max_retained_tokens = max_retained_tokens
+        # Ordered from least to most recently fetched, so LRU conversations are at the front
+        self.prompt_histories = OrderedDict()
         self.model = model
+        self.total_tokens = 0
+        self.num_pruned_conversations = 0
+        self.num_evicted_conversations = 0
+
+    @property
+    def num_live_conversations(self) -> int:
+        return len(self.prompt_histories)
 
     def get_conversation(self, conversation_id: str) -> Conversation:
+        self.prune()
         if conversation_id not in self.prompt_histories:
-            self.prompt_histories[conversation_id] = Conversation(max_length=self.max_dialogues_per_conversation, model=self.model)
-        return self.prompt_histories[conversation_id]
+            self.prompt_histories[conversation_id] = Conversation(max_length=self.max_dialogues_per_conversation,
+                                                                  model=self.model,
+                                                                  on_tokens_changed=self._on_tokens_changed)
+        else:
+            self.prompt_histories.move_to_end(conversation_id)
+        conversation = self.prompt_histories[conversation_id]
+        conversation.touch()
+        return conversation
+
+    def prune(self):
+        """
+        Remove conversations that have been idle for longer than conversation_prune_after_seconds.
+        A conversation is idle while it's neither fetched nor added to. Adding a dialogue doesn't move a conversation in
+        the least recently used order, so every conversation's update_epoch is checked instead of only the front.
+        """
+        prune_before_epoch = time.time() - self.conversation_prune_after_seconds
+        expired_conversation_ids = [conversation_id for conversation_id, conversation in self.prompt_histories.items()
+                                    if conversation.update_epoch <= prune_before_epoch]
+        for conversation_id in expired_conversation_ids:
+            self._remove(conversation_id)
+            self.num_pruned_conversations += 1
+            logger.info(f"Pruned idle conversation {conversation_id}. Live conversations: {self.num_live_conversations}")
+
+    def _on_tokens_changed(self, num_tokens: int):
+        self.total_tokens += num_tokens
+        if self.max_retained_tokens is None:
+            return
+        # Evict the least recently used conversations, but never the most recently used one
+        while self.total_tokens > self.max_retained_tokens and len(self.prompt_histories) > 1:
+            conversation_id = next(iter(self.prompt_histories))
+            self._remove(conversation_id)
+            self.num_evicted_conversations += 1
+            logger.info(f"Evicted conversation {conversation_id} to stay under {self.max_retained_tokens} retained tokens. "
+                        f"Live conversations: {self.num_live_conversations}")
+
+    def _remove(self, conversation_id: str):
+        conversation = self.prompt_histories.pop(conversation_id)
+        conversation.on_tokens_changed = None
+        self.total_tokens -= conversation.get_total_message_tokens()
+
 
 class APIClient:
     def __init__(self, base_url: str, path: str, api_key: str, model: str, max_conversation_tokens: int,
                  max_response_tokens: int, max_dialogues_per_conversation: int, conversation_prune_after_seconds: int,
-                 temperature: float, system_message: str = None, forced_system_message: str = None):
+                 temperature: float, system_message: str = None, forced_system_message: str = None,
+                 max_retained_conversation_tokens: Optional[int] = None, pool_size: int = 4,
+                 connect_timeout: float = 5.0, read_timeout: float = 60.0, pre_connect: bool = False,
+                 retry_policy: Optional[RetryPolicy] = None):
+        """
+        :param pool_size: The number of keep-alive connections to keep open to the API.
+        :param connect_timeout: Seconds to wait for a connection to the API to be established.
+        :param read_timeout: Seconds to wait between bytes of the API's response.
+        :param pre_connect: Optional. If True, open a connection to the API right away so the first prompt doesn't pay for the TCP+TLS handshake.
+        :param retry_policy: Optional. How failed requests are retried. Defaults to RetryPolicy().
+        """
         self.base_url = base_url
         self.path = path
         self.api_key = api_key
@@ -73,38 +266,83 @@ class APIClient:
         self.temperature = temperature
         self.system_message = system_message
         self.forced_system_message = forced_system_message
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
         self.prompt_histories = ConversationContainer(conversation_prune_after_seconds=conversation_prune_after_seconds,
                                                       max_dialogues_per_conversation=max_dialogues_per_conversation,
-                                                      model=model)
+                                                      model=model,
+                                                      max_retained_tokens=max_retained_conversation_tokens)
+        # Warm the tokenizer registry so the first prompt doesn't pay for loading the encoding
+        get_encoding(self.model)
+        get_num_message_overhead_tokens("user", self.model)
+        get_num_message_overhead_tokens("assistant", self.model)
+
+        # A persistent session reuses keep-alive connections, instead of a new TCP+TLS handshake for every prompt
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if pre_connect:
+            self.warm_up()
 
-    def send_prompt(self, prompt: str, conversation_id: str = None) -> str:
-        headers = {
+    def warm_up(self):
+        """
+        Open a connection to the API ahead of the first prompt. Failures are logged, not raised,
+        since the connection will simply be opened by the first prompt instead.
+        """
+        try:
+            start = time.time()
+            self.session.head(self.base_url, timeout=(self.connect_timeout, self.read_timeout))
+            logger.info(f"Connected to {self.base_url} in {time.time() - start:.3f} seconds")
+        except requests.RequestException as e:
+            logger.warning(f"Could not pre-connect to {self.base_url}: {e}")
+
+    def close(self):
+        self.session.close()
+
+    def _get_headers(self) -> dict:
+        return {
             'Authorization': 'Bearer ' + self.api_key,
             'Content-Type': 'application/json',
         }
 
+    def _build_body(self, prompt: str, conversation_id: str = None) -> Tuple[dict, Optional[Conversation], Optional[int]]:
+        """
+        Build the request body for a prompt, trimming the conversation's history to fit the token limit.
+        :return: The body, the conversation (None without a conversation ID),
+        and the prompt's token count if it could be taken from the request count (None otherwise)
+        """
         messages = []
         conversation = None
         if self.system_message is not None:
             messages.append({"role": "system", "content": self.system_message})
 
-        prompt_tokens = get_num_tokens_from_string(prompt, self.model)
         if conversation_id is None:
             # No conversation ID, so there is no context to add to the prompt
-            messages.append({"role": "user", "content": prompt})
+            prompt_to_send = prompt
         else:
             conversation = self.prompt_histories.get_conversation(conversation_id=conversation_id)
-            conversation.trim(prompt_tokens=prompt_tokens, token_limit=self.max_conversation_tokens)
-            previous_messages = conversation.get_messages_for_api()
-            # Add the previous prompts and responses to the message list
-            for message in previous_messages:
-                messages.append(message)
-            # Finally, add the new prompt
             if self.forced_system_message is None:
                 prompt_to_send = prompt
             else:
                 prompt_to_send = self.forced_system_message + prompt
-            messages.append({"role": "user", "content": prompt_to_send})
+        prompt_message = {"role": "user", "content": prompt_to_send}
+
+        # Count the system message, the new prompt and the reply priming in one batched call.
+        # The saved dialogues already know their own token counts, so the history is never re-encoded.
+        num_tokens_per_message = get_num_tokens_per_message(messages + [prompt_message], self.model)
+        prompt_tokens = sum(num_tokens_per_message) + TOKENS_PER_REPLY
+        request_tokens = prompt_tokens
+
+        if conversation is not None:
+            conversation.trim(prompt_tokens=prompt_tokens, token_limit=self.max_conversation_tokens)
+            # Add the previous prompts and responses to the message list
+            for message in conversation.get_messages_for_api():
+                messages.append(message)
+            request_tokens += conversation.get_total_message_tokens()
+        # Finally, add the new prompt
+        messages.append(prompt_message)
 
         body = {
             "model": self.model,
@@ -113,29 +351,169 @@ class APIClient:
             "temperature": self.temperature
         }
 
-        logger.info(f"Sending API request to {self.path} with body: {body}")
+        logger.info(f"Sending API request to {self.path} ({request_tokens} prompt tokens) with body: {body}")
 
-        response = self.post(body=body, headers=headers, path=self.path)
-        logger.info(f"Got response: {response}")
+        if prompt_to_send == prompt:
+            # The prompt message's tokens minus its overhead is the content's token count
+            prompt_num_tokens = num_tokens_per_message[-1] - get_num_message_overhead_tokens("user", self.model)
+        else:
+            prompt_num_tokens = None
+        return body, conversation, prompt_num_tokens
+
+    def _save_response(self, conversation: Optional[Conversation], prompt: str, prompt_num_tokens: Optional[int],
+                       raw_text: str, response_num_tokens: Optional[int] = None) -> str:
+        """
+        Add the prompt and response to the conversation, if there is one.
+        :return: The response text, stripped of surrounding whitespace
+        """
+        text = raw_text.strip()
+        if conversation is not None:
+            # The API's count of the completion can be reused as long as strip() didn't change it
+            if text != raw_text:
+                response_num_tokens = None
+            conversation.add(prompt=prompt, response=text,
+                             prompt_num_tokens=prompt_num_tokens, response_num_tokens=response_num_tokens)
+        return text
 
-        max_retries = 5
-        for retries in range(max_retries):
+    def send_prompt(self, prompt: str, conversation_id: str = None, trace_id: Optional[str] = None) -> str:
+        """
+        :param trace_id: Optional. The trace to record the request's build, network and parse spans in.
+        """
+        with tracer.span("llm.build_request", trace_id):
+            body, conversation, prompt_num_tokens = self._build_body(prompt=prompt, conversation_id=conversation_id)
+
+        # Each attempt re-sends the request, and transient errors are retried with backoff
+        with tracer.span("llm.network", trace_id):
+            response = self.retry_policy.call(
+                lambda remaining_seconds: self.post(body=body, headers=self._get_headers(), path=self.path,
+                                                    remaining_seconds=remaining_seconds))
+        logger.info(f"Got response: {response}")
+        with tracer.span("llm.parse", trace_id):
             response_json = json.loads(response)
-            if "error" in response_json:
-                if retries == max_retries - 1:
-                    raise Exception(response_json["error"])
-                logger.error(f"Got error response: {response_json['error']}. Retrying in 10 seconds...")
-                time.sleep(10)
-            else:
-                break
+            return self._save_response(conversation=conversation, prompt=prompt, prompt_num_tokens=prompt_num_tokens,
+                                       raw_text=response_json["choices"][0]["message"]["content"],
+                                       response_num_tokens=response_json.get("usage", {}).get("completion_tokens"))
 
-        text = response_json["choices"][0]["message"]["content"].strip()
+    def stream_prompt(self, prompt: str, conversation_id: str = None, trace_id: Optional[str] = None) -> Iterator[str]:
+        """
+        Send a prompt and yield the response text incrementally, as the API streams it back as server-sent events.
+        The response is added to the conversation once the stream is complete.
+        :param prompt: The prompt to send
+        :param conversation_id: Optional. The conversation to add context from, and to save the response to
+        :param trace_id: Optional. The trace to record the request's spans in. The network span lasts until the
+        stream is opened, and the stream span until its last event.
+        :return: An iterator over the chunks of response text
+        """
+        with tracer.span("llm.build_request", trace_id):
+            body, conversation, prompt_num_tokens = self._build_body(prompt=prompt, conversation_id=conversation_id)
+            body["stream"] = True
 
-        if conversation is not None:
-            conversation.add(prompt=prompt, response=text)
+        text_chunks = []
+        # Only opening the stream is retried, since text that has already been yielded can't be taken back
+        with tracer.span("llm.network", trace_id):
+            response = self.retry_policy.call(
+                lambda remaining_seconds: self.post_stream(body=body, headers=self._get_headers(), path=self.path,
+                                                           remaining_seconds=remaining_seconds))
+        stream_start_epoch = time.time()
+        with response:
+            for event_data in iter_server_sent_events(response):
+                if event_data == "[DONE]":
+                    break
+                text_chunk = get_text_chunk_from_event(event_data)
+                if text_chunk:
+                    if not text_chunks:
+                        tracer.record("llm.first_chunk", trace_id, stream_start_epoch)
+                    text_chunks.append(text_chunk)
+                    yield text_chunk
+        tracer.record("llm.stream", trace_id, stream_start_epoch, num_chunks=len(text_chunks))
+
+        with tracer.span("llm.parse", trace_id):
+            text = self._save_response(conversation=conversation, prompt=prompt, prompt_num_tokens=prompt_num_tokens,
+                                       raw_text="".join(text_chunks))
+        logger.info(f"Got streamed response: {text}")
+
+    def _get_timeout(self, remaining_seconds: Optional[float]) -> Tuple[float, float]:
+        if remaining_seconds is None:
+            return self.connect_timeout, self.read_timeout
+        # Don't let a single attempt run past the request's deadline
+        remaining_seconds = max(remaining_seconds, 0.001)
+        return min(self.connect_timeout, remaining_seconds), min(self.read_timeout, remaining_seconds)
+
+    def post(self, body: dict, headers: dict, path: str, remaining_seconds: Optional[float] = None) -> str:
+        """
+        :param remaining_seconds: Optional. The seconds left until the request's deadline, which caps the timeouts.
+        :return: The response text
+        :raises APIError: If the API responded with an error
+        """
+        response = self.session.post(self.base_url + path, headers=headers, data=json.dumps(body),
+                                     timeout=self._get_timeout(remaining_seconds))
+        raise_for_api_error(response)
+        response_text = response.text
+        response_json = json.loads(response_text)
+        if "error" in response_json:
+            # An error in a successful response is unexpected, so give it another try
+            raise APIError(f"Got error response: {response_json['error']}", retryable=True)
+        return response_text
+
+    def post_stream(self, body: dict, headers: dict, path: str, remaining_seconds: Optional[float] = None) -> requests.Response:
+        """
+        :param remaining_seconds: Optional. The seconds left until the request's deadline, which caps the timeouts.
+        :return: The response, with its body not yet read
+        :raises APIError: If the API responded with an error
+        """
+        response = self.session.post(self.base_url + path, headers=headers, data=json.dumps(body),
+                                     timeout=self._get_timeout(remaining_seconds), stream=True)
+        raise_for_api_error(response)
+        return response
+
+
+def raise_for_api_error(response: requests.Response):
+    """
+    :raises APIError: If the response has an error status, classified as retryable or not
+    """
+    if response.status_code < 400:
+        return
+    try:
+        error = response.json().get("error", response.text)
+    except ValueError:
+        error = response.text
+    retryable = True
+    # A 429 can also mean the account is out of quota, which waiting won't fix
+    if response.status_code == 429 and isinstance(error, dict) and error.get("code") == "insufficient_quota":
+        retryable = False
+    raise APIError(f"Got error response ({response.status_code}): {error}",
+                   status_code=response.status_code,
+                   retry_after=parse_retry_after(response.headers.get("Retry-After")),
+                   retryable=retryable)
+
+
+def iter_server_sent_events(response: requests.Response) -> Iterator[str]:
+    """
+    Yield the data of each server-sent event in a streamed response, as soon as the event is complete.
+    """
+    data_lines = []
+    # chunk_size=None hands over each chunk of the response as it arrives, instead of waiting for a full buffer
+    for line in response.iter_lines(chunk_size=None):
+        line = line.decode("utf-8")
+        if line.startswith("data:"):
+            data_lines.append(line[len("data:"):].lstrip())
+        elif not line and data_lines:
+            # A blank line ends the event
+            yield "\n".join(data_lines)
+            data_lines = []
+    if data_lines:
+        yield "\n".join(data_lines)
 
-        return text
 
-    def post(self, body: dict, headers: dict, path: str):
-        response = requests.post(self.base_url + path, headers=headers, data=json.dumps(body))
-        return response.text
\ No newline at end of file
+def get_text_chunk_from_event(event_data: str) -> Optional[str]:
+    """
+    :param event_data: The data of a streamed chat completion event
+    :return: The chunk of response text in the event, if any
+    :raises APIError: If the event is an error
+    """
+    event_json = json.loads(event_data)
+    if "error" in event_json:
+        raise APIError(f"Got error event: {event_json['error']}")
+    if not event_json.get("choices"):
+        return None
+    return event_json["choices"][0].get("delta", {}).get("content")
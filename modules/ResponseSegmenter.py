@@ -0,0 +1,131 @@
+import re
+from typing import List, Optional, Tuple
+from modules.enums.ResponseTypeEnum import ResponseTypeEnum
+
+RESPONSE_TYPE_PREFIX = "TYPE_"
+RESPONSE_TYPE_PATTERN = re.compile(r"TYPE_[A-Z_]*")
+# These end a sentence when followed by whitespace, so decimals like 9.5 aren't split
+SENTENCE_TERMINATORS = ".!?"
+# Full-width punctuation isn't followed by whitespace, so these end a sentence immediately
+FULL_WIDTH_SENTENCE_TERMINATORS = "。！？"
+CLAUSE_SEPARATORS = ",;:"
+FULL_WIDTH_CLAUSE_SEPARATORS = "、，"
+
+
+def get_response_type(prefix: str) -> Optional[ResponseTypeEnum]:
+    """
+    Get the response type of a TYPE_* prefix. The longest matching type wins, so TYPE_NORMAL isn't mistaken for TYPE_NO.
+    """
+    matching_response_types = [response_type for response_type in ResponseTypeEnum if prefix.startswith(response_type.value)]
+    if not matching_response_types:
+        return None
+    return max(matching_response_types, key=lambda response_type: len(response_type.value))
+
+
+def split_response_type(response: str) -> Tuple[Optional[ResponseTypeEnum], str]:
+    """
+    Split the TYPE_* prefix off a response.
+    :param response: The full response text
+    :return: The response type (None if the response has no known prefix) and the rest of the response
+    """
+    match = RESPONSE_TYPE_PATTERN.match(response.lstrip())
+    if match is None:
+        return None, response.strip()
+    response_type = get_response_type(match.group(0))
+    if response_type is None:
+        return None, response.strip()
+    return response_type, response.lstrip()[len(response_type.value):].strip()
+
+
+class ResponseSegmenter:
+    """
+    Splits a streamed response into its TYPE_* prefix and speakable sentences, so speech can start
+    as soon as the first sentence is complete instead of after the whole response has arrived.
+    """
+    def __init__(self, min_clause_chars: int = 40):
+        """
+        :param min_clause_chars: Long sentences are also split at clause separators (commas etc.),
+        once the clause is at least this many characters long.
+        """
+        self.min_clause_chars = min_clause_chars
+        self.buffer = ""
+        self.scan_position = 0
+        self.response_type = None
+        self.response_type_detected = False
+
+    def feed(self, text_chunk: str) -> List[str]:
+        """
+        Add a chunk of the streamed response.
+        :param text_chunk: The next chunk of response text
+        :return: The sentences completed by this chunk, if any
+        """
+        self.buffer += text_chunk
+        if not self.response_type_detected:
+            self._detect_response_type(is_final=False)
+            if not self.response_type_detected:
+                return []
+        return self._split_sentences()
+
+    def flush(self) -> List[str]:
+        """
+        Call once the stream has ended.
+        :return: The remaining text, as a final sentence
+        """
+        if not self.response_type_detected:
+            self._detect_response_type(is_final=True)
+        sentences = self._split_sentences()
+        remaining_text = self.buffer.strip()
+        self.buffer = ""
+        self.scan_position = 0
+        if remaining_text:
+            sentences.append(remaining_text)
+        return sentences
+
+    def _detect_response_type(self, is_final: bool):
+        text = self.buffer.lstrip()
+        if not text and not is_final:
+            return
+        if not text.startswith(RESPONSE_TYPE_PREFIX):
+            if RESPONSE_TYPE_PREFIX.startswith(text) and not is_final:
+                # Could still turn out to be a prefix, e.g. "TYP"
+                return
+            self.response_type_detected = True
+            return
+        prefix = RESPONSE_TYPE_PATTERN.match(text).group(0)
+        if prefix == text and not is_final:
+            # The prefix might continue in the next chunk, e.g. "TYPE_NO" could become "TYPE_NORMAL"
+            return
+        self.response_type = get_response_type(prefix)
+        if self.response_type is not None:
+            self.buffer = text[len(self.response_type.value):]
+        self.response_type_detected = True
+
+    def _split_sentences(self) -> List[str]:
+        sentences = []
+        segment_start = 0
+        position = self.scan_position
+        while position < len(self.buffer):
+            char = self.buffer[position]
+            split_after = None
+            if char in FULL_WIDTH_SENTENCE_TERMINATORS:
+                split_after = position
+            elif char in SENTENCE_TERMINATORS or char in CLAUSE_SEPARATORS:
+                if position + 1 == len(self.buffer):
+                    # Wait for the next chunk to tell whether this ends the sentence
+                    break
+                if self.buffer[position + 1].isspace() and \
+                        (char in SENTENCE_TERMINATORS or position - segment_start >= self.min_clause_chars):
+                    split_after = position
+            elif char in FULL_WIDTH_CLAUSE_SEPARATORS and position - segment_start >= self.min_clause_chars:
+                split_after = position
+
+            if split_after is not None:
+                sentence = self.buffer[segment_start:split_after + 1].strip()
+                if sentence:
+                    sentences.append(sentence)
+                segment_start = split_after + 1
+            position += 1
+
+        self.buffer = self.buffer[segment_start:]
+        self.scan_position = position - segment_start
+        return sentences
@@ -0,0 +1,134 @@
+import asyncio
+import random
+import time
+import requests
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+from modules.helpers.logging_helper import logger
+
+T = TypeVar("T")
+
+
+class APIError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None,
+                 retryable: bool = False):
+        """
+        :param status_code: The HTTP status code of the response, if there was one
+        :param retry_after: Seconds the server asked us to wait before retrying, from its Retry-After header
+        :param retryable: Whether the request may succeed if it's sent again
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+def parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header, which is either a number of seconds or an HTTP date.
+    :return: The number of seconds to wait, or None if the header is missing or invalid
+    """
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    # Rate limits, timeouts and server errors are worth retrying. Bad requests and bad keys are not.
+    RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+    def __init__(self, max_attempts: int = 5, initial_delay: float = 1.0, max_delay: float = 20.0,
+                 backoff_factor: float = 2.0, deadline_seconds: Optional[float] = 60.0):
+        """
+        :param max_attempts: The maximum number of times a request is sent, including the first attempt.
+        :param initial_delay: The maximum delay in seconds before the first retry. Later retries back off exponentially.
+        :param max_delay: The cap on the backoff delay in seconds.
+        :param backoff_factor: The factor the delay grows by with each attempt.
+        :param deadline_seconds: Optional. The time in seconds a request may take across all attempts, including delays.
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1.")
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff_factor = backoff_factor
+        self.deadline_seconds = deadline_seconds
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, APIError):
+            if error.status_code is None:
+                return error.retryable
+            return error.retryable and error.status_code in self.RETRYABLE_STATUS_CODES
+        return isinstance(error, (requests.Timeout, requests.ConnectionError))
+
+    def get_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Get the delay before the next attempt, using exponential backoff with full jitter,
+        so that clients which failed together don't all retry together.
+        :param attempt: The attempt that just failed, starting at 1
+        :param retry_after: Optional. The delay the server asked for, which is honored if given
+        """
+        if retry_after is not None:
+            return retry_after
+        backoff = min(self.max_delay, self.initial_delay * self.backoff_factor ** (attempt - 1))
+        return random.uniform(0, backoff)
+
+    def _get_retry_delay(self, error: Exception, attempt: int, deadline: Optional[float]) -> Optional[float]:
+        """
+        :return: The delay before retrying a failed attempt, or None if the error should be raised instead
+        """
+        if not self.is_retryable(error):
+            return None
+        if attempt >= self.max_attempts:
+            logger.error(f"Request failed after {attempt} attempts: {error}")
+            return None
+        delay = self.get_delay(attempt, retry_after=getattr(error, "retry_after", None))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            logger.error(f"Request failed, and retrying in {delay:.2f} seconds would pass the deadline: {error}")
+            return None
+        logger.warning(f"Request failed (attempt {attempt}/{self.max_attempts}): {error}. Retrying in {delay:.2f} seconds...")
+        return delay
+
+    def call(self, request: Callable[[Optional[float]], T]) -> T:
+        """
+        Send a request, and send it again if it fails with a retryable error.
+        :param request: Sends the request. It's passed the seconds left until the deadline (None without a deadline),
+        so it can cap its own timeout.
+        :return: What the request returned
+        """
+        deadline = None if self.deadline_seconds is None else time.monotonic() + self.deadline_seconds
+        attempt = 1
+        while True:
+            remaining_seconds = None if deadline is None else deadline - time.monotonic()
+            try:
+                return request(remaining_seconds)
+            except Exception as e:
+                delay = self._get_retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, request: Callable[[Optional[float]], Awaitable[T]]) -> T:
+        """
+        Like call(), but for a coroutine, and waiting between attempts without blocking the event loop.
+        """
+        deadline = None if self.deadline_seconds is None else time.monotonic() + self.deadline_seconds
+        attempt = 1
+        while True:
+            remaining_seconds = None if deadline is None else deadline - time.monotonic()
+            try:
+                return await request(remaining_seconds)
+            except Exception as e:
+                delay = self._get_retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -1,126 +1,458 @@
+import functools
+import queue
 import time
 import speech_recognition as sr
 import threading
-from typing import Optional, Tuple
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+from modules.BoundedQueue import BoundedQueue
+from modules.engines.EngineRegistry import EngineRegistry, create_default_engine_registry
+from modules.engines.GoogleCloudEngine import GoogleCloudEngine
+from modules.engines.RecognizerEngine import RecognizerEngine
+from modules.KeywordSpotter import KeywordDetection, KeywordSpotter
 from modules.PyAudioWrapper import PyAudioWrapper
+from modules.TranscriptionRecord import TranscriptionRecord
+from modules.VoiceActivityDetector import VoiceActivityDetector
+from modules.enums.OverflowPolicyEnum import OverflowPolicyEnum
 from modules.helpers.logging_helper import logger
+from modules.helpers.tracing_helper import tracer
 import json
 
 
+def recognize_audio_data(engine: RecognizerEngine, audio_data: sr.AudioData) -> Tuple[str, Optional[float]]:
+    """
+    Transcribe audio with an engine, turning recognition failures into transcriptions describing them.
+
+    Args:
+        engine (RecognizerEngine): The loaded engine to use.
+        audio_data (sr.AudioData): The audio to transcribe.
+
+    Returns:
+        Tuple[str, Optional[float]]: The transcribed text, and the engine's confidence in it, from 0 to 1.
+    """
+    try:
+        return engine.recognize(audio_data)
+    except sr.UnknownValueError:
+        return "Speech Recognition could not understand audio", 0.0
+    except sr.RequestError as e:
+        return f"Error: {e}", None
+
+
+# The engine registry of a transcription worker process
+_worker_engine_registry = None
+
+
+def initialize_worker_engine_registry(engine_registry: EngineRegistry):
+    global _worker_engine_registry
+    _worker_engine_registry = engine_registry
+
+
+def recognize_in_worker(audio_data: sr.AudioData, engine: str) -> Tuple[str, Optional[float]]:
+    """
+    Transcribe audio in a transcription worker process, with the worker's own copy of the engine.
+    """
+    return recognize_audio_data(_worker_engine_registry.get(engine), audio_data)
+
+
 class SpeechToText:
+    # How long the transcription thread waits for audio before checking whether it should stop
+    QUEUE_GET_TIMEOUT_SECONDS = 0.5
+    # Outside of speculate_while, only utterances about as long as a short sentence addressing the character are
+    # transcribed speculatively
+    SPECULATION_MIN_SECONDS = 0.5
+    SPECULATION_MAX_SECONDS = 8.0
+    MAX_SPECULATIVE_TRANSCRIPTIONS = 4
+
     def __init__(self, device_index: Optional[int] = None,
                  keyword_entries: Optional[list[Tuple]] = None,
-                 credentials_json_file_path: Optional[str] = None):
+                 credentials_json_file_path: Optional[str] = None,
+                 max_buffered_audio_chunks: int = 32,
+                 buffer_overflow_policy: OverflowPolicyEnum = OverflowPolicyEnum.DROP_OLDEST,
+                 max_transcriptions: int = 16,
+                 transcription_overflow_policy: OverflowPolicyEnum = OverflowPolicyEnum.DROP_OLDEST,
+                 num_transcription_workers: int = 1,
+                 use_worker_processes: bool = False,
+                 keyword_spotter: Optional[KeywordSpotter] = None,
+                 voice_activity_detector: Optional[VoiceActivityDetector] = None,
+                 speculative_engine: Optional[str] = None,
+                 speculate_while: Optional[Callable[[], bool]] = None,
+                 engine_registry: Optional[EngineRegistry] = None):
+        """
+        Args:
+            num_transcription_workers (int): How many audio chunks to transcribe in parallel.
+            use_worker_processes (bool): If True, transcribe in worker processes instead of threads, so CPU-bound
+                decoding isn't serialized by the GIL.
+            keyword_spotter (KeywordSpotter, optional): If specified, keywords are spotted in the audio as it's
+                captured, and only utterances containing a keyword are queued to be transcribed.
+            voice_activity_detector (VoiceActivityDetector, optional): If specified, utterances are segmented from the
+                raw microphone frames by the detector instead of by Recognizer.listen, so they're queued as soon as
+                the end of speech is detected.
+            speculative_engine (str, optional): If specified, utterances are also transcribed with this engine,
+                concurrently with the first transcription, so the second stage doesn't have to wait for it.
+                Speculative transcriptions that turn out not to be needed are cancelled or discarded.
+            speculate_while (Callable[[], bool], optional): Speculate on every utterance while this returns True,
+                e.g. while the character is conversing. Otherwise, only utterances passing a cheap pre-filter are
+                speculated on.
+            engine_registry (EngineRegistry, optional): The speech recognition engines to choose from. If not
+                specified, the Sphinx and Google Cloud engines are registered. Register more engines to use them
+                without changing SpeechToText.
+        """
         self.recognizer = sr.Recognizer()
-        self.buffer = []  # To hold audio data
-        self.transcription = []  # To hold transcribed text
+        self.buffer = BoundedQueue(max_buffered_audio_chunks, buffer_overflow_policy)  # To hold audio data
+        self.transcription = BoundedQueue(max_transcriptions, transcription_overflow_policy,
+                                          on_drop=self._on_transcription_dropped)  # To hold transcribed text
         self.stop_capture = False  # Flag to control the capturing thread
         self.device_index = device_index  # Microphone device index
         self.keyword_entries = keyword_entries  # Keyword entries for keyword spotting
         self.engine = "sphinx"  # Default speech recognition engine
-        self.credentials_json_file_path = credentials_json_file_path  # Google Cloud credentials JSON file
-        self.latest_audio_chunk = None
+        self.engine_registry = engine_registry or create_default_engine_registry(keyword_entries=keyword_entries,
+                                                                                 credentials_json_file_path=credentials_json_file_path)
+        self._credentials_json_file_path = credentials_json_file_path  # Google Cloud credentials JSON file
+        self.keyword_spotter = keyword_spotter
+        self.voice_activity_detector = voice_activity_detector
+        self.num_utterances_without_keyword = 0
+        self.num_transcription_workers = num_transcription_workers
+        self.use_worker_processes = use_worker_processes
+        # Transcriptions in progress, in capture order. Bounded so the backlog waits in self.buffer instead.
+        self.transcriptions_in_progress = queue.Queue(maxsize=num_transcription_workers * 2)
+        self.transcription_executor = None
+        self.speculative_engine = speculative_engine
+        self.speculate_while = speculate_while
+        self.speculation_executor = None
+        self.speculation_lock = threading.Lock()
+        self.num_speculations = 0
+        self.num_speculation_hits = 0
+        self.num_speculations_cancelled = 0
+        self.num_speculations_wasted = 0
+        self.wasted_speculation_audio_seconds = 0.0
+
+    @property
+    def credentials_json_file_path(self) -> Optional[str]:
+        return self._credentials_json_file_path
+
+    @credentials_json_file_path.setter
+    def credentials_json_file_path(self, credentials_json_file_path: Optional[str]):
+        # The Google Cloud engine is recreated with the new credentials the next time it's used
+        self._credentials_json_file_path = credentials_json_file_path
+        google_cloud_engine_factory = self.engine_registry.factories.get(GoogleCloudEngine.NAME)
+        if isinstance(google_cloud_engine_factory, functools.partial):
+            self.engine_registry.register(GoogleCloudEngine.NAME, functools.partial(
+                google_cloud_engine_factory, credentials_json_file_path=credentials_json_file_path))
 
     def set_engine(self, engine: str):
         """
         Set the speech recognition engine.
 
         Args:
-            engine (str): The speech recognition engine to use.
+            engine (str): The name of a registered speech recognition engine.
         """
-        if engine == "sphinx":
-            self.engine = "sphinx"
-        elif engine == "google":
-            self.engine = "google"
-        else:
+        if engine not in self.engine_registry:
             raise ValueError(f"Speech recognition engine '{engine}' not supported.")
+        self.engine = engine
         logger.info(f"Speech recognition engine set to '{self.engine}'")
 
+    def _recognize(self, audio_data: sr.AudioData, engine: str) -> Tuple[str, Optional[float]]:
+        return recognize_audio_data(self.engine_registry.get(engine), audio_data)
+
+    def enqueue_audio(self, audio_data: sr.AudioData, capture_epoch: Optional[float] = None,
+                      keyword_detection: Optional[KeywordDetection] = None) -> bool:
+        """
+        Queue captured audio to be transcribed. The audio starts a new trace, if tracing is enabled.
+
+        Args:
+            audio_data (sr.AudioData): The captured audio.
+            capture_epoch (float, optional): When the audio finished being captured. If not specified, now.
+            keyword_detection (KeywordDetection, optional): The keyword spotted in the audio, if any.
+
+        Returns:
+            bool: Whether the audio was queued, as opposed to dropped because the buffer is full.
+        """
+        if capture_epoch is None:
+            capture_epoch = time.time()
+        trace_id = tracer.new_trace_id()
+        if trace_id is not None:
+            duration_seconds = len(audio_data.frame_data) / (audio_data.sample_rate * audio_data.sample_width)
+            tracer.record("stt.capture", trace_id, capture_epoch - duration_seconds, capture_epoch,
+                          keyword_spotted=keyword_detection is not None)
+        if not self.buffer.put((audio_data, capture_epoch, keyword_detection, trace_id)):
+            logger.warning(f"Audio buffer is full, dropped captured audio ({self.buffer.num_dropped} dropped so far)")
+            return False
+        return True
+
     def start_capture(self):
         """
         Start capturing audio from the selected microphone.
         """
-        with sr.Microphone(device_index=self.device_index) as source:
+        # The detector needs to know the sample rate, so the microphone is opened at its rate
+        sample_rate = self.voice_activity_detector.sample_rate if self.voice_activity_detector is not None else None
+        with sr.Microphone(device_index=self.device_index, sample_rate=sample_rate) as source:
             while not self.stop_capture:
+                if self.voice_activity_detector is not None:
+                    self._capture_voice_segments(source)
+                    continue
+                if self.keyword_spotter is not None:
+                    self._capture_utterance_with_keyword(source)
+                    continue
                 audio = self.recognizer.listen(source)
-                self.buffer.append(audio)
+                self.enqueue_audio(audio)
                 logger.debug("Captured audio")
         logger.debug("End of start_capture()")
 
+    def _capture_voice_segments(self, source: sr.AudioSource):
+        """
+        Read the next raw frames from the microphone, and queue the utterances whose end was detected in them.
+        If there's a keyword spotter, only utterances containing a keyword are queued.
+        """
+        pcm = source.stream.read(source.CHUNK)
+        for voice_segment in self.voice_activity_detector.process(pcm):
+            audio = sr.AudioData(voice_segment.pcm, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+            keyword_detection = None
+            if self.keyword_spotter is not None:
+                keyword_detection = self.keyword_spotter.spot(audio)
+                if keyword_detection is None:
+                    self.num_utterances_without_keyword += 1
+                    logger.debug("Captured audio without a keyword")
+                    continue
+            logger.debug(f"Captured {voice_segment}")
+            self.enqueue_audio(audio, keyword_detection=keyword_detection)
+
+    def _capture_utterance_with_keyword(self, source: sr.AudioSource):
+        """
+        Capture an utterance, spotting keywords in its frames as they're captured.
+        The utterance is only queued to be transcribed if a keyword was spotted.
+        """
+        audio_chunks = []
+        keyword_detection = None
+        self.keyword_spotter.start_utterance()
+        try:
+            for audio_chunk in self.recognizer.listen(source, stream=True):
+                audio_chunks.append(audio_chunk)
+                if keyword_detection is None:
+                    keyword_detection = self.keyword_spotter.process(audio_chunk)
+        finally:
+            self.keyword_spotter.end_utterance()
+
+        if keyword_detection is None:
+            self.num_utterances_without_keyword += 1
+            logger.debug("Captured audio without a keyword")
+            return
+        logger.debug(f"Captured audio with a keyword: {keyword_detection}")
+        audio = sr.AudioData(b"".join(audio_chunk.frame_data for audio_chunk in audio_chunks),
+                             source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+        self.enqueue_audio(audio, keyword_detection=keyword_detection)
+
     def _transcribe_from_audio_data(self, audio_data, engine: str = None) -> str:
         """
         :param audio_data:
         :param engine: Optional. If not specified, the default engine will be used (self.engine member variable)
         :return:
         """
-        try:
-            if not engine:
-                engine = self.engine
-            # Directly use the AudioData object for recognition
-            if engine == "google":
-                text = self.recognizer.recognize_google_cloud(audio_data=audio_data, credentials_json=self.credentials_json_file_path)
-            elif engine == "sphinx":
-                text = self.recognizer.recognize_sphinx(audio_data=audio_data, keyword_entries=self.keyword_entries)
-            else:
-                raise ValueError(f"Speech recognition engine '{engine}' not supported.")
-            return text
-        except sr.UnknownValueError:
-            return "Speech Recognition could not understand audio"
-        except sr.RequestError as e:
-            return f"Error: {e}"
+        text, _ = self._recognize(audio_data, engine or self.engine)
+        return text
 
     def _transcribe_from_audio_source(self, audio_source: sr.AudioSource, engine: str = None) -> str:
         """
-        :param audio_source:
+        :param audio_source: A finite source, such as an audio file. All of it is transcribed, not just up to the first
+        pause like Recognizer.listen.
         :param engine: Optional. If not specified, the default engine will be used (self.engine member variable)
         :return:
         """
-        try:
-            if not engine:
-                engine = self.engine
-            with audio_source as source:
-                audio = self.recognizer.listen(source)
-            if engine == "google":
-                text = self.recognizer.recognize_google_cloud(audio_data=audio, credentials_json=self.credentials_json_file_path)
-            elif engine == "sphinx":
-                text = self.recognizer.recognize_sphinx(audio_data=audio, keyword_entries=self.keyword_entries)
-            else:
-                raise ValueError(f"Speech recognition engine '{engine}' not supported.")
-            return text
-        except sr.UnknownValueError:
-            return "Speech Recognition could not understand audio"
-        except sr.RequestError as e:
-            return f"Error: {e}"
+        with audio_source as source:
+            audio = self.recognizer.record(source)
+        return self._transcribe_from_audio_data(audio, engine)
 
     # Modify the start_transcription and transcribe_from_audio_file accordingly
 
+    def _create_transcription_executor(self) -> Executor:
+        if self.use_worker_processes:
+            # Each worker process loads its own engines from a copy of the registry
+            return ProcessPoolExecutor(max_workers=self.num_transcription_workers,
+                                       initializer=initialize_worker_engine_registry, initargs=(self.engine_registry,))
+        return ThreadPoolExecutor(max_workers=self.num_transcription_workers, thread_name_prefix="transcription")
+
+    def _submit_transcription(self, audio_chunk: sr.AudioData, engine: str, trace_id: Optional[str] = None):
+        if self.use_worker_processes:
+            future = self.transcription_executor.submit(recognize_in_worker, audio_chunk, engine)
+        else:
+            future = self.transcription_executor.submit(self._recognize, audio_chunk, engine)
+        if trace_id is not None:
+            # Includes the time spent waiting for a free worker
+            submit_epoch = time.time()
+            future.add_done_callback(lambda _: tracer.record("stt.first_stage", trace_id, submit_epoch, engine=engine))
+        return future
+
+    def should_speculate(self, audio_chunk: sr.AudioData) -> bool:
+        if self.speculative_engine is None:
+            return False
+        if self.speculate_while is not None and self.speculate_while():
+            return True
+        duration_seconds = len(audio_chunk.frame_data) / (audio_chunk.sample_rate * audio_chunk.sample_width)
+        return self.SPECULATION_MIN_SECONDS <= duration_seconds <= self.SPECULATION_MAX_SECONDS
+
+    def _submit_speculative_transcription(self, audio_chunk: sr.AudioData) -> Optional[Future]:
+        if not self.should_speculate(audio_chunk):
+            return None
+        with self.speculation_lock:
+            self.num_speculations += 1
+        # The second-stage engine is a network call, so threads are enough
+        return self.speculation_executor.submit(self._recognize, audio_chunk, self.speculative_engine)
+
     def start_transcription(self):
         """
-        Start transcribing buffered audio.
+        Start transcribing buffered audio on the pool of transcription workers.
         """
+        if self.transcription_executor is None:
+            self.transcription_executor = self._create_transcription_executor()
+        if self.speculative_engine is not None and self.speculation_executor is None:
+            self.speculation_executor = ThreadPoolExecutor(max_workers=self.MAX_SPECULATIVE_TRANSCRIPTIONS,
+                                                           thread_name_prefix="speculative-transcription")
+        sequence_number = 0
         while not self.stop_capture:
-            if self.buffer:
-                audio_chunk = self.buffer.pop(0)
+            try:
+                audio_chunk, capture_epoch, keyword_detection, trace_id = \
+                    self.buffer.get(timeout=self.QUEUE_GET_TIMEOUT_SECONDS)
+            except queue.Empty:
+                continue
+            engine = self.engine
+            future = self._submit_transcription(audio_chunk, engine, trace_id)
+            speculative_future = self._submit_speculative_transcription(audio_chunk) if engine != self.speculative_engine else None
+            transcription_in_progress = (sequence_number, audio_chunk, capture_epoch, keyword_detection, engine,
+                                         future, speculative_future, trace_id)
+            # Waits while all workers are busy and their results haven't been collected yet
+            while not self.stop_capture:
                 try:
-                    text = self._transcribe_from_audio_data(audio_chunk)
-                    self.transcription.append(text)
-                except Exception as e:
-                    logger.error(f"Error transcribing audio: {e}")
-                self.latest_audio_chunk = audio_chunk
-            time.sleep(0.001)
+                    self.transcriptions_in_progress.put(transcription_in_progress, timeout=self.QUEUE_GET_TIMEOUT_SECONDS)
+                    break
+                except queue.Full:
+                    continue
+            sequence_number += 1
+        self.transcription_executor.shutdown(wait=False, cancel_futures=True)
+        if self.speculation_executor is not None:
+            self.speculation_executor.shutdown(wait=False, cancel_futures=True)
+
+    def collect_transcriptions(self):
+        """
+        Queue finished transcriptions in the order their audio was captured, even when the workers finish out of order.
+        """
+        while not self.stop_capture:
+            try:
+                sequence_number, audio_chunk, capture_epoch, keyword_detection, engine, future, speculative_future, \
+                    trace_id = self.transcriptions_in_progress.get(timeout=self.QUEUE_GET_TIMEOUT_SECONDS)
+            except queue.Empty:
+                continue
+            try:
+                text, confidence = future.result()
+                transcription_record = TranscriptionRecord(text=text, engine=engine, confidence=confidence,
+                                                           audio_data=audio_chunk, capture_epoch=capture_epoch,
+                                                           sequence_number=sequence_number,
+                                                           keyword_detection=keyword_detection,
+                                                           speculative_engine=self.speculative_engine if speculative_future else None,
+                                                           speculative_transcription=speculative_future,
+                                                           trace_id=trace_id)
+                self.transcription.put(transcription_record)
+            except Exception as e:
+                logger.error(f"Error transcribing audio: {e}")
+                if speculative_future is not None:
+                    speculative_future.cancel()
 
-    def transcribe_from_audio_file(self, filepath: str):
+    def _on_transcription_dropped(self, transcription_record: TranscriptionRecord):
+        logger.warning(f"Transcription queue is full, dropped transcription: {transcription_record.text}")
+        self.discard_speculation(transcription_record)
+
+    def clear_transcriptions(self):
+        """
+        Drop all queued transcriptions, discarding their speculative transcriptions.
+        """
+        for transcription_record in self.transcription.clear():
+            self.discard_speculation(transcription_record)
+
+    def transcribe_second_stage(self, transcription_record: TranscriptionRecord, engine: str) -> TranscriptionRecord:
+        """
+        Transcribe the audio of a transcription with the second-stage engine, using the speculative transcription if
+        there is one for that engine.
+
+        Args:
+            transcription_record (TranscriptionRecord): The first-stage transcription.
+            engine (str): The second-stage speech recognition engine.
+
+        Returns:
+            TranscriptionRecord: The second-stage transcription of the same audio.
+        """
+        start_epoch = time.time()
+        speculative_transcription = transcription_record.speculative_transcription
+        if speculative_transcription is not None and transcription_record.speculative_engine == engine:
+            transcription_record.speculative_transcription = None
+            try:
+                text, confidence = speculative_transcription.result()
+                with self.speculation_lock:
+                    self.num_speculation_hits += 1
+                tracer.record("stt.second_stage", transcription_record.trace_id, start_epoch, engine=engine,
+                              speculative=True)
+                return transcription_record.with_transcription(text=text, engine=engine, confidence=confidence)
+            except Exception as e:
+                logger.warning(f"Speculative transcription failed, so transcribing again: {e}")
+        self.discard_speculation(transcription_record)
+        with tracer.span("stt.second_stage", transcription_record.trace_id, engine=engine, speculative=False):
+            return self.retranscribe(transcription_record, engine)
+
+    def discard_speculation(self, transcription_record: TranscriptionRecord):
+        """
+        Cancel the speculative transcription of a transcription that doesn't need a second stage. If it already
+        started, its result is discarded.
+        """
+        speculative_transcription = transcription_record.speculative_transcription
+        if speculative_transcription is None:
+            return
+        transcription_record.speculative_transcription = None
+        with self.speculation_lock:
+            if speculative_transcription.cancel():
+                self.num_speculations_cancelled += 1
+            else:
+                self.num_speculations_wasted += 1
+                self.wasted_speculation_audio_seconds += transcription_record.duration_seconds
+
+    def get_speculation_stats(self) -> dict:
+        """
+        Get how many speculative transcriptions were started, used, cancelled before starting, and run for nothing.
+        """
+        with self.speculation_lock:
+            num_resolved = self.num_speculation_hits + self.num_speculations_cancelled + self.num_speculations_wasted
+            return {
+                "speculations": self.num_speculations,
+                "hits": self.num_speculation_hits,
+                "cancelled": self.num_speculations_cancelled,
+                "wasted": self.num_speculations_wasted,
+                "wasted_audio_seconds": self.wasted_speculation_audio_seconds,
+                "hit_rate": self.num_speculation_hits / num_resolved if num_resolved > 0 else None,
+            }
+
+    def retranscribe(self, transcription_record: TranscriptionRecord, engine: str) -> TranscriptionRecord:
+        """
+        Transcribe the audio of a transcription again, with another engine.
+
+        Args:
+            transcription_record (TranscriptionRecord): The transcription whose audio to transcribe.
+            engine (str): The speech recognition engine to use.
+
+        Returns:
+            TranscriptionRecord: The new transcription of the same audio.
+        """
+        text, confidence = self._recognize(transcription_record.audio_data, engine)
+        return transcription_record.with_transcription(text=text, engine=engine, confidence=confidence)
+
+    def transcribe_from_audio_file(self, filepath: str, engine: str = None):
         """
         Transcribe speech from an audio file.
 
         Args:
             filepath (str): The path to the audio file.
+            engine (str, optional): The name of the engine to use. If not specified, the default engine is used.
 
         Returns:
             str: The transcribed text.
         """
         audio_source = sr.AudioFile(filepath)
-        return self._transcribe_from_audio_source(audio_source)
+        return self._transcribe_from_audio_source(audio_source, engine)
 
     def start(self):
         """
@@ -128,9 +460,22 @@ class SpeechToText:
         """
         capture_thread = threading.Thread(target=self.start_capture)
         transcribe_thread = threading.Thread(target=self.start_transcription)
+        collect_thread = threading.Thread(target=self.collect_transcriptions)
 
         capture_thread.start()
         transcribe_thread.start()
+        collect_thread.start()
+
+    def get_queue_stats(self) -> dict:
+        """
+        Get the depth of the audio buffer and transcription queues, and how many items each has dropped.
+        """
+        return {
+            "buffer_depth": self.buffer.depth,
+            "buffer_dropped": self.buffer.num_dropped,
+            "transcription_depth": self.transcription.depth,
+            "transcription_dropped": self.transcription.num_dropped,
+        }
 
     def stop(self):
         """
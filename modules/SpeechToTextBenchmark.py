@@ -0,0 +1,230 @@
+import json
+import os
+import time
+import wave
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Optional, Tuple
+from modules.KeywordSpotter import KeywordSpotter
+from modules.SpeechToText import SpeechToText
+from modules.engines.EngineRegistry import EngineRegistry
+from modules.helpers.logging_helper import logger
+import speech_recognition as sr
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+KEYWORD_SPOTTER_ENGINE_NAME = "keyword_spotter"
+# Rounding keeps reports diffable between runs
+REPORT_DECIMALS = 4
+
+
+class CorpusEntry:
+    def __init__(self, wav_path: str, expected_transcript: str, duration_seconds: float):
+        self.wav_path = wav_path
+        self.expected_transcript = expected_transcript
+        self.duration_seconds = duration_seconds
+
+
+def load_corpus(directory: str) -> list[CorpusEntry]:
+    """
+    Load a corpus of WAV files, each with its expected transcript in a .txt file of the same name.
+    """
+    corpus_entries = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.lower().endswith(".wav"):
+            continue
+        wav_path = os.path.join(directory, filename)
+        transcript_path = os.path.splitext(wav_path)[0] + ".txt"
+        if not os.path.exists(transcript_path):
+            logger.warning(f"Skipping {filename}, which has no transcript at {transcript_path}")
+            continue
+        with open(transcript_path, encoding="utf-8") as transcript_file:
+            expected_transcript = transcript_file.read().strip()
+        with wave.open(wav_path, "rb") as wav_file:
+            duration_seconds = wav_file.getnframes() / wav_file.getframerate()
+        corpus_entries.append(CorpusEntry(wav_path, expected_transcript, duration_seconds))
+    return corpus_entries
+
+
+def normalize_words(text: str) -> list[str]:
+    return "".join(character if character.isalnum() or character.isspace() else " " for character in text.lower()).split()
+
+
+def get_word_error_rate(expected_transcript: str, transcript: str) -> float:
+    """
+    The word-level edit distance between the transcripts, divided by the number of expected words.
+    """
+    expected_words = normalize_words(expected_transcript)
+    words = normalize_words(transcript)
+    distances = list(range(len(words) + 1))
+    for expected_index, expected_word in enumerate(expected_words, start=1):
+        previous_diagonal, distances[0] = distances[0], expected_index
+        for index, word in enumerate(words, start=1):
+            substitution = previous_diagonal + (expected_word != word)
+            previous_diagonal = distances[index]
+            distances[index] = min(distances[index] + 1, distances[index - 1] + 1, substitution)
+    return distances[-1] / max(len(expected_words), 1)
+
+
+def contains_keyword(text: str, keyword: str) -> bool:
+    return keyword.lower() in normalize_words(text)
+
+
+def get_precision_recall(expected_detections: list[bool], detections: list[bool]) -> Tuple[Optional[float], Optional[float]]:
+    """
+    :return: The precision and recall of the detections. None where undefined, i.e. nothing was detected or expected.
+    """
+    true_positives = sum(expected and detected for expected, detected in zip(expected_detections, detections))
+    num_detections = sum(detections)
+    num_expected = sum(expected_detections)
+    precision = true_positives / num_detections if num_detections > 0 else None
+    recall = true_positives / num_expected if num_expected > 0 else None
+    return precision, recall
+
+
+def get_peak_memory_megabytes() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def round_values(value):
+    if isinstance(value, float):
+        return round(value, REPORT_DECIMALS)
+    if isinstance(value, dict):
+        return {key: round_values(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [round_values(item) for item in value]
+    return value
+
+
+def summarize(corpus_entries: list[CorpusEntry], transcripts: list[str], latencies: list[float],
+              cpu_seconds: float, load_seconds: float, keyword: Optional[str],
+              detections: Optional[list[bool]] = None) -> dict:
+    audio_seconds = sum(corpus_entry.duration_seconds for corpus_entry in corpus_entries)
+    summary = {
+        "load_seconds": load_seconds,
+        "real_time_factor": sum(latencies) / audio_seconds if audio_seconds > 0 else None,
+        "latency_p50_seconds": float(np.percentile(latencies, 50)) if latencies else None,
+        "latency_p95_seconds": float(np.percentile(latencies, 95)) if latencies else None,
+        "latency_p99_seconds": float(np.percentile(latencies, 99)) if latencies else None,
+        "cpu_seconds_per_audio_second": cpu_seconds / audio_seconds if audio_seconds > 0 else None,
+        "peak_memory_megabytes": get_peak_memory_megabytes(),
+        "files": [{"file": os.path.basename(corpus_entry.wav_path), "transcript": transcript, "latency_seconds": latency}
+                  for corpus_entry, transcript, latency in zip(corpus_entries, transcripts, latencies)],
+    }
+    if detections is None:
+        summary["word_error_rate"] = float(np.mean([get_word_error_rate(corpus_entry.expected_transcript, transcript)
+                                                    for corpus_entry, transcript in zip(corpus_entries, transcripts)])) \
+            if transcripts else None
+    if keyword is not None:
+        expected_detections = [contains_keyword(corpus_entry.expected_transcript, keyword) for corpus_entry in corpus_entries]
+        if detections is None:
+            detections = [contains_keyword(transcript, keyword) for transcript in transcripts]
+        summary["keyword_precision"], summary["keyword_recall"] = get_precision_recall(expected_detections, detections)
+    return summary
+
+
+def benchmark_engine(corpus_entries: list[CorpusEntry], engine_registry: EngineRegistry, engine: str,
+                     keyword: Optional[str] = None) -> dict:
+    """
+    Transcribe the corpus with an engine through SpeechToText.transcribe_from_audio_file.
+    """
+    speech_to_text = SpeechToText(engine_registry=engine_registry)
+    start = time.perf_counter()
+    engine_registry.get(engine)
+    load_seconds = time.perf_counter() - start
+
+    transcripts = []
+    latencies = []
+    cpu_start = time.process_time()
+    for corpus_entry in corpus_entries:
+        start = time.perf_counter()
+        transcripts.append(speech_to_text.transcribe_from_audio_file(corpus_entry.wav_path, engine=engine))
+        latencies.append(time.perf_counter() - start)
+    cpu_seconds = time.process_time() - cpu_start
+    return summarize(corpus_entries, transcripts, latencies, cpu_seconds, load_seconds, keyword)
+
+
+def benchmark_keyword_spotter(corpus_entries: list[CorpusEntry], keyword: str, sensitivity: float = 1.0) -> dict:
+    """
+    Spot the keyword in the corpus with the streaming keyword spotter front-end.
+    """
+    start = time.perf_counter()
+    keyword_spotter = KeywordSpotter(keyword_entries=[(keyword, sensitivity)])
+    load_seconds = time.perf_counter() - start
+
+    recognizer = sr.Recognizer()
+    detections = []
+    transcripts = []
+    latencies = []
+    cpu_start = time.process_time()
+    for corpus_entry in corpus_entries:
+        start = time.perf_counter()
+        with sr.AudioFile(corpus_entry.wav_path) as source:
+            audio_data = recognizer.record(source)
+        keyword_detection = keyword_spotter.spot(audio_data)
+        latencies.append(time.perf_counter() - start)
+        detections.append(keyword_detection is not None)
+        transcripts.append(keyword_detection.keyword if keyword_detection is not None else "")
+    cpu_seconds = time.process_time() - cpu_start
+    return summarize(corpus_entries, transcripts, latencies, cpu_seconds, load_seconds, keyword, detections=detections)
+
+
+class SpeechToTextBenchmark:
+    """
+    Benchmarks speech recognition engines over a corpus of recorded WAV files with expected transcripts, reporting
+    real-time factor, latency percentiles, word error rate, keyword spotting precision and recall, CPU and memory.
+    """
+    def __init__(self, corpus_directory: str, engine_registry: EngineRegistry, keyword: Optional[str] = None,
+                 isolate_engines: bool = True):
+        """
+        :param corpus_directory: A directory of WAV files, each with its expected transcript in a .txt file of the
+        same name.
+        :param engine_registry: The engines to choose from.
+        :param keyword: Optional. The character name, to measure keyword spotting for.
+        :param isolate_engines: If True, benchmark each engine in its own process, so their CPU and memory use are
+        measured separately. The engine registry's factories must then be picklable.
+        """
+        self.corpus_directory = corpus_directory
+        self.corpus_entries = load_corpus(corpus_directory)
+        self.engine_registry = engine_registry
+        self.keyword = keyword
+        self.isolate_engines = isolate_engines
+
+    def _run_isolated(self, function, *args) -> dict:
+        if not self.isolate_engines:
+            return function(*args)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            return executor.submit(function, *args).result()
+
+    def run(self, engines: list[str]) -> dict:
+        report = {
+            "corpus": {
+                "num_files": len(self.corpus_entries),
+                "audio_seconds": sum(corpus_entry.duration_seconds for corpus_entry in self.corpus_entries),
+            },
+            "keyword": self.keyword,
+            "engines": {},
+        }
+        for engine in engines:
+            logger.info(f"Benchmarking speech recognition engine '{engine}'")
+            report["engines"][engine] = self._run_isolated(benchmark_engine, self.corpus_entries, self.engine_registry,
+                                                           engine, self.keyword)
+        if self.keyword is not None:
+            logger.info("Benchmarking keyword spotter")
+            report["engines"][KEYWORD_SPOTTER_ENGINE_NAME] = self._run_isolated(benchmark_keyword_spotter,
+                                                                                self.corpus_entries, self.keyword)
+        return round_values(report)
+
+
+def write_report(report: dict, path: str):
+    with open(path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
+        report_file.write("\n")
@@ -1,11 +1,17 @@
 from typing import Optional, List
 import pyttsx3
-import pyaudio
+from modules.AudioBuffer import AudioBuffer
+from modules.AudioCache import AudioCache
+from modules.AudioPlayer import AudioPlayer
 from modules.AudioDevice import AudioDevice
 from modules.PyAudioWrapper import PyAudioWrapper
 from modules.helpers.logging_helper import logger
 import os
-import wave
+import tempfile
+
+# pyttsx3 can only render to a file, so synthesized speech is rendered to tmpfs where there is one. Elsewhere,
+# including on Windows, it's rendered to a temporary file on disk and read straight back.
+SYNTHESIS_TEMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
 
 
 class TextToSpeech:
@@ -14,6 +20,8 @@ class TextToSpeech:
         voice_id: Optional[str] = None,
         rate: Optional[int] = None,
         volume: Optional[float] = None,
+        audio_player: Optional[AudioPlayer] = None,
+        audio_cache: Optional[AudioCache] = None,
     ):
         """
         Initialize the TextToSpeech object.
@@ -22,8 +30,12 @@ class TextToSpeech:
             voice_id (str, optional): The ID of the voice to use for speech synthesis.
             rate (int, optional): The rate of speech (words per minute).
             volume (float, optional): The volume level (0.0 to 1.0).
+            audio_player (AudioPlayer, optional): The player to play speech on devices with. Created on first use if not given.
+            audio_cache (AudioCache, optional): A cache for synthesized speech, so repeated phrases are only synthesized once.
         """
         self.engine = pyttsx3.init()
+        self.audio_player = audio_player
+        self.audio_cache = audio_cache
         if voice_id:
             self.set_voice(voice_id)
         if rate is not None:
@@ -89,6 +101,66 @@ class TextToSpeech:
         self.engine.save_to_file(text, filepath)
         self.engine.runAndWait()
 
+    def synthesize(self, text: str) -> AudioBuffer:
+        """
+        Synthesize the given text into an in-memory audio buffer, or get it from the audio cache if it was synthesized before.
+
+        Args:
+            text (str): The text to be spoken.
+
+        Returns:
+            AudioBuffer: The synthesized speech.
+        """
+        if self.audio_cache is None:
+            return self._synthesize(text)
+        key = self._get_cache_key(text)
+        audio_buffer = self.audio_cache.get(key)
+        if audio_buffer is None:
+            audio_buffer = self._synthesize(text)
+            self.audio_cache.put(key, audio_buffer)
+        return audio_buffer
+
+    def prerender(self, phrases: List[str]) -> None:
+        """
+        Synthesize phrases into the audio cache ahead of time, so they play with near-zero latency when first spoken.
+
+        Args:
+            phrases (List[str]): The phrases to synthesize.
+        """
+        if self.audio_cache is None:
+            raise ValueError("An audio cache is required to prerender phrases.")
+        for phrase in phrases:
+            self.synthesize(phrase)
+        logger.info(f"Prerendered {len(phrases)} phrases")
+
+    def _get_cache_key(self, text: str) -> str:
+        return AudioCache.get_key(text=text,
+                                  voice=self.engine.getProperty("voice"),
+                                  rate=self.engine.getProperty("rate"),
+                                  volume=self.engine.getProperty("volume"))
+
+    def _synthesize(self, text: str) -> AudioBuffer:
+        """
+        Synthesize the given text into an in-memory audio buffer.
+
+        Args:
+            text (str): The text to be spoken.
+
+        Returns:
+            AudioBuffer: The synthesized speech.
+        """
+        # Render to a uniquely named file, in memory only on hosts with tmpfs, and read it straight back.
+        # Concurrent calls never share a file.
+        fd, filepath = tempfile.mkstemp(prefix="speech_", suffix=".wav", dir=SYNTHESIS_TEMP_DIR)
+        os.close(fd)
+        try:
+            self.speak_to_file(text, filepath)
+            with open(filepath, 'rb') as f:
+                wav_bytes = f.read()
+        finally:
+            os.remove(filepath)
+        return AudioBuffer.from_wav_bytes(wav_bytes)
+
     def speak_on_device(self, text: str, audio_device: AudioDevice):
         """
         Synthesize and speak the given text using a specific audio device.
@@ -97,41 +169,19 @@ class TextToSpeech:
             text (str): The text to be spoken.
             audio_device (AudioDevice): The audio device to use for speech synthesis.
         """
-        # First save the synthesized speech to a temporary .wav file
-        # Create the temp folder if it doesn't exist
-        temp_folder = "./temp"
-        if not os.path.exists(temp_folder):
-            os.mkdir(temp_folder)
-
-        filepath = os.path.join(temp_folder, "speak_on_device_temp_speech.wav")
-        self.speak_to_file(text, filepath)
-
-        # Now play the saved audio file using pyaudio
-        p = pyaudio.PyAudio()
-
-        # Read the .wav file
-        wf = wave.open(filepath, 'rb')
-
-        # Open a PyAudio stream
-        stream = p.open(format=p.get_format_from_width(wf.getsampwidth()),
-                        channels=wf.getnchannels(),
-                        rate=wf.getframerate(),
-                        output=True,
-                        output_device_index=audio_device.device_index)
-
-        # Read data chunk and play
-        chunk = 1024
-        data = wf.readframes(chunk)
-        while len(data) > 0:
-            stream.write(data)
-            data = wf.readframes(chunk)
-
-        # Stop stream
-        stream.stop_stream()
-        stream.close()
-
-        # Close PyAudio
-        p.terminate()
+        self.play_on_device(self.synthesize(text), audio_device)
+
+    def play_on_device(self, audio_buffer: AudioBuffer, audio_device: AudioDevice):
+        """
+        Play synthesized speech on a specific audio device, after any speech already queued on the audio player.
+
+        Args:
+            audio_buffer (AudioBuffer): The audio to play.
+            audio_device (AudioDevice): The audio device to play the audio on.
+        """
+        if self.audio_player is None:
+            self.audio_player = AudioPlayer(PyAudioWrapper())
+        self.audio_player.play(audio_buffer, audio_device)
 
 if __name__ == "__main__":
     py_audio_wrapper = PyAudioWrapper()
@@ -0,0 +1,146 @@
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, List, Optional
+from modules.AudioDevice import AudioDevice
+from modules.AudioPlayer import AudioPlayer
+from modules.TextToSpeech import TextToSpeech
+from modules.helpers.logging_helper import logger
+from modules.helpers.tracing_helper import tracer
+
+
+class SpeechRequest:
+    def __init__(self, text: str, audio_device: AudioDevice, trace_id: Optional[str] = None):
+        self.text = text
+        self.audio_device = audio_device
+        self.trace_id = trace_id
+        # Completes once the speech has finished playing, and is cancelled if the speech is cancelled
+        self.future = Future()
+        self.cancel_event = threading.Event()
+
+
+class TextToSpeechService:
+    """
+    Speaks utterances without blocking the caller. The pyttsx3 engine is created and used on the service's own
+    thread, which synthesizes each utterance while the previous one is still playing on the audio player.
+    Utterances are accepted through a bounded queue, and queued and in-progress speech can be cancelled (barge-in).
+    """
+    def __init__(self, text_to_speech_factory: Callable[[], TextToSpeech], audio_player: AudioPlayer,
+                 max_queued_utterances: int = 16, prerendered_phrases: Optional[List[str]] = None):
+        """
+        :param text_to_speech_factory: Creates the TextToSpeech, on the service's thread.
+        :param audio_player: The player to play synthesized speech on.
+        :param max_queued_utterances: The maximum number of utterances waiting to be synthesized.
+        :param prerendered_phrases: Optional. Phrases to synthesize into the TextToSpeech's audio cache at startup.
+        """
+        self.text_to_speech_factory = text_to_speech_factory
+        self.audio_player = audio_player
+        self.prerendered_phrases = prerendered_phrases or []
+        self.requests = queue.Queue(maxsize=max_queued_utterances)
+        # Requests that are queued, being synthesized or playing
+        self.pending_requests = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._synthesize_requests, daemon=True)
+            self.thread.start()
+            logger.info(f"Started text to speech thread")
+
+    @property
+    def is_speaking(self) -> bool:
+        """
+        Whether any speech is queued, being synthesized or playing.
+        """
+        with self.lock:
+            return len(self.pending_requests) > 0
+
+    def speak(self, text: str, audio_device: AudioDevice, trace_id: Optional[str] = None, block: bool = False,
+              timeout: Optional[float] = None) -> Future:
+        """
+        Queue text to be spoken after the speech already queued.
+        :param trace_id: Optional. The trace to record the speech's render and playback spans in.
+        :param block: If True and too many utterances are already queued, wait for room instead of failing, so a
+        producer that's faster than synthesis is slowed down to its pace instead of losing utterances.
+        :param timeout: Optional. With block, how long to wait for room. If not specified, wait indefinitely.
+        :return: A future that completes once the speech has finished playing. It's cancelled if the speech is
+        cancelled, and fails with queue.Full if too many utterances are already queued.
+        """
+        self.start()
+        request = SpeechRequest(text=text, audio_device=audio_device, trace_id=trace_id)
+        with self.lock:
+            self.pending_requests.add(request)
+        request.future.add_done_callback(lambda _: self._remove_pending_request(request))
+        try:
+            self.requests.put(request, block=block, timeout=timeout)
+        except queue.Full as e:
+            logger.warning(f"Too many utterances queued, so not speaking: {text}")
+            request.future.set_exception(e)
+        return request.future
+
+    def cancel(self):
+        """
+        Cancel all queued speech, and stop the speech that's playing.
+        """
+        with self.lock:
+            requests = list(self.pending_requests)
+        for request in requests:
+            request.cancel_event.set()
+            request.future.cancel()
+        if requests:
+            logger.info(f"Cancelled {len(requests)} utterances")
+
+    def _remove_pending_request(self, request: SpeechRequest):
+        with self.lock:
+            self.pending_requests.discard(request)
+
+    @staticmethod
+    def _complete(request: SpeechRequest, playback: Future):
+        try:
+            if playback.cancelled() or request.cancel_event.is_set():
+                request.future.cancel()
+            elif playback.exception() is not None:
+                request.future.set_exception(playback.exception())
+            else:
+                request.future.set_result(None)
+        except InvalidStateError:
+            # The request was cancelled meanwhile
+            pass
+
+    @staticmethod
+    def _trace_playback(request: SpeechRequest):
+        start_epoch = time.time()
+        request.future.add_done_callback(
+            lambda future: tracer.record("tts.playback", request.trace_id, start_epoch, cancelled=future.cancelled()))
+
+    def _synthesize_requests(self):
+        text_to_speech = self.text_to_speech_factory()
+        if self.prerendered_phrases:
+            text_to_speech.prerender(self.prerendered_phrases)
+
+        while True:
+            request = self.requests.get()
+            if request.cancel_event.is_set():
+                continue
+            try:
+                with tracer.span("tts.render", request.trace_id, num_characters=len(request.text)):
+                    audio_buffer = text_to_speech.synthesize(request.text)
+            except Exception as e:
+                logger.error(f"Error synthesizing speech: {e}")
+                try:
+                    request.future.set_exception(e)
+                except InvalidStateError:
+                    pass
+                continue
+            if request.cancel_event.is_set():
+                continue
+            # Playback happens on the audio player's thread, so the next request can be synthesized meanwhile
+            on_start = None
+            if request.trace_id is not None:
+                on_start = functools.partial(self._trace_playback, request)
+            playback = self.audio_player.enqueue(audio_buffer, request.audio_device, cancel_event=request.cancel_event,
+                                                 on_start=on_start)
+            playback.add_done_callback(lambda playback, request=request: self._complete(request, playback))
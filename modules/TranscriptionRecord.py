@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import Future
+import speech_recognition as sr
+from typing import Optional
+from modules.KeywordSpotter import KeywordDetection
+
+
+class TranscriptionRecord:
+    """
+    A transcription, paired with the exact audio it was transcribed from.
+    """
+    def __init__(self, text: str, engine: str, confidence: Optional[float], audio_data: sr.AudioData,
+                 capture_epoch: float, sequence_number: int, keyword_detection: Optional[KeywordDetection] = None,
+                 speculative_engine: Optional[str] = None, speculative_transcription: Optional[Future] = None,
+                 trace_id: Optional[str] = None):
+        """
+        :param text: The transcribed text.
+        :param engine: The speech recognition engine that transcribed the audio.
+        :param confidence: The engine's confidence in the transcription, from 0 to 1. None if it isn't known.
+        :param audio_data: The captured audio that was transcribed.
+        :param capture_epoch: When the audio finished being captured.
+        :param sequence_number: The position of the audio in capture order, starting from 0.
+        :param keyword_detection: Optional. The keyword the keyword spotter found in the audio, if it was used.
+        :param speculative_engine: Optional. The engine of the speculative transcription.
+        :param speculative_transcription: Optional. A future of the (text, confidence) of the same audio transcribed
+        with the speculative engine, started before it was known to be needed.
+        :param trace_id: Optional. The ID of the turn's trace, if tracing is enabled.
+        """
+        self.text = text
+        self.engine = engine
+        self.confidence = confidence
+        self.audio_data = audio_data
+        self.capture_epoch = capture_epoch
+        self.sequence_number = sequence_number
+        self.keyword_detection = keyword_detection
+        self.speculative_engine = speculative_engine
+        self.speculative_transcription = speculative_transcription
+        self.trace_id = trace_id
+        self.duration_seconds = len(audio_data.frame_data) / (audio_data.sample_rate * audio_data.sample_width)
+
+    @property
+    def age_seconds(self) -> float:
+        """
+        How long ago the audio finished being captured.
+        """
+        return time.time() - self.capture_epoch
+
+    def is_stale(self, max_age_seconds: float) -> bool:
+        return self.age_seconds > max_age_seconds
+
+    def with_transcription(self, text: str, engine: str, confidence: Optional[float]) -> "TranscriptionRecord":
+        """
+        Get a record of another transcription of the same audio.
+        """
+        return TranscriptionRecord(text=text, engine=engine, confidence=confidence, audio_data=self.audio_data,
+                                   capture_epoch=self.capture_epoch, sequence_number=self.sequence_number,
+                                   keyword_detection=self.keyword_detection, trace_id=self.trace_id)
+
+    def __repr__(self):
+        return f"TranscriptionRecord(sequence_number={self.sequence_number}, engine={self.engine!r}, " \
+               f"confidence={self.confidence}, text={self.text!r})"
@@ -0,0 +1,259 @@
+import asyncio
+import queue
+from concurrent.futures import Future
+from typing import AsyncIterator, Optional, Tuple
+from modules.AsyncAPIClient import AsyncAPIClient
+from modules.Character import Character, ConversingState, PerformingActionState
+from modules.ResponseSegmenter import ResponseSegmenter, split_response_type
+from modules.SpeechToText import SpeechToText
+from modules.TranscriptionRecord import TranscriptionRecord
+from modules.enums.ActionEnum import ActionEnum
+from modules.enums.ResponseTypeEnum import ResponseTypeEnum
+from modules.helpers.logging_helper import logger
+from modules.helpers.tracing_helper import tracer
+
+
+def handle_response_type(character: Character, response_type: Optional[ResponseTypeEnum],
+                         transcribed_message: str, trace_id: Optional[str] = None) -> Tuple[Optional[str], bool, bool]:
+    """
+    Act on the TYPE_* prefix of a response.
+    :param trace_id: Optional. The trace of the turn, to record the actions in.
+    :return: Text to say instead of the response (None to say the response), whether the conversation needs to end,
+    and whether the character needs to transition to the performing action state
+    """
+    replacement_text = None
+    conversation_end_needed = False
+    transition_to_performing_action_state_needed = False
+
+    if response_type == ResponseTypeEnum.NORMAL:
+        character.consecutive_confused_responses = 0
+    elif response_type == ResponseTypeEnum.ENDING:
+        conversation_end_needed = True
+        logger.info(f"Ending conversation due to TYPE_ENDING: {character.conversation_uuid}")
+    elif response_type == ResponseTypeEnum.CONFUSED:
+        character.consecutive_confused_responses += 1
+    elif response_type == ResponseTypeEnum.YES:
+        character.actions.enqueue_action(ActionEnum.NOD_HEAD_TWICE, trace_id)
+    elif response_type == ResponseTypeEnum.NO:
+        character.actions.enqueue_action(ActionEnum.SHAKE_HEAD, trace_id)
+    elif response_type is not None and response_type.is_command:
+        # Sometimes the AI will identify a command, but claim it cannot perform it.
+        # In this case, just don't say anything.
+        if "sorry" in transcribed_message.lower():
+            transcribed_message = ""
+        if not character.window_is_focused:
+            replacement_text = "Sorry, I cannot move right now."
+        elif response_type == ResponseTypeEnum.CMD_TURN:
+            left_turn_keywords = ["left", "counter"]
+            if any(left_turn_keyword in transcribed_message for left_turn_keyword in left_turn_keywords):
+                character.actions.enqueue_action(ActionEnum.TURN_LEFT_UNTIL_STOP_FLAG, trace_id)
+            else:
+                character.actions.enqueue_action(ActionEnum.TURN_RIGHT_UNTIL_STOP_FLAG, trace_id)
+            transition_to_performing_action_state_needed = True
+        elif response_type == ResponseTypeEnum.CMD_FORWARD:
+            character.actions.enqueue_action(ActionEnum.MOVE_FORWARD_UNTIL_STOP_FLAG, trace_id)
+            transition_to_performing_action_state_needed = True
+        elif response_type == ResponseTypeEnum.CMD_BACK:
+            character.actions.enqueue_action(ActionEnum.MOVE_BACK_UNTIL_STOP_FLAG, trace_id)
+            transition_to_performing_action_state_needed = True
+
+    return replacement_text, conversation_end_needed, transition_to_performing_action_state_needed
+
+
+class AsyncTurnRunner:
+    """
+    Runs the bot's conversation turns on an event loop: transcribe, classify, prompt, speak and act.
+    Waiting on the LLM, speech recognition and speech synthesis doesn't block the loop, so character.update()
+    keeps running on schedule, and speaking a sentence overlaps with streaming the next one.
+    Speech is queued on the character's TextToSpeechService, and addressing the character while it's speaking
+    cancels its speech (barge-in).
+    """
+    END_KEYWORDS = ["bye", "quit", "exit"]
+    STOP_ACTION_KEYWORDS = ["stop", "wait", "hold", "pause"]
+    UPDATE_INTERVAL_SECONDS = 0.01
+    TRANSCRIPTION_GET_TIMEOUT_SECONDS = 0.5
+
+    def __init__(self, character: Character, speech_to_text: SpeechToText, api_client: AsyncAPIClient,
+                 stream: bool = True, max_transcription_age_seconds: Optional[float] = 10.0):
+        """
+        :param stream: If True, stream responses and speak each sentence as soon as it arrives.
+        :param max_transcription_age_seconds: Optional. Transcriptions of audio captured longer ago than this are
+        discarded instead of answered. If None, transcriptions never go stale.
+        """
+        self.character = character
+        self.speech_to_text = speech_to_text
+        self.api_client = api_client
+        self.stream = stream
+        self.max_transcription_age_seconds = max_transcription_age_seconds
+
+    async def run(self):
+        await asyncio.gather(self._update_character(), self._run_turns())
+
+    async def _update_character(self):
+        while True:
+            self.character.update()
+            await asyncio.sleep(self.UPDATE_INTERVAL_SECONDS)
+
+    async def _next_transcription(self) -> TranscriptionRecord:
+        # Block on the queue in a worker thread instead of polling it from the loop
+        while True:
+            try:
+                return await asyncio.to_thread(self.speech_to_text.transcription.get,
+                                               timeout=self.TRANSCRIPTION_GET_TIMEOUT_SECONDS)
+            except queue.Empty:
+                continue
+
+    async def _run_turns(self):
+        while True:
+            transcription_record = await self._next_transcription()
+            try:
+                await self.run_turn(transcription_record)
+            except Exception as e:
+                logger.error(f"Error during turn: {e}")
+
+    async def run_turn(self, transcription_record: TranscriptionRecord):
+        transcribed_message = transcription_record.text.strip().lower()
+        logger.info(f"{transcription_record.engine} transcription: {transcribed_message} "
+                    f"(confidence {transcription_record.confidence})")
+
+        if self.max_transcription_age_seconds is not None and \
+                transcription_record.is_stale(self.max_transcription_age_seconds):
+            logger.info(f"Discarding transcription captured {transcription_record.age_seconds:.1f} seconds ago")
+            self.speech_to_text.discard_speculation(transcription_record)
+            return
+
+        if transcription_record.keyword_detection is not None:
+            # Only audio the keyword spotter found the name in gets transcribed
+            logger.info(f"Character name {self.character.name} spotted "
+                        f"{transcription_record.keyword_detection.offset_seconds:.2f} seconds into the audio")
+        elif self.character.name in transcribed_message:
+            logger.info(f"Character name {self.character.name} detected with Sphinx transcription")
+        else:
+            self.speech_to_text.discard_speculation(transcription_record)
+            return
+
+        if self.character.text_to_speech_service.is_speaking:
+            logger.info("Character was addressed while speaking, so cancelling its speech")
+            self.character.text_to_speech_service.cancel()
+
+        if transcription_record.engine != "google":
+            try:
+                # Transcribe the same audio the name was detected in, unless it was already transcribed speculatively
+                transcription_record = await asyncio.to_thread(self.speech_to_text.transcribe_second_stage,
+                                                               transcription_record, engine="google")
+            except Exception as e:
+                logger.error(f"Error transcribing audio with Google Cloud: {e}")
+                return
+
+        transcribed_message = transcription_record.text
+        logger.info(f"Google Cloud transcription: {transcribed_message} (confidence {transcription_record.confidence})")
+
+        if not await self._classify(transcribed_message):
+            return
+
+        # Character nods once to indicate it heard the message
+        self.character.actions.enqueue_action(ActionEnum.NOD_HEAD, transcription_record.trace_id)
+
+        # Speak through the state the turn started in, even if character.update() ends the conversation meanwhile
+        conversing_state = self.character.state
+        if self.stream:
+            text_chunks = self.api_client.stream_prompt_async(prompt=transcribed_message,
+                                                              conversation_id=self.character.conversation_uuid,
+                                                              trace_id=transcription_record.trace_id)
+            conversation_end_needed, transition_to_performing_action_state_needed = \
+                await self._speak_streamed_response(conversing_state, text_chunks, transcribed_message,
+                                                    transcription_record.trace_id)
+        else:
+            openai_response = await self.api_client.send_prompt_async(prompt=transcribed_message,
+                                                                      conversation_id=self.character.conversation_uuid,
+                                                                      trace_id=transcription_record.trace_id)
+            logger.info(f"OpenAI response: {openai_response}")
+
+            response_type, openai_response = split_response_type(openai_response)
+            replacement_text, conversation_end_needed, transition_to_performing_action_state_needed = \
+                handle_response_type(character=self.character, response_type=response_type,
+                                     transcribed_message=transcribed_message, trace_id=transcription_record.trace_id)
+            if replacement_text is not None:
+                openai_response = replacement_text
+            self._speak(conversing_state, openai_response, transcription_record.trace_id)
+        # From the end of the captured audio until the whole response is queued to be spoken
+        tracer.record("turn", transcription_record.trace_id, transcription_record.capture_epoch)
+
+        if conversation_end_needed:
+            logger.info(f"Ending conversation: {self.character.conversation_uuid}")
+            self.character.end_conversation()
+        if transition_to_performing_action_state_needed:
+            self.character.set_state(PerformingActionState())
+
+        # Clear the transcription queue right after we have processed a message
+        # This means any messages that come in while we are processing a message will be ignored
+        # But this also means we won't have to worry about processing now-irrelevant messages
+        self.speech_to_text.clear_transcriptions()
+
+    async def _classify(self, transcribed_message: str) -> bool:
+        """
+        Start or end the conversation, or stop the current action, depending on the message.
+        :return: Whether the message should be answered
+        """
+        if self.character.state.is_wandering:
+            logger.info("Starting new conversation because character name was detected with Google Cloud transcription.")
+            self.character.start_conversation()
+        else:
+            if self.character.state.is_conversing and \
+                    any(end_keyword in transcribed_message for end_keyword in self.END_KEYWORDS):
+                logger.info(f"Ending conversation due to goodbye.")
+                self.character.end_conversation()
+                return False
+
+            if self.character.state.is_performing_action and \
+                    any(stop_action_keyword in transcribed_message for stop_action_keyword in self.STOP_ACTION_KEYWORDS):
+                logger.info(f"Stopping action due to stop keyword.")
+                # The action stops at its next frame, so there's no need to wait for it
+                self.character.actions.cancel_all()
+                self.character.set_state(self.character.previous_state)
+                return False
+
+        return self.character.state.is_conversing
+
+    def _speak(self, conversing_state: ConversingState, text: str, trace_id: Optional[str] = None,
+               block: bool = False) -> Future:
+        return conversing_state.speak(text_to_speech_service=self.character.text_to_speech_service,
+                                      text=text,
+                                      speaking_device=self.character.speaking_device,
+                                      trace_id=trace_id,
+                                      block=block)
+
+    async def _speak_streamed_response(self, conversing_state: ConversingState, text_chunks: AsyncIterator[str],
+                                       transcribed_message: str, trace_id: Optional[str] = None) -> Tuple[bool, bool]:
+        """
+        Consume a streamed response. The response type is acted on as soon as its prefix has arrived, and each
+        sentence is spoken as soon as it's complete, while the rest of the response keeps streaming in.
+        :return: Whether the conversation needs to end, and whether the character needs to transition to the performing action state
+        """
+        segmenter = ResponseSegmenter()
+        response_type_handled = False
+        replacement_text = None
+        conversation_end_needed = False
+        transition_to_performing_action_state_needed = False
+
+        end_of_stream = False
+        while not end_of_stream:
+            text_chunk = await anext(text_chunks, None)
+            end_of_stream = text_chunk is None
+            completed_sentences = segmenter.flush() if end_of_stream else segmenter.feed(text_chunk)
+            if segmenter.response_type_detected and not response_type_handled:
+                response_type_handled = True
+                replacement_text, conversation_end_needed, transition_to_performing_action_state_needed = \
+                    handle_response_type(character=self.character, response_type=segmenter.response_type,
+                                         transcribed_message=transcribed_message, trace_id=trace_id)
+                if replacement_text is not None:
+                    self._speak(conversing_state, replacement_text, trace_id)
+            if replacement_text is not None:
+                # Keep consuming the stream so the response is saved to the conversation, but don't say it
+                continue
+            for sentence in completed_sentences:
+                # Sentences are synthesized and played in order by the text to speech service. If the response streams
+                # in faster than it's synthesized, wait for room instead of dropping sentences from the middle of it.
+                await asyncio.to_thread(self._speak, conversing_state, sentence, trace_id, block=True)
+
+        return conversation_end_needed, transition_to_performing_action_state_needed
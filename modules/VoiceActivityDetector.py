@@ -0,0 +1,162 @@
+import numpy as np
+from collections import deque
+from typing import List, Optional
+
+
+class VoiceSegment:
+    def __init__(self, pcm: bytes, start_seconds: float, end_seconds: float, detected_seconds: float):
+        """
+        :param pcm: The segment's 16-bit mono PCM audio, including the pre-roll before speech started.
+        :param start_seconds: Where speech started, from the start of the stream.
+        :param end_seconds: Where speech ended, from the start of the stream.
+        :param detected_seconds: Where in the stream the end of speech was detected, i.e. when the segment was emitted.
+        """
+        self.pcm = pcm
+        self.start_seconds = start_seconds
+        self.end_seconds = end_seconds
+        self.detected_seconds = detected_seconds
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.end_seconds - self.start_seconds
+
+    def __repr__(self):
+        return f"VoiceSegment(start_seconds={self.start_seconds:.2f}, end_seconds={self.end_seconds:.2f})"
+
+
+class VoiceActivityDetector:
+    """
+    Splits a stream of 16-bit mono PCM into speech segments by frame energy. Frame energies are computed for a whole
+    block of frames at once with NumPy. A frame is speech if its energy is well above the noise floor, which tracks the
+    quietest frame over a recent window of all frames: it falls as soon as a quieter frame arrives, and rises slowly,
+    so steady background noise raises the threshold without short pauses in speech doing the same. A segment ends once
+    speech has been absent for the hangover time, or once it reaches the maximum length, and it's emitted right away
+    instead of after a silence timeout.
+    """
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 30, hangover_ms: int = 300,
+                 min_segment_ms: int = 250, max_segment_ms: int = 10000, pre_roll_ms: int = 150,
+                 energy_ratio: float = 3.0, min_energy: float = 300.0, noise_floor_window_ms: int = 3000,
+                 noise_floor_adaptation: float = 0.005):
+        """
+        :param sample_rate: The sample rate of the PCM.
+        :param frame_ms: The length of the frames speech is detected in.
+        :param hangover_ms: How long speech must be absent before the segment ends.
+        :param min_segment_ms: Segments with less speech than this are discarded as noise.
+        :param max_segment_ms: Segments are cut at this length, even if speech continues.
+        :param pre_roll_ms: How much audio before speech started to include in the segment.
+        :param energy_ratio: How many times the noise floor a frame's RMS energy must be to count as speech.
+        :param min_energy: The minimum RMS energy for a frame to count as speech, however low the noise floor is.
+        :param noise_floor_window_ms: How far back the quietest frame is looked for.
+        :param noise_floor_adaptation: How quickly the noise floor rises towards the quietest recent frame, per frame,
+        from 0 to 1.
+        """
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.min_segment_frames = max(1, min_segment_ms // frame_ms)
+        self.max_segment_frames = max(1, max_segment_ms // frame_ms)
+        self.pre_roll_frames = pre_roll_ms // frame_ms
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+        self.noise_floor_adaptation = noise_floor_adaptation
+        self.noise_floor = min_energy / energy_ratio
+        self.recent_energies = deque(maxlen=max(1, noise_floor_window_ms // frame_ms))
+
+        # Samples that don't make up a whole frame yet
+        self.pending_samples = np.zeros(0, dtype=np.int16)
+        self.num_frames_processed = 0
+        # Frames kept before speech starts, for the pre-roll
+        self.pre_roll = []
+        self.segment_frames = []
+        self.segment_start_frame = None
+        self.last_speech_frame = None
+
+    @property
+    def is_in_speech(self) -> bool:
+        return self.segment_start_frame is not None
+
+    def get_frame_energies(self, frames: np.ndarray) -> np.ndarray:
+        """
+        :param frames: A (number of frames, frame size) array of samples.
+        :return: The RMS energy of each frame.
+        """
+        return np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+
+    def process(self, pcm: bytes) -> List[VoiceSegment]:
+        """
+        Feed the next PCM of the stream.
+        :return: The segments whose end was detected in this PCM.
+        """
+        samples = np.concatenate((self.pending_samples, np.frombuffer(pcm, dtype=np.int16)))
+        num_frames = len(samples) // self.frame_size
+        self.pending_samples = samples[num_frames * self.frame_size:]
+        if num_frames == 0:
+            return []
+
+        frames = samples[:num_frames * self.frame_size].reshape(num_frames, self.frame_size)
+        energies = self.get_frame_energies(frames)
+
+        segments = []
+        for index in range(num_frames):
+            energy = float(energies[index])
+            is_speech = energy > max(self.min_energy, self.noise_floor * self.energy_ratio)
+            self._update_noise_floor(energy)
+            segment = self._process_frame(frames[index], is_speech)
+            if segment is not None:
+                segments.append(segment)
+        return segments
+
+    def flush(self) -> Optional[VoiceSegment]:
+        """
+        End the stream, emitting the segment in progress if it's long enough.
+        """
+        if not self.is_in_speech:
+            return None
+        return self._end_segment()
+
+    def _update_noise_floor(self, energy: float):
+        self.recent_energies.append(energy)
+        quietest_energy = min(self.recent_energies)
+        if quietest_energy < self.noise_floor:
+            self.noise_floor = quietest_energy
+        else:
+            self.noise_floor += self.noise_floor_adaptation * (quietest_energy - self.noise_floor)
+
+    def _process_frame(self, frame: np.ndarray, is_speech: bool) -> Optional[VoiceSegment]:
+        frame_index = self.num_frames_processed
+        self.num_frames_processed += 1
+
+        if not self.is_in_speech:
+            if is_speech:
+                self.segment_start_frame = frame_index
+                self.last_speech_frame = frame_index
+                self.segment_frames = self.pre_roll + [frame]
+                self.pre_roll = []
+            elif self.pre_roll_frames > 0:
+                self.pre_roll.append(frame)
+                if len(self.pre_roll) > self.pre_roll_frames:
+                    self.pre_roll.pop(0)
+            return None
+
+        self.segment_frames.append(frame)
+        if is_speech:
+            self.last_speech_frame = frame_index
+        if frame_index - self.last_speech_frame >= self.hangover_frames or \
+                frame_index - self.segment_start_frame + 1 >= self.max_segment_frames:
+            return self._end_segment()
+        return None
+
+    def _end_segment(self) -> Optional[VoiceSegment]:
+        num_speech_frames = self.last_speech_frame - self.segment_start_frame + 1
+        segment = None
+        if num_speech_frames >= self.min_segment_frames:
+            segment = VoiceSegment(pcm=np.concatenate(self.segment_frames).tobytes(),
+                                   start_seconds=self.segment_start_frame * self.frame_size / self.sample_rate,
+                                   end_seconds=(self.last_speech_frame + 1) * self.frame_size / self.sample_rate,
+                                   detected_seconds=self.num_frames_processed * self.frame_size / self.sample_rate)
+        self.segment_frames = []
+        self.segment_start_frame = None
+        self.last_speech_frame = None
+        return segment
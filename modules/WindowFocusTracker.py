@@ -0,0 +1,179 @@
+import sys
+import threading
+from typing import Callable, List, Optional
+from modules.helpers.logging_helper import logger
+
+try:
+    import pygetwindow as gw
+except NotImplementedError:
+    # Not available on Linux
+    gw = None
+
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+    EVENT_SYSTEM_FOREGROUND = 0x0003
+    WINEVENT_OUTOFCONTEXT = 0x0000
+    WM_QUIT = 0x0012
+    WM_USER = 0x0400
+    PM_NOREMOVE = 0x0000
+    WinEventProc = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND, wintypes.LONG,
+                                      wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+
+
+def get_active_window_title() -> Optional[str]:
+    """
+    :return: The title of the foreground window, or None if there isn't one or it can't be queried
+    """
+    if gw is None:
+        return None
+    try:
+        active_window = gw.getActiveWindow()
+    except Exception as e:
+        logger.error(f"Error getting the active window: {e}")
+        return None
+    return active_window.title if active_window is not None else None
+
+
+class WindowFocusTracker:
+    """
+    Tracks whether a window is focused, and tells subscribers when that changes.
+    On Windows, foreground window changes are received as events from SetWinEventHook. Elsewhere, or with the hook
+    disabled, the foreground window is polled, backing off while focus is stable and checking quickly after it changes.
+    """
+    MIN_POLL_INTERVAL_SECONDS = 0.01
+    MAX_POLL_INTERVAL_SECONDS = 0.25
+    POLL_BACKOFF_FACTOR = 1.5
+    CLOSE_TIMEOUT_SECONDS = 2.0
+
+    def __init__(self, window_title: str,
+                 get_active_window_title: Callable[[], Optional[str]] = get_active_window_title,
+                 use_event_hook: Optional[bool] = None,
+                 min_poll_interval_seconds: float = MIN_POLL_INTERVAL_SECONDS,
+                 max_poll_interval_seconds: float = MAX_POLL_INTERVAL_SECONDS):
+        """
+        :param window_title: The title of the window to track, compared case-insensitively.
+        :param get_active_window_title: Gets the title of the foreground window, or None if there isn't one.
+        :param use_event_hook: Optional. Whether to receive focus changes as Windows events instead of polling.
+        Defaults to True on Windows.
+        :param min_poll_interval_seconds: The poll interval right after focus changed.
+        :param max_poll_interval_seconds: The poll interval while focus is stable.
+        """
+        self.window_title = window_title
+        self.get_active_window_title = get_active_window_title
+        self.use_event_hook = use_event_hook if use_event_hook is not None else sys.platform == "win32"
+        self.min_poll_interval_seconds = min_poll_interval_seconds
+        self.max_poll_interval_seconds = max_poll_interval_seconds
+        self.subscribers: List[Callable[[bool], None]] = []
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.thread = None
+        self.hook_thread_id = None
+        # Set once the hook thread can receive WM_QUIT, or has fallen back to polling
+        self.hook_thread_ready = threading.Event()
+        self.num_checks = 0
+        self._is_focused = self._check()
+
+    @property
+    def is_focused(self) -> bool:
+        return self._is_focused
+
+    def subscribe(self, callback: Callable[[bool], None]):
+        """
+        Call back with whether the window is focused whenever that changes. Callbacks are called on the tracker's
+        thread, so they need to be quick.
+        """
+        with self.lock:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[bool], None]):
+        with self.lock:
+            self.subscribers.remove(callback)
+
+    def start(self):
+        if self.thread is None:
+            target = self._receive_foreground_events if self.use_event_hook else self._poll
+            self.thread = threading.Thread(target=target, daemon=True)
+            self.thread.start()
+            logger.info(f"Started window focus thread")
+
+    def close(self):
+        self.closed.set()
+        if self.thread is None or self.thread is threading.current_thread():
+            return
+        if self.use_event_hook and self.hook_thread_ready.wait(self.CLOSE_TIMEOUT_SECONDS) and \
+                self.hook_thread_id is not None:
+            # Ends the thread's message loop. The loop checks closed before waiting for messages, so it can't miss this.
+            ctypes.windll.user32.PostThreadMessageW(self.hook_thread_id, WM_QUIT, 0, 0)
+        self.thread.join(self.CLOSE_TIMEOUT_SECONDS)
+        if self.thread.is_alive():
+            logger.warning("Window focus thread didn't stop in time")
+
+    def _check(self, active_window_title: Optional[str] = None) -> bool:
+        self.num_checks += 1
+        if active_window_title is None:
+            active_window_title = self.get_active_window_title()
+        return active_window_title is not None and active_window_title.lower() == self.window_title.lower()
+
+    def _update(self, is_focused: bool) -> bool:
+        """
+        :return: Whether focus changed
+        """
+        if is_focused == self._is_focused:
+            return False
+        self._is_focused = is_focused
+        if is_focused:
+            logger.info(f"Window '{self.window_title}' is now focused.")
+        else:
+            logger.info(f"Window '{self.window_title}' is no longer focused.")
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber(is_focused)
+            except Exception as e:
+                logger.error(f"Error notifying a window focus subscriber: {e}")
+        return True
+
+    def _poll(self):
+        poll_interval_seconds = self.min_poll_interval_seconds
+        while not self.closed.wait(poll_interval_seconds):
+            if self._update(self._check()):
+                poll_interval_seconds = self.min_poll_interval_seconds
+            else:
+                poll_interval_seconds = min(poll_interval_seconds * self.POLL_BACKOFF_FACTOR,
+                                            self.max_poll_interval_seconds)
+
+    def _receive_foreground_events(self):
+        user32 = ctypes.windll.user32
+
+        def on_foreground_changed(hook, event, hwnd, id_object, id_child, event_thread, event_time):
+            length = user32.GetWindowTextLengthW(hwnd)
+            title = ctypes.create_unicode_buffer(length + 1)
+            user32.GetWindowTextW(hwnd, title, length + 1)
+            self._update(self._check(title.value))
+
+        # The callback has to stay referenced for as long as the hook is installed
+        callback = WinEventProc(on_foreground_changed)
+        hook = user32.SetWinEventHook(EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_FOREGROUND, 0, callback, 0, 0,
+                                      WINEVENT_OUTOFCONTEXT)
+        if not hook:
+            logger.warning("Could not hook foreground window changes, so polling for them instead")
+            self.hook_thread_ready.set()
+            self._poll()
+            return
+        # Create the thread's message queue, so WM_QUIT can be posted to it from now on
+        message = wintypes.MSG()
+        user32.PeekMessageW(ctypes.byref(message), 0, WM_USER, WM_USER, PM_NOREMOVE)
+        self.hook_thread_id = ctypes.windll.kernel32.GetCurrentThreadId()
+        self.hook_thread_ready.set()
+        # Focus may have changed before the hook was installed
+        self._update(self._check())
+        try:
+            # Out-of-context events are delivered through this thread's message loop
+            while not self.closed.is_set() and user32.GetMessageW(ctypes.byref(message), 0, 0, 0) > 0:
+                user32.TranslateMessage(ctypes.byref(message))
+                user32.DispatchMessageW(ctypes.byref(message))
+        finally:
+            user32.UnhookWinEvent(hook)
@@ -0,0 +1,76 @@
+import functools
+import threading
+from typing import Callable, Optional, Tuple
+from modules.engines.GoogleCloudEngine import GoogleCloudEngine
+from modules.engines.RecognizerEngine import RecognizerEngine
+from modules.engines.SphinxEngine import SphinxEngine
+from modules.helpers.logging_helper import logger
+
+
+class EngineRegistry:
+    """
+    Speech recognition engines by name. Each engine is created and loaded the first time it's used on a thread, and
+    then kept for that thread's later transcriptions, since engines like a pocketsphinx decoder aren't thread-safe.
+    The registry can be sent to worker processes if its factories can be pickled, e.g. classes or functools.partial.
+    """
+    def __init__(self):
+        self.factories = {}
+        self.local = threading.local()
+
+    def __getstate__(self):
+        # Loaded engines stay in the process that loaded them
+        return {"factories": self.factories}
+
+    def __setstate__(self, state):
+        self.factories = state["factories"]
+        self.local = threading.local()
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.factories)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.factories
+
+    def register(self, name: str, factory: Callable[[], RecognizerEngine]):
+        """
+        Register an engine, replacing any engine registered under the same name.
+        :param factory: Creates the engine, unloaded.
+        """
+        self.factories[name] = factory
+
+    def get(self, name: str) -> RecognizerEngine:
+        """
+        Get this thread's engine with the given name, creating and loading it if needed.
+        """
+        if name not in self.factories:
+            raise ValueError(f"Speech recognition engine '{name}' not supported.")
+        if not hasattr(self.local, "engines"):
+            self.local.engines = {}
+        factory = self.factories[name]
+        # The engine is recreated if it was registered again since it was loaded
+        cached_factory, engine = self.local.engines.get(name, (None, None))
+        if engine is None or cached_factory is not factory:
+            if engine is not None:
+                engine.close()
+            engine = factory()
+            engine.load()
+            self.local.engines[name] = (factory, engine)
+            logger.info(f"Loaded speech recognition engine '{name}' on thread {threading.current_thread().name}")
+        return engine
+
+
+def create_default_engine_registry(keyword_entries: Optional[list[Tuple]] = None,
+                                   credentials_json_file_path: Optional[str] = None,
+                                   sphinx_timeout_seconds: Optional[float] = None,
+                                   google_timeout_seconds: Optional[float] = 10.0) -> EngineRegistry:
+    """
+    Create a registry of the Sphinx and Google Cloud engines.
+    """
+    engine_registry = EngineRegistry()
+    engine_registry.register(SphinxEngine.NAME, functools.partial(SphinxEngine, keyword_entries=keyword_entries,
+                                                                  timeout_seconds=sphinx_timeout_seconds))
+    engine_registry.register(GoogleCloudEngine.NAME, functools.partial(GoogleCloudEngine,
+                                                                       credentials_json_file_path=credentials_json_file_path,
+                                                                       timeout_seconds=google_timeout_seconds))
+    return engine_registry
@@ -0,0 +1,41 @@
+import time
+import speech_recognition as sr
+from typing import Optional, Tuple
+from modules.engines.RecognizerEngine import RecognizerEngine
+
+
+class FakeEngine(RecognizerEngine):
+    """
+    A deterministic offline engine, for tests. Transcribes audio by looking up its frame data.
+    """
+    def __init__(self, name: str = "fake", transcriptions: Optional[dict[bytes, str]] = None,
+                 default_text: Optional[str] = None, confidence: float = 1.0, delay_seconds: float = 0.0,
+                 timeout_seconds: Optional[float] = None):
+        """
+        :param transcriptions: Optional. The text to transcribe each audio's frame data to.
+        :param default_text: Optional. The text to transcribe other audio to. If not specified, other audio can't be
+        understood.
+        :param delay_seconds: How long each transcription takes.
+        """
+        super().__init__(name=name, timeout_seconds=timeout_seconds)
+        self.transcriptions = transcriptions or {}
+        self.default_text = default_text
+        self.confidence = confidence
+        self.delay_seconds = delay_seconds
+        self.num_loads = 0
+        self.num_transcriptions = 0
+
+    def load(self):
+        self.num_loads += 1
+        super().load()
+
+    def recognize(self, audio_data: sr.AudioData) -> Tuple[str, Optional[float]]:
+        self.num_transcriptions += 1
+        if self.timeout_seconds is not None and self.delay_seconds > self.timeout_seconds:
+            time.sleep(self.timeout_seconds)
+            raise sr.RequestError(f"{self.name} transcription timed out after {self.timeout_seconds} seconds")
+        time.sleep(self.delay_seconds)
+        text = self.transcriptions.get(audio_data.frame_data, self.default_text)
+        if text is None:
+            raise sr.UnknownValueError()
+        return text, self.confidence
@@ -0,0 +1,60 @@
+import speech_recognition as sr
+from typing import Optional, Tuple
+from modules.engines.RecognizerEngine import RecognizerEngine
+
+
+class GoogleCloudEngine(RecognizerEngine):
+    """
+    Transcribes with the Google Cloud Speech-to-Text V1 API, through a client that's created once, instead of for
+    every transcription like recognize_google_cloud does.
+    """
+    NAME = "google"
+
+    def __init__(self, credentials_json_file_path: Optional[str] = None, language_code: str = "en-US",
+                 timeout_seconds: Optional[float] = 10.0):
+        """
+        :param credentials_json_file_path: Optional. Google Cloud credentials JSON file. If not specified, the default
+        application credentials are used.
+        :param language_code: The language of the speech.
+        """
+        super().__init__(name=self.NAME, timeout_seconds=timeout_seconds)
+        self.credentials_json_file_path = credentials_json_file_path
+        self.language_code = language_code
+        self.client = None
+
+    def load(self):
+        from google.cloud import speech
+        if self.credentials_json_file_path:
+            self.client = speech.SpeechClient.from_service_account_json(self.credentials_json_file_path)
+        else:
+            self.client = speech.SpeechClient()
+        super().load()
+
+    def recognize(self, audio_data: sr.AudioData) -> Tuple[str, Optional[float]]:
+        from google.api_core.exceptions import GoogleAPICallError
+        from google.cloud import speech
+
+        # The API accepts sample rates from 8 kHz to 48 kHz, and the rate sent has to be the rate of the FLAC data
+        sample_rate = max(8000, min(audio_data.sample_rate, 48000))
+        flac_data = audio_data.get_flac_data(convert_rate=None if sample_rate == audio_data.sample_rate else sample_rate,
+                                             convert_width=2)
+        config = speech.RecognitionConfig(encoding=speech.RecognitionConfig.AudioEncoding.FLAC,
+                                          sample_rate_hertz=sample_rate,
+                                          language_code=self.language_code)
+        try:
+            response = self.client.recognize(config=config, audio=speech.RecognitionAudio(content=flac_data),
+                                             timeout=self.timeout_seconds)
+        except GoogleAPICallError as e:
+            raise sr.RequestError(e)
+
+        if len(response.results) == 0:
+            raise sr.UnknownValueError()
+        text = " ".join(result.alternatives[0].transcript.strip() for result in response.results)
+        confidence = sum(result.alternatives[0].confidence for result in response.results) / len(response.results)
+        return text, confidence
+
+    def close(self):
+        if self.client is not None:
+            self.client.transport.close()
+            self.client = None
+        super().close()
@@ -0,0 +1,37 @@
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+import speech_recognition as sr
+
+
+class RecognizerEngine(ABC):
+    """
+    A speech recognition engine. Engines are loaded once and then reused for every transcription, so expensive state
+    like models and network clients stays warm. An engine instance is only used from one thread at a time.
+    """
+    def __init__(self, name: str, timeout_seconds: Optional[float] = None):
+        """
+        :param name: The name the engine is selected by.
+        :param timeout_seconds: Optional. How long a transcription may take before it fails with sr.RequestError.
+        """
+        self.name = name
+        self.timeout_seconds = timeout_seconds
+        self.is_loaded = False
+
+    def load(self):
+        """
+        Load models, open clients, etc. Called once, before the first transcription.
+        """
+        self.is_loaded = True
+
+    @abstractmethod
+    def recognize(self, audio_data: sr.AudioData) -> Tuple[str, Optional[float]]:
+        """
+        Transcribe audio.
+        :return: The transcribed text, and the engine's confidence in it from 0 to 1, or None if it isn't known.
+        :raises sr.UnknownValueError: If the audio couldn't be understood.
+        :raises sr.RequestError: If the transcription failed or timed out.
+        """
+        pass
+
+    def close(self):
+        self.is_loaded = False
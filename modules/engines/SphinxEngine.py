@@ -0,0 +1,88 @@
+import os
+import tempfile
+import time
+import pocketsphinx
+import speech_recognition as sr
+from typing import Optional, Tuple
+from modules.engines.RecognizerEngine import RecognizerEngine
+
+# The models that ship with speech_recognition, so results match recognize_sphinx
+POCKETSPHINX_DATA_DIRECTORY = os.path.join(os.path.dirname(sr.__file__), "pocketsphinx-data", "en-US")
+
+
+def create_decoder(use_language_model: bool = True) -> pocketsphinx.Decoder:
+    config = pocketsphinx.Config()
+    config.set_string("-hmm", os.path.join(POCKETSPHINX_DATA_DIRECTORY, "acoustic-model"))
+    if use_language_model:
+        config.set_string("-lm", os.path.join(POCKETSPHINX_DATA_DIRECTORY, "language-model.lm.bin"))
+    config.set_string("-dict", os.path.join(POCKETSPHINX_DATA_DIRECTORY, "pronounciation-dictionary.dict"))
+    config.set_string("-logfn", os.devnull)
+    return pocketsphinx.Decoder(config)
+
+
+def activate_keyword_search(decoder: pocketsphinx.Decoder, keyword_entries: list[Tuple[str, float]]):
+    """
+    Switch the decoder to keyword search for the keywords.
+    :param keyword_entries: (keyword, sensitivity) pairs, with sensitivities from 0 to 1, like the keyword_entries
+    of recognize_sphinx.
+    """
+    keywords_file_descriptor, keywords_file_path = tempfile.mkstemp(suffix=".kws", text=True)
+    try:
+        with os.fdopen(keywords_file_descriptor, "w") as keywords_file:
+            # Same sensitivity to threshold mapping as recognize_sphinx
+            keywords_file.writelines(f"{keyword} /1e{100 * sensitivity - 110}/\n" for keyword, sensitivity in keyword_entries)
+        decoder.add_kws("keywords", keywords_file_path)
+    finally:
+        os.remove(keywords_file_path)
+    decoder.activate_search("keywords")
+
+
+class SphinxEngine(RecognizerEngine):
+    """
+    Transcribes with a pocketsphinx decoder that's created once, instead of for every transcription like
+    recognize_sphinx does.
+    """
+    NAME = "sphinx"
+    # The sample rate and width the included acoustic model expects
+    SAMPLE_RATE = 16000
+    SAMPLE_WIDTH = 2
+    # Audio is decoded in pieces of this length, so a timeout can stop decoding part way through
+    DECODE_CHUNK_SECONDS = 0.5
+
+    def __init__(self, keyword_entries: Optional[list[Tuple[str, float]]] = None, timeout_seconds: Optional[float] = None):
+        """
+        :param keyword_entries: Optional. If specified, only spot these (keyword, sensitivity) pairs, like the
+        keyword_entries of recognize_sphinx.
+        """
+        super().__init__(name=self.NAME, timeout_seconds=timeout_seconds)
+        self.keyword_entries = keyword_entries
+        self.decoder = None
+
+    def load(self):
+        self.decoder = create_decoder()
+        if self.keyword_entries is not None:
+            activate_keyword_search(self.decoder, self.keyword_entries)
+        super().load()
+
+    def recognize(self, audio_data: sr.AudioData) -> Tuple[str, Optional[float]]:
+        raw_data = audio_data.get_raw_data(convert_rate=self.SAMPLE_RATE, convert_width=self.SAMPLE_WIDTH)
+        chunk_size = int(self.SAMPLE_RATE * self.DECODE_CHUNK_SECONDS) * self.SAMPLE_WIDTH
+        deadline = time.monotonic() + self.timeout_seconds if self.timeout_seconds is not None else None
+
+        self.decoder.start_utt()
+        try:
+            for offset in range(0, len(raw_data), chunk_size):
+                self.decoder.process_raw(raw_data[offset:offset + chunk_size], False, False)
+                if deadline is not None and time.monotonic() > deadline:
+                    raise sr.RequestError(f"Sphinx transcription timed out after {self.timeout_seconds} seconds")
+        finally:
+            self.decoder.end_utt()
+
+        hypothesis = self.decoder.hyp()
+        if hypothesis is None:
+            raise sr.UnknownValueError()
+        return hypothesis.hypstr, hypothesis.prob
+
+    def close(self):
+        self.decoder = None
+        super().close()
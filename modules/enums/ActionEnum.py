@@ -1,4 +1,5 @@
 from enum import Enum
+from modules.enums.ActionPriorityEnum import ActionPriorityEnum
 
 class ActionEnum(Enum):
     MOVE_FORWARD = "move_forward"
@@ -19,3 +20,11 @@ class ActionEnum(Enum):
     TURN_RIGHT_RANDOMLY = "turn_right_randomly"
     MOVE_FORWARD_RANDOMLY = "move_forward_randomly"
     MOVE_BACK_RANDOMLY = "move_back_randomly"
+
+    @property
+    def priority(self) -> ActionPriorityEnum:
+        if self in (ActionEnum.NOD_HEAD, ActionEnum.NOD_HEAD_TWICE, ActionEnum.SHAKE_HEAD):
+            return ActionPriorityEnum.GESTURE
+        if self.value.endswith("_randomly"):
+            return ActionPriorityEnum.WANDERING
+        return ActionPriorityEnum.LOCOMOTION
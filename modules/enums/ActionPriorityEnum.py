@@ -0,0 +1,7 @@
+from enum import Enum
+
+class ActionPriorityEnum(Enum):
+    # Lower values run first
+    GESTURE = 0
+    LOCOMOTION = 1
+    WANDERING = 2
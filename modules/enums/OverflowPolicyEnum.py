@@ -0,0 +1,6 @@
+from enum import Enum
+
+class OverflowPolicyEnum(Enum):
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    BLOCK = "block"
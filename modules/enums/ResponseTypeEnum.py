@@ -0,0 +1,16 @@
+from enum import Enum
+
+class ResponseTypeEnum(Enum):
+    NORMAL = "TYPE_NORMAL"
+    ENDING = "TYPE_ENDING"
+    CONFUSED = "TYPE_CONFUSED"
+    YES = "TYPE_YES"
+    NO = "TYPE_NO"
+    CMD = "TYPE_CMD"
+    CMD_TURN = "TYPE_CMD_TURN"
+    CMD_FORWARD = "TYPE_CMD_FORWARD"
+    CMD_BACK = "TYPE_CMD_BACK"
+
+    @property
+    def is_command(self) -> bool:
+        return self.value.startswith(ResponseTypeEnum.CMD.value)
@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Optional
+from uuid import uuid4
+import numpy as np
+from modules.helpers.logging_helper import logger
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, start_epoch: float, end_epoch: float, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.start_epoch = start_epoch
+        self.end_epoch = end_epoch
+        self.attributes = attributes
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.end_epoch - self.start_epoch
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "trace_id": self.trace_id, "start_epoch": self.start_epoch,
+                "duration_seconds": self.duration_seconds, "attributes": self.attributes}
+
+
+class _ActiveSpan:
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.attributes = attributes
+        self.start_epoch = None
+
+    def __enter__(self):
+        self.start_epoch = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.trace_id, self.start_epoch, time.time(), **self.attributes)
+        return False
+
+
+class _NoSpan:
+    """
+    Stands in for a span while tracing is disabled, so disabled tracing costs a single check.
+    """
+    attributes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """
+    Records timed spans of each turn's stages, keyed by a trace ID given to the turn's audio when it's captured.
+    Spans are kept in a ring buffer, and optionally appended to a JSONL file. Disabled by default.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.spans = deque(maxlen=4096)
+        self.jsonl_file = None
+        self.lock = threading.Lock()
+
+    def configure(self, enabled: bool, ring_buffer_size: int = 4096, jsonl_file_path: Optional[str] = None):
+        """
+        :param ring_buffer_size: How many of the latest spans to keep in memory.
+        :param jsonl_file_path: Optional. A file to append every span to, one JSON object per line.
+        """
+        with self.lock:
+            self.spans = deque(self.spans, maxlen=ring_buffer_size)
+            if self.jsonl_file is not None:
+                self.jsonl_file.close()
+            self.jsonl_file = open(jsonl_file_path, "a", encoding="utf-8") if enabled and jsonl_file_path else None
+            self.enabled = enabled
+        if enabled:
+            logger.info("Tracing enabled" + (f", exporting spans to {jsonl_file_path}" if jsonl_file_path else ""))
+
+    def new_trace_id(self) -> Optional[str]:
+        """
+        :return: A new trace ID, or None while tracing is disabled.
+        """
+        if not self.enabled:
+            return None
+        return uuid4().hex
+
+    def span(self, name: str, trace_id: Optional[str], **attributes):
+        """
+        Time the body of a with statement as a span of the trace.
+        """
+        if not self.enabled or trace_id is None:
+            return NO_SPAN
+        return _ActiveSpan(self, name, trace_id, attributes)
+
+    def record(self, name: str, trace_id: Optional[str], start_epoch: float, end_epoch: Optional[float] = None,
+               **attributes):
+        """
+        Record a span that was timed elsewhere, e.g. across threads.
+        :param end_epoch: Optional. If not specified, the span ends now.
+        """
+        if not self.enabled or trace_id is None:
+            return
+        span = Span(name, trace_id, start_epoch, end_epoch if end_epoch is not None else time.time(), attributes)
+        with self.lock:
+            self.spans.append(span)
+            if self.jsonl_file is not None:
+                self.jsonl_file.write(json.dumps(span.to_dict()) + "\n")
+                self.jsonl_file.flush()
+
+    def get_spans(self, trace_id: Optional[str] = None) -> list[Span]:
+        with self.lock:
+            return [span for span in self.spans if trace_id is None or span.trace_id == trace_id]
+
+    def get_summary(self) -> dict:
+        """
+        :return: The count and p50/p95/p99 durations, in seconds, of each stage's spans in the ring buffer.
+        """
+        durations = {}
+        for span in self.get_spans():
+            durations.setdefault(span.name, []).append(span.duration_seconds)
+        return {name: {"count": len(stage_durations),
+                       "p50_seconds": float(np.percentile(stage_durations, 50)),
+                       "p95_seconds": float(np.percentile(stage_durations, 95)),
+                       "p99_seconds": float(np.percentile(stage_durations, 99))}
+                for name, stage_durations in sorted(durations.items())}
+
+    def log_summary(self):
+        if not self.enabled:
+            return
+        for name, stage_summary in self.get_summary().items():
+            logger.info(f"{name}: {stage_summary['count']} spans, p50 {stage_summary['p50_seconds'] * 1000:.0f} ms, "
+                        f"p95 {stage_summary['p95_seconds'] * 1000:.0f} ms, p99 {stage_summary['p99_seconds'] * 1000:.0f} ms")
+
+
+tracer = Tracer()
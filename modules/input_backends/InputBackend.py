@@ -0,0 +1,26 @@
+from abc import ABC, abstractmethod
+from typing import List, Tuple
+
+
+class InputBackend(ABC):
+    """
+    Sends keyboard and mouse input to the focused window. Keys are identified by their PC scancodes.
+    """
+
+    @abstractmethod
+    def press_key(self, scancode: int):
+        pass
+
+    @abstractmethod
+    def release_key(self, scancode: int):
+        pass
+
+    @abstractmethod
+    def send_mouse_moves(self, moves: List[Tuple[int, int]]):
+        """
+        Send a batch of relative (dx, dy) mouse moves at once.
+        """
+        pass
+
+    def close(self):
+        pass
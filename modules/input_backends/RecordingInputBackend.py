@@ -0,0 +1,73 @@
+import threading
+import time
+from typing import List, Optional, Tuple
+from modules.input_backends.InputBackend import InputBackend
+
+
+class RecordedInput:
+    def __init__(self, timestamp: float, kind: str, scancode: Optional[int] = None, dx: int = 0, dy: int = 0,
+                 batch_index: Optional[int] = None):
+        """
+        :param timestamp: When the input was sent, on the monotonic clock.
+        :param kind: "press", "release" or "move".
+        :param batch_index: The index of the batch of mouse moves the move was sent in.
+        """
+        self.timestamp = timestamp
+        self.kind = kind
+        self.scancode = scancode
+        self.dx = dx
+        self.dy = dy
+        self.batch_index = batch_index
+
+    def __repr__(self):
+        if self.kind == "move":
+            return f"RecordedInput(move, dx={self.dx}, dy={self.dy}, timestamp={self.timestamp:.4f})"
+        return f"RecordedInput({self.kind}, scancode={self.scancode:#04x}, timestamp={self.timestamp:.4f})"
+
+
+class RecordingInputBackend(InputBackend):
+    """
+    Records every input in memory with the time it was sent, instead of sending it. Lets the actions be tested and
+    their gesture timing measured on any platform.
+    """
+    def __init__(self):
+        self.inputs: List[RecordedInput] = []
+        self.num_batches = 0
+        self.lock = threading.Lock()
+
+    def press_key(self, scancode: int):
+        with self.lock:
+            self.inputs.append(RecordedInput(time.monotonic(), "press", scancode=scancode))
+
+    def release_key(self, scancode: int):
+        with self.lock:
+            self.inputs.append(RecordedInput(time.monotonic(), "release", scancode=scancode))
+
+    def send_mouse_moves(self, moves: List[Tuple[int, int]]):
+        timestamp = time.monotonic()
+        with self.lock:
+            self.inputs.extend(RecordedInput(timestamp, "move", dx=dx, dy=dy, batch_index=self.num_batches)
+                               for dx, dy in moves)
+            self.num_batches += 1
+
+    def get_inputs(self, kind: Optional[str] = None) -> List[RecordedInput]:
+        with self.lock:
+            return [recorded_input for recorded_input in self.inputs if kind is None or recorded_input.kind == kind]
+
+    def get_total_motion(self) -> Tuple[int, int]:
+        moves = self.get_inputs("move")
+        return sum(move.dx for move in moves), sum(move.dy for move in moves)
+
+    def get_duration_seconds(self) -> float:
+        """
+        :return: The time from the first recorded input to the last
+        """
+        inputs = self.get_inputs()
+        if not inputs:
+            return 0.0
+        return inputs[-1].timestamp - inputs[0].timestamp
+
+    def clear(self):
+        with self.lock:
+            self.inputs.clear()
+            self.num_batches = 0
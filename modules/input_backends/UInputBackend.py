@@ -0,0 +1,50 @@
+from typing import List, Tuple
+from modules.input_backends.InputBackend import InputBackend
+
+try:
+    import evdev
+except ImportError:
+    # Only available on Linux
+    evdev = None
+
+
+class UInputBackend(InputBackend):
+    """
+    Sends input on Linux through a virtual keyboard and mouse created with uinput, so it works under X11 and
+    Wayland alike. Linux key codes match PC scancodes for the keys the actions use.
+    Needs the evdev package, and write access to /dev/uinput.
+    """
+    DEVICE_NAME = "vr-ai-chatbot"
+
+    def __init__(self):
+        if evdev is None:
+            raise RuntimeError("The uinput input backend needs the evdev package.")
+        capabilities = {
+            evdev.ecodes.EV_KEY: list(evdev.ecodes.keys.keys()) + [evdev.ecodes.BTN_LEFT, evdev.ecodes.BTN_RIGHT],
+            evdev.ecodes.EV_REL: [evdev.ecodes.REL_X, evdev.ecodes.REL_Y],
+        }
+        self.device = evdev.UInput(capabilities, name=self.DEVICE_NAME)
+
+    def _send_key(self, scancode: int, value: int):
+        self.device.write(evdev.ecodes.EV_KEY, scancode, value)
+        self.device.syn()
+
+    def press_key(self, scancode: int):
+        self._send_key(scancode, 1)
+
+    def release_key(self, scancode: int):
+        self._send_key(scancode, 0)
+
+    def send_mouse_moves(self, moves: List[Tuple[int, int]]):
+        """
+        Write a batch of relative mouse moves, each as its own report.
+        """
+        for dx, dy in moves:
+            if dx != 0:
+                self.device.write(evdev.ecodes.EV_REL, evdev.ecodes.REL_X, dx)
+            if dy != 0:
+                self.device.write(evdev.ecodes.EV_REL, evdev.ecodes.REL_Y, dy)
+            self.device.syn()
+
+    def close(self):
+        self.device.close()
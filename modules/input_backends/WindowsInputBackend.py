@@ -0,0 +1,71 @@
+import ctypes
+from typing import List, Tuple
+from modules.input_backends.InputBackend import InputBackend
+
+INPUT_MOUSE = 0
+INPUT_KEYBOARD = 1
+MOUSEEVENTF_MOVE = 0x0001
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_SCANCODE = 0x0008
+
+# C struct redefinitions
+PUL = ctypes.POINTER(ctypes.c_ulong)
+
+class KeyBdInput(ctypes.Structure):
+    _fields_ = [("wVk", ctypes.c_ushort),
+                ("wScan", ctypes.c_ushort),
+                ("dwFlags", ctypes.c_ulong),
+                ("time", ctypes.c_ulong),
+                ("dwExtraInfo", PUL)]
+
+class HardwareInput(ctypes.Structure):
+    _fields_ = [("uMsg", ctypes.c_ulong),
+                ("wParamL", ctypes.c_short),
+                ("wParamH", ctypes.c_ushort)]
+
+class MouseInput(ctypes.Structure):
+    _fields_ = [("dx", ctypes.c_long),
+                ("dy", ctypes.c_long),
+                ("mouseData", ctypes.c_ulong),
+                ("dwFlags", ctypes.c_ulong),
+                ("time", ctypes.c_ulong),
+                ("dwExtraInfo", PUL)]
+
+class Input_I(ctypes.Union):
+    _fields_ = [("ki", KeyBdInput),
+                ("mi", MouseInput),
+                ("hi", HardwareInput)]
+
+class Input(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_ulong),
+                ("ii", Input_I)]
+
+
+class WindowsInputBackend(InputBackend):
+    """
+    Sends input with the Win32 SendInput function.
+    """
+
+    def _send_key(self, scancode: int, flags: int):
+        extra = ctypes.c_ulong(0)
+        ii_ = Input_I()
+        ii_.ki = KeyBdInput(0, scancode, flags, 0, ctypes.pointer(extra))
+        x = Input(ctypes.c_ulong(INPUT_KEYBOARD), ii_)
+        ctypes.windll.user32.SendInput(1, ctypes.pointer(x), ctypes.sizeof(x))
+
+    def press_key(self, scancode: int):
+        self._send_key(scancode, KEYEVENTF_SCANCODE)
+
+    def release_key(self, scancode: int):
+        self._send_key(scancode, KEYEVENTF_SCANCODE | KEYEVENTF_KEYUP)
+
+    def send_mouse_moves(self, moves: List[Tuple[int, int]]):
+        """
+        Send a batch of relative mouse moves in a single SendInput call.
+        """
+        extra = ctypes.c_ulong(0)
+        inputs = (Input * len(moves))()
+        for input_, (dx, dy) in zip(inputs, moves):
+            input_.type = INPUT_MOUSE
+            input_.ii.mi = MouseInput(dx, dy, 0, MOUSEEVENTF_MOVE, 0, ctypes.pointer(extra))
+        ctypes.windll.user32.SendInput(len(moves), inputs, ctypes.sizeof(Input))
@@ -0,0 +1,134 @@
+import json
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+
+def chat_completion_body(text: str) -> str:
+    return json.dumps({
+        "choices": [{"message": {"role": "assistant", "content": text}}],
+        "usage": {"completion_tokens": len(text.split())}
+    })
+
+
+def chat_completion_sse_chunks(text_chunks: List[str]) -> List[str]:
+    events = [json.dumps({"choices": [{"delta": {"role": "assistant"}}]})]
+    events += [json.dumps({"choices": [{"delta": {"content": text_chunk}}]}) for text_chunk in text_chunks]
+    events += ["[DONE]"]
+    return [f"data: {event}\n\n" for event in events]
+
+
+class StubResponse:
+    def __init__(self, status: int = 200, body: str = "", headers: Optional[dict] = None, delay: float = 0,
+                 chunks: Optional[List[str]] = None, chunk_delay: float = 0):
+        """
+        :param chunks: Optional. If set, the body is sent as these chunks with chunked transfer encoding, like a server-sent event stream.
+        :param chunk_delay: Seconds to wait before sending each chunk.
+        """
+        self.status = status
+        self.body = body
+        self.headers = headers or {"Content-Type": "text/event-stream" if chunks is not None else "application/json"}
+        self.delay = delay
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+
+
+class StubRequest:
+    def __init__(self, client_port: int, path: str, body: str):
+        self.client_port = client_port
+        self.path = path
+        self.body = body
+
+
+class StubHTTPServer:
+    """
+    A local HTTP/1.1 server with keep-alive for testing APIClient without network access.
+    Replays the queued responses in order, then the default response, and records every request it receives.
+    """
+    def __init__(self, responses: Optional[List[StubResponse]] = None, default_response: Optional[StubResponse] = None):
+        self.responses = deque(responses or [])
+        self.default_response = default_response or StubResponse(body=chat_completion_body("TYPE_NORMAL Hello there."))
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.server.daemon_threads = True
+        self.server.block_on_close = False
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def num_connections(self) -> int:
+        # Every TCP connection has its own client port
+        return len(set(request.client_port for request in self.requests))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _next_response(self) -> StubResponse:
+        with self.lock:
+            return self.responses.popleft() if self.responses else self.default_response
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                return
+
+            def handle_one_request(self):
+                try:
+                    super().handle_one_request()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the request, e.g. after a timeout
+                    self.close_connection = True
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+                with stub.lock:
+                    stub.requests.append(StubRequest(client_port=self.client_address[1], path=self.path, body=body))
+                response = stub._next_response()
+                if response.delay:
+                    threading.Event().wait(response.delay)
+                if response.chunks is not None:
+                    self.send_chunks(response)
+                    return
+                encoded_body = response.body.encode("utf-8")
+                self.send_response(response.status)
+                for name, value in response.headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(encoded_body)))
+                self.end_headers()
+                self.wfile.write(encoded_body)
+
+            def send_chunks(self, response: StubResponse):
+                self.send_response(response.status)
+                for name, value in response.headers.items():
+                    self.send_header(name, value)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in response.chunks:
+                    if response.chunk_delay:
+                        threading.Event().wait(response.chunk_delay)
+                    encoded_chunk = chunk.encode("utf-8")
+                    self.wfile.write(f"{len(encoded_chunk):X}\r\n".encode("ascii") + encoded_chunk + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
@@ -18,6 +18,11 @@ def test_speak_to_file(text_to_speech: TextToSpeech.TextToSpeech):
     text_to_speech.speak_to_file("Hello, this is a test.", filepath)
     assert os.path.exists(filepath)
 
+def test_synthesize(text_to_speech: TextToSpeech.TextToSpeech):
+    audio_buffer = text_to_speech.synthesize("Hello, this is a test.")
+    assert audio_buffer.num_frames > 0
+    assert audio_buffer.duration_seconds > 0.5
+
 def test_speak_on_output_device(text_to_speech: TextToSpeech.TextToSpeech, py_audio_wrapper: PyAudioWrapper.PyAudioWrapper):
     audio_devices = py_audio_wrapper.get_audio_devices()
     assert len(audio_devices.audio_devices) > 0
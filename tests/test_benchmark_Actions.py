@@ -0,0 +1,94 @@
+from modules.Actions import Actions
+from modules.input_backends.RecordingInputBackend import RecordingInputBackend
+from modules.WindowFocusTracker import WindowFocusTracker
+from modules.helpers.logging_helper import logger
+import heapq
+import os
+import pytest
+import time
+
+# Compares wall-clock and CPU time, which is noisy on a loaded machine, so it only runs when this is set
+RUN_ENV_VAR = "RUN_ACTIONS_BENCHMARK"
+IDLE_SECONDS = 2.0
+# Gestures and the total time they're asked to take
+GESTURE_DURATIONS = {
+    "nod_head": 0.08,
+    "shake_head": 0.08,
+    "turn_right": 0.5,
+}
+
+
+class FakeActions(Actions):
+    """
+    Records its input instead of sending it, and the window is always focused.
+    """
+    def __init__(self, max_poll_interval_seconds: float = WindowFocusTracker.MAX_POLL_INTERVAL_SECONDS):
+        self.recording_input_backend = RecordingInputBackend()
+        window_focus_tracker = WindowFocusTracker(window_title="Fake", get_active_window_title=lambda: "Fake",
+                                                  use_event_hook=False,
+                                                  max_poll_interval_seconds=max_poll_interval_seconds)
+        super().__init__(window_title="Fake", input_backend=self.recording_input_backend,
+                         window_focus_tracker=window_focus_tracker)
+
+
+class PollingActions(FakeActions):
+    """
+    The actions as they were before they waited on a condition and focus changes: the queue is polled every
+    millisecond, and the focus every 10 ms.
+    """
+    def __init__(self):
+        super().__init__(max_poll_interval_seconds=WindowFocusTracker.MIN_POLL_INTERVAL_SECONDS)
+
+    def _execute_actions(self):
+        while not self.closed.is_set():
+            if self.window_is_focused:
+                while self.action_queue and self.window_is_focused:
+                    _, _, queued_action = heapq.heappop(self.action_queue)
+                    self.running_actions.append(queued_action)
+                    self._perform(queued_action)
+                    self._finish_action(queued_action)
+            else:
+                self.action_queue.clear()
+            time.sleep(0.001)
+
+
+def measure_idle_cpu_seconds(actions: FakeActions) -> (float, int):
+    """
+    Measure the CPU time the process uses while the actions are idle, with the window focused.
+    :return: The CPU time, and the number of times the focus was checked
+    """
+    actions.start()
+    try:
+        start = time.process_time()
+        num_checks_at_start = actions.window_focus_tracker.num_checks
+        time.sleep(IDLE_SECONDS)
+        return time.process_time() - start, actions.window_focus_tracker.num_checks - num_checks_at_start
+    finally:
+        actions.close()
+
+
+@pytest.mark.skipif(not os.environ.get(RUN_ENV_VAR), reason=f"Set {RUN_ENV_VAR}=1 to run the actions benchmark")
+def test_benchmark_idle_cpu():
+    polling_cpu_seconds, polling_num_checks = measure_idle_cpu_seconds(PollingActions())
+    event_driven_cpu_seconds, event_driven_num_checks = measure_idle_cpu_seconds(FakeActions())
+    logger.info(f"Idle over {IDLE_SECONDS:.0f} s: polling {polling_cpu_seconds * 1000:.0f} ms CPU and "
+                f"{polling_num_checks} focus checks, event-driven {event_driven_cpu_seconds * 1000:.0f} ms CPU and "
+                f"{event_driven_num_checks} focus checks")
+    assert event_driven_cpu_seconds < polling_cpu_seconds
+    assert event_driven_num_checks < polling_num_checks / 5
+
+
+@pytest.mark.skipif(not os.environ.get(RUN_ENV_VAR), reason=f"Set {RUN_ENV_VAR}=1 to run the actions benchmark")
+def test_benchmark_gesture_timing():
+    actions = FakeActions()
+    for gesture, requested_seconds in GESTURE_DURATIONS.items():
+        actions.recording_input_backend.clear()
+        start = time.monotonic()
+        getattr(actions, gesture)()
+        elapsed_seconds = time.monotonic() - start
+        num_moves = len(actions.recording_input_backend.get_inputs("move"))
+        num_batches = actions.recording_input_backend.num_batches
+        logger.info(f"{gesture}: requested {requested_seconds * 1000:.0f} ms, took {elapsed_seconds * 1000:.0f} ms, "
+                    f"{num_moves} moves in {num_batches} batches")
+        # Each of a gesture's motions may overrun by up to a frame
+        assert elapsed_seconds < requested_seconds + 0.05
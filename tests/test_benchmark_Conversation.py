@@ -0,0 +1,49 @@
+from modules.OpenAIAPIClient import Conversation
+from modules.helpers.logging_helper import logger
+import os
+import pytest
+import time
+
+# Compares timings, which is noisy on a loaded machine, so it only runs when this is set
+RUN_ENV_VAR = "RUN_CONVERSATION_BENCHMARK"
+
+MODEL = "gpt-3.5-turbo"
+PROMPT_TOKENS = 10
+NUM_TURNS = 1000
+HISTORY_LENGTHS = [10, 100, 1000, 10000]
+
+
+def measure_per_turn_seconds(history_length: int) -> float:
+    """
+    Fill a conversation with history_length dialogues, then time turns that each trim the history and add a dialogue.
+    The token limit is set so every turn evicts exactly one dialogue, i.e. the history stays at its full length.
+    """
+    conversation = Conversation(max_length=history_length + 1, model=MODEL)
+    for _ in range(history_length):
+        conversation.add("prompt", "response", prompt_num_tokens=5, response_num_tokens=5)
+    dialogue_message_tokens = conversation.dialogues[0].num_message_tokens
+    token_limit = history_length * dialogue_message_tokens + PROMPT_TOKENS + 1
+
+    start = time.perf_counter()
+    for _ in range(NUM_TURNS):
+        conversation.trim(prompt_tokens=PROMPT_TOKENS, token_limit=token_limit)
+        conversation.add("prompt", "response", prompt_num_tokens=5, response_num_tokens=5)
+    per_turn_seconds = (time.perf_counter() - start) / NUM_TURNS
+
+    assert len(conversation.dialogues) == history_length + 1
+    return per_turn_seconds
+
+
+@pytest.mark.skipif(not os.environ.get(RUN_ENV_VAR), reason=f"Set {RUN_ENV_VAR}=1 to run the conversation benchmark")
+def test_benchmark_conversation_trim_per_turn_cost_is_flat():
+    # Warm up the tokenizer registry and the interpreter before timing
+    measure_per_turn_seconds(HISTORY_LENGTHS[0])
+
+    per_turn_seconds = {}
+    for history_length in HISTORY_LENGTHS:
+        # Take the best of a few runs to keep scheduler noise out of the comparison
+        per_turn_seconds[history_length] = min(measure_per_turn_seconds(history_length) for _ in range(3))
+        logger.info(f"{history_length:>6} dialogues: {per_turn_seconds[history_length] * 1e6:.2f} us per turn")
+
+    # A full re-sum per trim would make 10,000 dialogues ~1000x slower than 10 dialogues
+    assert per_turn_seconds[HISTORY_LENGTHS[-1]] < per_turn_seconds[HISTORY_LENGTHS[0]] * 5
@@ -0,0 +1,79 @@
+from modules.SpeechToText import SpeechToText
+from modules.enums.OverflowPolicyEnum import OverflowPolicyEnum
+from modules.helpers.logging_helper import logger
+import numpy as np
+import os
+import pytest
+import speech_recognition as sr
+import threading
+import time
+import wave
+
+# Runs real Sphinx on pools of up to 8 worker processes, which takes a while, so it only runs when this is set
+RUN_ENV_VAR = "RUN_STT_BENCHMARK"
+# Set to a directory of WAV files to benchmark real speech, otherwise noise fixtures are generated
+WAV_DIRECTORY_ENV_VAR = "STT_BENCHMARK_WAV_DIR"
+WORKER_COUNTS = [1, 2, 4, 8]
+NUM_GENERATED_FIXTURES = 8
+GENERATED_FIXTURE_SECONDS = 2
+SAMPLE_RATE = 16000
+
+
+def generate_wav_fixtures(directory: str) -> str:
+    rng = np.random.default_rng(0)
+    for index in range(NUM_GENERATED_FIXTURES):
+        samples = rng.normal(0, 3000, SAMPLE_RATE * GENERATED_FIXTURE_SECONDS).astype(np.int16)
+        with wave.open(os.path.join(directory, f"fixture_{index}.wav"), "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(SAMPLE_RATE)
+            wav_file.writeframes(samples.tobytes())
+    return directory
+
+
+def load_wav_fixtures(directory: str) -> list[sr.AudioData]:
+    recognizer = sr.Recognizer()
+    audio_chunks = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.lower().endswith(".wav"):
+            with sr.AudioFile(os.path.join(directory, filename)) as source:
+                audio_chunks.append(recognizer.record(source))
+    return audio_chunks
+
+
+def measure_transcription_seconds(audio_chunks: list[sr.AudioData], num_workers: int) -> float:
+    """
+    Time transcribing all the chunks with Sphinx on num_workers worker processes, including starting the workers.
+    """
+    speech_to_text = SpeechToText(max_buffered_audio_chunks=len(audio_chunks),
+                                  max_transcriptions=len(audio_chunks),
+                                  transcription_overflow_policy=OverflowPolicyEnum.BLOCK,
+                                  num_transcription_workers=num_workers,
+                                  use_worker_processes=True)
+    start = time.perf_counter()
+    for audio_chunk in audio_chunks:
+        speech_to_text.enqueue_audio(audio_chunk)
+    threading.Thread(target=speech_to_text.start_transcription, daemon=True).start()
+    threading.Thread(target=speech_to_text.collect_transcriptions, daemon=True).start()
+    transcription_records = [speech_to_text.transcription.get(timeout=600) for _ in audio_chunks]
+    elapsed_seconds = time.perf_counter() - start
+    speech_to_text.stop()
+
+    assert [record.sequence_number for record in transcription_records] == list(range(len(audio_chunks)))
+    assert [record.audio_data for record in transcription_records] == audio_chunks
+    return elapsed_seconds
+
+
+@pytest.mark.skipif(not os.environ.get(RUN_ENV_VAR), reason=f"Set {RUN_ENV_VAR}=1 to run the transcription benchmark")
+def test_benchmark_parallel_transcription(tmp_path):
+    wav_directory = os.environ.get(WAV_DIRECTORY_ENV_VAR) or generate_wav_fixtures(str(tmp_path))
+    audio_chunks = load_wav_fixtures(wav_directory)
+
+    elapsed_seconds = {}
+    for num_workers in WORKER_COUNTS:
+        elapsed_seconds[num_workers] = measure_transcription_seconds(audio_chunks, num_workers)
+        logger.info(f"{num_workers} workers: {elapsed_seconds[num_workers]:.2f} s for {len(audio_chunks)} chunks")
+
+    # Only expect a speedup when there are cores to run the workers on
+    if (os.cpu_count() or 1) >= 4:
+        assert elapsed_seconds[4] < elapsed_seconds[1]
@@ -0,0 +1,79 @@
+from modules.VoiceActivityDetector import VoiceActivityDetector
+from modules.helpers.logging_helper import logger
+import numpy as np
+import os
+import pytest
+import speech_recognition as sr
+import time
+import wave
+
+# Asserts on CPU time, which is noisy on a loaded machine, so it only runs when this is set
+RUN_ENV_VAR = "RUN_VAD_BENCHMARK"
+# Set to a directory of 16-bit mono WAV files to benchmark recorded speech, otherwise fixtures are generated
+WAV_DIRECTORY_ENV_VAR = "VAD_BENCHMARK_WAV_DIR"
+SAMPLE_RATE = 16000
+NUM_GENERATED_FIXTURES = 4
+# The PyAudio buffer size Microphone reads
+CHUNK_SIZE_BYTES = 1024 * 2
+
+
+def generate_wav_fixtures(directory: str) -> str:
+    """
+    Write fixtures of noisy-lobby background with bursts of voiced sound of varying length.
+    """
+    rng = np.random.default_rng(0)
+    for index in range(NUM_GENERATED_FIXTURES):
+        spans = []
+        for _ in range(5):
+            spans.append(rng.normal(0, 80, int(SAMPLE_RATE * rng.uniform(0.5, 2.0))))
+            num_samples = int(SAMPLE_RATE * rng.uniform(0.5, 3.0))
+            t = np.arange(num_samples) / SAMPLE_RATE
+            # Harmonics of a wavering pitch, amplitude-modulated at a syllable rate
+            pitch = 150 + 30 * np.sin(2 * np.pi * 0.5 * t)
+            voiced = sum(np.sin(2 * np.pi * harmonic * np.cumsum(pitch) / SAMPLE_RATE) / harmonic for harmonic in range(1, 6))
+            envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+            spans.append(voiced * envelope * 5000 + rng.normal(0, 80, num_samples))
+        spans.append(rng.normal(0, 80, SAMPLE_RATE))
+        with wave.open(os.path.join(directory, f"fixture_{index}.wav"), "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(SAMPLE_RATE)
+            wav_file.writeframes(np.concatenate(spans).astype(np.int16).tobytes())
+    return directory
+
+
+def load_wav_fixtures(directory: str) -> list[tuple[bytes, int]]:
+    fixtures = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.lower().endswith(".wav"):
+            with wave.open(os.path.join(directory, filename), "rb") as wav_file:
+                fixtures.append((wav_file.readframes(wav_file.getnframes()), wav_file.getframerate()))
+    return fixtures
+
+
+@pytest.mark.skipif(not os.environ.get(RUN_ENV_VAR), reason=f"Set {RUN_ENV_VAR}=1 to run the voice activity detector benchmark")
+def test_benchmark_voice_activity_detector(tmp_path):
+    wav_directory = os.environ.get(WAV_DIRECTORY_ENV_VAR) or generate_wav_fixtures(str(tmp_path))
+    fixtures = load_wav_fixtures(wav_directory)
+
+    latencies = []
+    cpu_seconds = 0.0
+    audio_seconds = 0.0
+    for pcm, sample_rate in fixtures:
+        voice_activity_detector = VoiceActivityDetector(sample_rate=sample_rate)
+        start = time.process_time()
+        for offset in range(0, len(pcm), CHUNK_SIZE_BYTES):
+            for segment in voice_activity_detector.process(pcm[offset:offset + CHUNK_SIZE_BYTES]):
+                latencies.append(segment.detected_seconds - segment.end_seconds)
+        cpu_seconds += time.process_time() - start
+        audio_seconds += len(pcm) / 2 / sample_rate
+
+    cpu_per_audio_second = cpu_seconds / audio_seconds
+    logger.info(f"{len(latencies)} segments in {audio_seconds:.1f} s of audio")
+    logger.info(f"End-of-speech latency: mean {np.mean(latencies) * 1000:.0f} ms, max {np.max(latencies) * 1000:.0f} ms")
+    logger.info(f"CPU: {cpu_per_audio_second * 1000:.2f} ms per second of audio")
+
+    assert len(latencies) > 0
+    # Recognizer.listen waits for pause_threshold seconds of silence before returning
+    assert np.max(latencies) < sr.Recognizer().pause_threshold
+    assert cpu_per_audio_second < 0.05
@@ -1,4 +1,5 @@
 from modules.Config import Config
+from modules.RetryPolicy import RetryPolicy
 from modules.OpenAIAPIClient import APIClient, ConversationContainer, Conversation, Dialogue, get_num_tokens_from_string
 import os
 import pytest
@@ -17,6 +18,13 @@ def api_client():
                      temperature=config.temperature,
                      conversation_prune_after_seconds=config.conversation_prune_after_seconds,
                      max_dialogues_per_conversation=config.max_dialogues_per_conversation,
+                     max_retained_conversation_tokens=config.max_retained_conversation_tokens,
+                     pool_size=config.pool_size,
+                     connect_timeout=config.connect_timeout,
+                     read_timeout=config.read_timeout,
+                     pre_connect=config.pre_connect,
+                     retry_policy=RetryPolicy(max_attempts=config.max_attempts,
+                                              deadline_seconds=config.request_deadline_seconds),
                      system_message=config.system_message,
                      forced_system_message=config.forced_system_message
                      )
@@ -0,0 +1,152 @@
+from concurrent.futures import CancelledError
+from modules import Actions as actions_module
+from modules.Actions import Actions, W, create_default_input_backend
+from modules.CancellationToken import CancellationToken
+from modules.enums.ActionEnum import ActionEnum
+from modules.input_backends.RecordingInputBackend import RecordingInputBackend
+from modules.WindowFocusTracker import WindowFocusTracker
+import pytest
+import threading
+import time
+
+
+class FakeActions(Actions):
+    """
+    Records its input instead of sending it. The window is focused until active_window_title is changed.
+    """
+    def __init__(self):
+        self.recording_input_backend = RecordingInputBackend()
+        self.active_window_title = "Fake"
+        window_focus_tracker = WindowFocusTracker(window_title="Fake",
+                                                  get_active_window_title=lambda: self.active_window_title,
+                                                  use_event_hook=False)
+        super().__init__(window_title="Fake", input_backend=self.recording_input_backend,
+                         window_focus_tracker=window_focus_tracker)
+
+
+@pytest.fixture
+def actions():
+    actions = FakeActions()
+    actions.start()
+    yield actions
+    actions.close()
+
+
+def test_enqueued_action_completes_its_future(actions: FakeActions):
+    future = actions.enqueue_action(ActionEnum.NOD_HEAD)
+    assert future.result(timeout=5) is None
+    moves = actions.recording_input_backend.get_inputs("move")
+    assert moves[0].dy < 0 and moves[-1].dy < 0
+    assert actions.recording_input_backend.get_total_motion() == (0, 0)
+    assert actions.wait_for_action_to_finish(timeout=5)
+
+
+def test_actions_are_performed_in_order(actions: FakeActions):
+    futures = [actions.enqueue_action(ActionEnum.TURN_LEFT), actions.enqueue_action(ActionEnum.TURN_RIGHT)]
+    for future in futures:
+        future.result(timeout=5)
+    moves = actions.recording_input_backend.get_inputs("move")
+    assert moves[0].dx < 0 and moves[-1].dx > 0
+
+
+def test_cancel_all_returns_right_away(actions: FakeActions):
+    ongoing = actions.enqueue_action(ActionEnum.TURN_RIGHT_UNTIL_STOP_FLAG)
+    queued = actions.enqueue_action(ActionEnum.TURN_LEFT)
+    while not actions.action_is_ongoing:
+        time.sleep(0.001)
+    start = time.monotonic()
+    actions.cancel_all()
+    assert time.monotonic() - start < 0.01
+    with pytest.raises(CancelledError):
+        queued.result(timeout=5)
+    with pytest.raises(CancelledError):
+        ongoing.result(timeout=5)
+    assert actions.wait_for_action_to_finish(timeout=5)
+    assert actions.enqueue_action(ActionEnum.NOD_HEAD).result(timeout=5) is None
+
+
+def test_cancellation_token_stops_running_action(actions: FakeActions):
+    cancellation_token = CancellationToken()
+    future = actions.enqueue_action(ActionEnum.TURN_RIGHT, cancellation_token=cancellation_token)
+    threading.Timer(0.1, cancellation_token.cancel).start()
+    start = time.monotonic()
+    with pytest.raises(CancelledError):
+        future.result(timeout=5)
+    # Stopped within a frame or so, instead of after the whole turn
+    assert time.monotonic() - start < 0.15
+    assert actions.recording_input_backend.get_total_motion()[0] < 1000
+
+
+def test_actions_run_in_priority_order():
+    actions = FakeActions()
+    performed = []
+    for action in [ActionEnum.TURN_LEFT_RANDOMLY, ActionEnum.TURN_LEFT, ActionEnum.NOD_HEAD, ActionEnum.SHAKE_HEAD]:
+        actions.enqueue_action(action).add_done_callback(lambda _, action=action: performed.append(action))
+    actions.start()
+    try:
+        actions.wait_for_action_to_finish(timeout=5)
+        while len(performed) < 4:
+            time.sleep(0.001)
+    finally:
+        actions.close()
+    assert performed == [ActionEnum.NOD_HEAD, ActionEnum.SHAKE_HEAD, ActionEnum.TURN_LEFT, ActionEnum.TURN_LEFT_RANDOMLY]
+
+
+def test_gesture_interleaves_with_locomotion(actions: FakeActions):
+    locomotion = actions.enqueue_action(ActionEnum.MOVE_FORWARD_UNTIL_STOP_FLAG)
+    while not actions.recording_input_backend.get_inputs("press"):
+        time.sleep(0.001)
+    start = time.monotonic()
+    actions.enqueue_action(ActionEnum.NOD_HEAD).result(timeout=5)
+    # The nod didn't wait for the walk to end
+    assert time.monotonic() - start < 0.2
+    assert not locomotion.done()
+    # The nod happened while the key was held
+    assert [recorded_input.kind for recorded_input in actions.recording_input_backend.get_inputs()][:2] == \
+           ["press", "move"]
+
+    actions.cancel_all()
+    with pytest.raises(CancelledError):
+        locomotion.result(timeout=5)
+    assert actions.recording_input_backend.get_inputs()[-1].kind == "release"
+
+
+def test_actions_are_cancelled_while_window_is_unfocused(actions: FakeActions):
+    actions.active_window_title = "Another window"
+    while actions.window_is_focused:
+        time.sleep(0.001)
+    with pytest.raises(CancelledError):
+        actions.enqueue_action(ActionEnum.NOD_HEAD).result(timeout=5)
+    assert actions.recording_input_backend.get_inputs() == []
+
+
+def test_failed_action_fails_its_future(actions: FakeActions):
+    actions.shake_head = lambda: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        actions.enqueue_action(ActionEnum.SHAKE_HEAD).result(timeout=5)
+    # The action thread keeps going
+    assert actions.enqueue_action(ActionEnum.NOD_HEAD).result(timeout=5) is None
+
+
+def test_key_is_held_for_the_duration():
+    actions = FakeActions()
+    actions.move_forward(duration=0.1)
+    press, release = actions.recording_input_backend.get_inputs()
+    assert (press.kind, press.scancode, release.kind, release.scancode) == ("press", W, "release", W)
+    assert release.timestamp - press.timestamp >= 0.1
+
+
+def test_move_mouse_sends_batched_moves():
+    actions = FakeActions()
+    actions.turn_right()
+    assert actions.recording_input_backend.get_total_motion() == (1000, 0)
+    assert actions.recording_input_backend.num_batches < 100
+
+
+def test_default_input_backend_falls_back_to_recording_without_uinput(monkeypatch):
+    def fail():
+        raise PermissionError("/dev/uinput")
+
+    monkeypatch.setattr(actions_module.sys, "platform", "linux")
+    monkeypatch.setattr(actions_module, "UInputBackend", fail)
+    assert isinstance(create_default_input_backend(), RecordingInputBackend)
@@ -0,0 +1,55 @@
+from modules.AsyncAPIClient import AsyncAPIClient
+from modules.RetryPolicy import RetryPolicy
+from stub_http_server import StubHTTPServer, StubResponse, chat_completion_body, chat_completion_sse_chunks
+import asyncio
+import json
+
+PROMPT = "What is 9 plus 10?"
+MODEL = "gpt-3.5-turbo"
+
+
+def make_stub_api_client(server: StubHTTPServer) -> AsyncAPIClient:
+    return AsyncAPIClient(base_url=server.url, path="/v1/chat/completions", api_key="test", model=MODEL,
+                          max_conversation_tokens=4096, max_response_tokens=256, max_dialogues_per_conversation=5,
+                          conversation_prune_after_seconds=60, temperature=0.5,
+                          retry_policy=RetryPolicy(max_attempts=3, initial_delay=0.01))
+
+
+def test_send_prompt_async_does_not_block_the_event_loop():
+    async def run(api_client: AsyncAPIClient):
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        response = await api_client.send_prompt_async(prompt=PROMPT, conversation_id="test")
+        ticker.cancel()
+        return response, ticks
+
+    with StubHTTPServer(default_response=StubResponse(body=chat_completion_body("TYPE_NORMAL 19."), delay=0.3)) as server:
+        api_client = make_stub_api_client(server)
+        response, ticks = asyncio.run(run(api_client))
+        api_client.close()
+    assert response == "TYPE_NORMAL 19."
+    # The ticker kept running while the request was in flight
+    assert ticks >= 10
+    assert api_client.prompt_histories.get_conversation("test").dialogues[0].response == "TYPE_NORMAL 19."
+
+
+def test_stream_prompt_async_retries_and_yields_chunks():
+    async def run(api_client: AsyncAPIClient):
+        return [text_chunk async for text_chunk in api_client.stream_prompt_async(prompt=PROMPT, conversation_id="test")]
+
+    responses = [StubResponse(status=503, body=json.dumps({"error": {"message": "overloaded"}})),
+                 StubResponse(chunks=chat_completion_sse_chunks(["TYPE_NO", " No", "."]), chunk_delay=0.01)]
+    with StubHTTPServer(responses=responses) as server:
+        api_client = make_stub_api_client(server)
+        text_chunks = asyncio.run(run(api_client))
+        api_client.close()
+    assert text_chunks == ["TYPE_NO", " No", "."]
+    assert len(server.requests) == 2
+    assert api_client.prompt_histories.get_conversation("test").dialogues[0].response == "TYPE_NO No."
@@ -0,0 +1,47 @@
+from modules.AudioBuffer import AudioBuffer
+
+
+def make_audio_buffer(num_frames: int) -> AudioBuffer:
+    # 16-bit stereo, with each frame's samples set to its index
+    pcm = b"".join(i.to_bytes(2, "little") * 2 for i in range(num_frames))
+    return AudioBuffer(pcm=pcm, sample_width=2, channels=2, frame_rate=22050)
+
+
+def test_audio_buffer_format():
+    audio_buffer = make_audio_buffer(22050)
+    assert audio_buffer.frame_size == 4
+    assert audio_buffer.num_frames == 22050
+    assert audio_buffer.duration_seconds == 1.0
+
+
+def test_audio_buffer_iter_chunks_slices_without_copying():
+    audio_buffer = make_audio_buffer(2500)
+    chunks = list(audio_buffer.iter_chunks(frames_per_chunk=1024))
+    assert [len(chunk) for chunk in chunks] == [4096, 4096, 1808]
+    assert all(isinstance(chunk, memoryview) and chunk.obj is audio_buffer.pcm for chunk in chunks)
+    assert b"".join(chunks) == audio_buffer.pcm
+
+
+def test_audio_buffer_wav_round_trip():
+    audio_buffer = make_audio_buffer(100)
+    round_tripped = AudioBuffer.from_wav_bytes(audio_buffer.to_wav_bytes())
+    assert round_tripped.pcm == audio_buffer.pcm
+    assert (round_tripped.sample_width, round_tripped.channels, round_tripped.frame_rate) == (2, 2, 22050)
+
+
+def test_audio_buffer_convert_sample_width_and_channels():
+    audio_buffer = AudioBuffer(pcm=(16384).to_bytes(2, "little", signed=True) + (-16384).to_bytes(2, "little", signed=True),
+                               sample_width=2, channels=2, frame_rate=22050)
+    mono = audio_buffer.convert(sample_width=2, channels=1, frame_rate=22050)
+    assert mono.pcm == (0).to_bytes(2, "little")
+    eight_bit = audio_buffer.convert(sample_width=1, channels=2, frame_rate=22050)
+    assert eight_bit.pcm == bytes([192, 64])
+    assert audio_buffer.convert(sample_width=2, channels=2, frame_rate=22050) is audio_buffer
+
+
+def test_audio_buffer_convert_frame_rate():
+    audio_buffer = make_audio_buffer(22050)
+    resampled = audio_buffer.convert(sample_width=2, channels=2, frame_rate=44100)
+    assert resampled.num_frames == 44100
+    assert abs(resampled.duration_seconds - audio_buffer.duration_seconds) < 1e-6
+    assert (resampled.sample_width, resampled.channels, resampled.frame_rate) == (2, 2, 44100)
@@ -0,0 +1,65 @@
+from modules.AudioBuffer import AudioBuffer
+from modules.AudioCache import AudioCache
+import os
+import time
+
+
+def make_audio_buffer(num_bytes: int) -> AudioBuffer:
+    return AudioBuffer(pcm=b"\x01" * num_bytes, sample_width=2, channels=1, frame_rate=22050)
+
+
+def test_audio_cache_key_depends_on_voice_settings():
+    key = AudioCache.get_key(text="Goodbye", voice="voice-a", rate=200, volume=1.0)
+    assert key == AudioCache.get_key(text="Goodbye", voice="voice-a", rate=200, volume=1.0)
+    assert key != AudioCache.get_key(text="Goodbye", voice="voice-b", rate=200, volume=1.0)
+    assert key != AudioCache.get_key(text="Goodbye", voice="voice-a", rate=150, volume=1.0)
+    assert key != AudioCache.get_key(text="Goodbye!", voice="voice-a", rate=200, volume=1.0)
+
+
+def test_audio_cache_evicts_least_recently_used_over_budget():
+    audio_cache = AudioCache(max_bytes=300)
+    audio_cache.put("a", make_audio_buffer(100))
+    audio_cache.put("b", make_audio_buffer(100))
+    audio_cache.put("c", make_audio_buffer(100))
+    assert audio_cache.get("a") is not None
+    audio_cache.put("d", make_audio_buffer(100))
+    assert audio_cache.get("b") is None
+    assert list(audio_cache.entries) == ["c", "a", "d"]
+    assert audio_cache.num_bytes == 300
+    assert (audio_cache.hits, audio_cache.misses) == (1, 1)
+
+
+def test_audio_cache_skips_audio_larger_than_budget():
+    audio_cache = AudioCache(max_bytes=100)
+    audio_cache.put("a", make_audio_buffer(200))
+    assert audio_cache.get("a") is None
+    assert audio_cache.num_bytes == 0
+
+
+def test_audio_cache_disk_tier(tmp_path):
+    audio_buffer = make_audio_buffer(100)
+    AudioCache(directory=str(tmp_path)).put("a", audio_buffer)
+
+    # A new cache, e.g. after a restart, loads the audio from disk
+    audio_cache = AudioCache(directory=str(tmp_path))
+    cached_audio_buffer = audio_cache.get("a")
+    assert cached_audio_buffer.pcm == audio_buffer.pcm
+    assert "a" in audio_cache.entries
+
+
+def test_audio_cache_disk_tier_evicts_least_recently_used_over_budget(tmp_path):
+    wav_num_bytes = len(make_audio_buffer(100).to_wav_bytes())
+    audio_cache = AudioCache(directory=str(tmp_path), max_disk_bytes=wav_num_bytes * 3)
+    for key in ["a", "b", "c"]:
+        audio_cache.put(key, make_audio_buffer(100))
+    assert audio_cache.get("a") is not None
+    audio_cache.put("d", make_audio_buffer(100))
+    assert sorted(os.listdir(tmp_path)) == ["a.wav", "c.wav", "d.wav"]
+    assert audio_cache.num_disk_bytes == wav_num_bytes * 3
+
+    # A new cache with a smaller budget evicts the oldest files first, by modification time
+    for age_seconds, key in [(30, "c"), (20, "a"), (10, "d")]:
+        os.utime(tmp_path / f"{key}.wav", (time.time() - age_seconds, time.time() - age_seconds))
+    audio_cache = AudioCache(directory=str(tmp_path), max_disk_bytes=wav_num_bytes * 2)
+    assert sorted(os.listdir(tmp_path)) == ["a.wav", "d.wav"]
+    assert audio_cache.get("c") is None
@@ -0,0 +1,85 @@
+from concurrent.futures import CancelledError
+import pytest
+import threading
+from modules.AudioBuffer import AudioBuffer
+from modules.AudioDevice import AudioDevice
+from modules.AudioPlayer import AudioPlayer
+
+
+class FakeStream:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.written = []
+        self.is_closed = False
+
+    def write(self, frames):
+        self.written.append(bytes(frames))
+
+    def stop_stream(self):
+        return
+
+    def close(self):
+        self.is_closed = True
+
+
+class FakePyAudio:
+    def __init__(self):
+        self.streams = []
+
+    @staticmethod
+    def get_format_from_width(width):
+        return width
+
+    def open(self, **kwargs):
+        stream = FakeStream(**kwargs)
+        self.streams.append(stream)
+        return stream
+
+
+class FakePyAudioWrapper:
+    def __init__(self):
+        self.audio = FakePyAudio()
+
+
+def make_audio_buffer(num_frames: int, channels: int = 1, frame_rate: int = 22050) -> AudioBuffer:
+    return AudioBuffer(pcm=b"\x01\x00" * num_frames * channels, sample_width=2, channels=channels, frame_rate=frame_rate)
+
+
+def test_audio_player_keeps_stream_open_between_utterances():
+    py_audio_wrapper = FakePyAudioWrapper()
+    audio_player = AudioPlayer(py_audio_wrapper)
+    audio_device = AudioDevice(device_name="cable-a", device_index=3, is_input=True)
+    futures = [audio_player.enqueue(make_audio_buffer(2048), audio_device) for _ in range(3)]
+    for future in futures:
+        future.result(timeout=5)
+    assert len(py_audio_wrapper.audio.streams) == 1
+    stream = py_audio_wrapper.audio.streams[0]
+    assert stream.kwargs["output_device_index"] == 3
+    assert len(stream.written) == 6
+    audio_player.close()
+    assert stream.is_closed
+
+
+def test_audio_player_converts_to_open_stream_format():
+    py_audio_wrapper = FakePyAudioWrapper()
+    audio_player = AudioPlayer(py_audio_wrapper)
+    audio_device = AudioDevice(device_name="cable-a", device_index=3, is_input=True)
+    audio_player.play(make_audio_buffer(1000), audio_device)
+    audio_player.play(make_audio_buffer(1000, channels=2, frame_rate=44100), audio_device)
+    assert len(py_audio_wrapper.audio.streams) == 1
+    stream = py_audio_wrapper.audio.streams[0]
+    # The stereo 44.1 kHz buffer was converted to the stream's mono 22.05 kHz
+    assert len(b"".join(stream.written)) == 2000 + 1000
+
+
+def test_audio_player_stops_cancelled_audio():
+    py_audio_wrapper = FakePyAudioWrapper()
+    audio_player = AudioPlayer(py_audio_wrapper)
+    audio_device = AudioDevice(device_name="cable-a", device_index=3, is_input=True)
+    cancel_event = threading.Event()
+    cancel_event.set()
+    future = audio_player.enqueue(make_audio_buffer(2048), audio_device, cancel_event=cancel_event)
+    with pytest.raises(CancelledError):
+        future.result(timeout=5)
+    audio_player.play(make_audio_buffer(2048), audio_device)
+    assert len(py_audio_wrapper.audio.streams[0].written) == 2
@@ -0,0 +1,59 @@
+from modules.BoundedQueue import BoundedQueue
+from modules.enums.OverflowPolicyEnum import OverflowPolicyEnum
+import pytest
+import queue
+import threading
+import time
+
+
+def test_drop_oldest():
+    bounded_queue = BoundedQueue(2, OverflowPolicyEnum.DROP_OLDEST)
+    assert all(bounded_queue.put(item) for item in [1, 2, 3])
+    assert bounded_queue.depth == 2
+    assert bounded_queue.num_dropped == 1
+    assert [bounded_queue.get_nowait(), bounded_queue.get_nowait()] == [2, 3]
+
+
+def test_drop_newest():
+    bounded_queue = BoundedQueue(2, OverflowPolicyEnum.DROP_NEWEST)
+    assert [bounded_queue.put(item) for item in [1, 2, 3]] == [True, True, False]
+    assert bounded_queue.num_dropped == 1
+    assert [bounded_queue.get_nowait(), bounded_queue.get_nowait()] == [1, 2]
+
+
+def test_dropped_and_cleared_items_are_handed_back():
+    dropped_items = []
+    bounded_queue = BoundedQueue(2, OverflowPolicyEnum.DROP_OLDEST, on_drop=dropped_items.append)
+    for item in [1, 2, 3, 4]:
+        bounded_queue.put(item)
+    assert dropped_items == [1, 2]
+    assert bounded_queue.clear() == [3, 4]
+    assert not bounded_queue
+
+    bounded_queue = BoundedQueue(1, OverflowPolicyEnum.DROP_NEWEST, on_drop=dropped_items.append)
+    bounded_queue.put(5)
+    assert not bounded_queue.put(6)
+    assert dropped_items == [1, 2, 6]
+
+
+def test_block_waits_for_room():
+    bounded_queue = BoundedQueue(1, OverflowPolicyEnum.BLOCK)
+    bounded_queue.put(1)
+    assert not bounded_queue.put(2, timeout=0.05)
+    assert bounded_queue.num_dropped == 1
+
+    threading.Timer(0.05, bounded_queue.get).start()
+    assert bounded_queue.put(3, timeout=5)
+    assert bounded_queue.get_nowait() == 3
+
+
+def test_get_blocks_until_an_item_arrives():
+    bounded_queue = BoundedQueue(4)
+    with pytest.raises(queue.Empty):
+        bounded_queue.get(timeout=0.01)
+
+    threading.Timer(0.05, bounded_queue.put, args=("hello",)).start()
+    start = time.time()
+    assert bounded_queue.get(timeout=5) == "hello"
+    assert time.time() - start < 1
+    assert not bounded_queue
@@ -0,0 +1,86 @@
+from modules.engines.EngineRegistry import EngineRegistry, create_default_engine_registry
+from modules.engines.FakeEngine import FakeEngine
+from modules.engines.GoogleCloudEngine import GoogleCloudEngine
+from modules.engines.SphinxEngine import SphinxEngine
+import functools
+import numpy as np
+import pickle
+import pytest
+import speech_recognition as sr
+import threading
+from types import SimpleNamespace
+
+AUDIO_DATA = sr.AudioData(bytes(3200), 16000, 2)
+
+
+def test_engines_are_loaded_once_per_thread():
+    engine_registry = EngineRegistry()
+    engine_registry.register("fake", functools.partial(FakeEngine, default_text="hello"))
+    engine = engine_registry.get("fake")
+    assert engine_registry.get("fake") is engine
+    assert engine.num_loads == 1
+    assert engine.recognize(AUDIO_DATA) == ("hello", 1.0)
+
+    other_thread_engines = []
+    thread = threading.Thread(target=lambda: other_thread_engines.append(engine_registry.get("fake")))
+    thread.start()
+    thread.join()
+    assert other_thread_engines[0] is not engine
+
+
+def test_registering_again_replaces_the_loaded_engine():
+    engine_registry = EngineRegistry()
+    engine_registry.register("fake", functools.partial(FakeEngine, default_text="one"))
+    assert engine_registry.get("fake").recognize(AUDIO_DATA)[0] == "one"
+    engine_registry.register("fake", functools.partial(FakeEngine, default_text="two"))
+    assert engine_registry.get("fake").recognize(AUDIO_DATA)[0] == "two"
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        EngineRegistry().get("whisper")
+
+
+def test_fake_engine_times_out():
+    engine = FakeEngine(default_text="hello", delay_seconds=5, timeout_seconds=0.01)
+    with pytest.raises(sr.RequestError):
+        engine.recognize(AUDIO_DATA)
+    with pytest.raises(sr.UnknownValueError):
+        FakeEngine().recognize(AUDIO_DATA)
+
+
+def test_default_registry_can_be_sent_to_worker_processes():
+    engine_registry = create_default_engine_registry(keyword_entries=[("ringo", 1)])
+    engine_registry.get("sphinx")
+    copied_engine_registry = pickle.loads(pickle.dumps(engine_registry))
+    assert copied_engine_registry.names == ["sphinx", "google"]
+    assert isinstance(copied_engine_registry.get("sphinx"), SphinxEngine)
+
+
+def test_sphinx_engine_keeps_its_decoder():
+    engine = SphinxEngine(timeout_seconds=60)
+    engine.load()
+    decoder = engine.decoder
+    noise = np.random.default_rng(0).normal(0, 3000, 16000).astype(np.int16).tobytes()
+    for _ in range(2):
+        try:
+            engine.recognize(sr.AudioData(noise, 16000, 2))
+        except sr.UnknownValueError:
+            pass
+    assert engine.decoder is decoder
+
+
+def test_google_cloud_engine_sends_the_rate_of_resampled_audio():
+    requests = []
+
+    class FakeSpeechClient:
+        def recognize(self, config, audio, timeout):
+            requests.append(config)
+            alternative = SimpleNamespace(transcript="hello", confidence=0.9)
+            return SimpleNamespace(results=[SimpleNamespace(alternatives=[alternative])])
+
+    engine = GoogleCloudEngine()
+    engine.client = FakeSpeechClient()
+    for sample_rate in [96000, 16000, 4000]:
+        assert engine.recognize(sr.AudioData(bytes(sample_rate // 5), sample_rate, 2)) == ("hello", 0.9)
+    assert [config.sample_rate_hertz for config in requests] == [48000, 16000, 8000]
@@ -0,0 +1,66 @@
+from modules.KeywordSpotter import KeywordSpotter
+import numpy as np
+import os
+import speech_recognition as sr
+import wave
+
+# "hey ringo how are you", synthesized with espeak-ng. "ringo" starts about 0.26 seconds in.
+KEYWORD_CLIP_PATH = os.path.join(os.path.dirname(__file__), "data", "hey_ringo.wav")
+KEYWORD_CLIP_OFFSET_SECONDS = 0.26
+
+
+def make_noise(seconds: float, sample_rate: int = 44100) -> sr.AudioData:
+    samples = np.random.default_rng(0).normal(0, 3000, int(sample_rate * seconds)).astype(np.int16)
+    return sr.AudioData(samples.tobytes(), sample_rate, 2)
+
+
+def load_keyword_clip(leading_silence_seconds: float) -> sr.AudioData:
+    with wave.open(KEYWORD_CLIP_PATH, "rb") as wav_file:
+        sample_rate = wav_file.getframerate()
+        frames = wav_file.readframes(wav_file.getnframes())
+    leading_silence = bytes(2 * int(sample_rate * leading_silence_seconds))
+    return sr.AudioData(leading_silence + frames + bytes(sample_rate), sample_rate, 2)
+
+
+def test_no_keyword_in_noise():
+    keyword_spotter = KeywordSpotter(keyword_entries=[("ringo", 1)])
+    assert keyword_spotter.spot(make_noise(1)) is None
+    assert not keyword_spotter.is_in_utterance
+
+
+def test_decoder_persists_across_streamed_utterances():
+    keyword_spotter = KeywordSpotter(keyword_entries=[("ringo", 1)])
+    decoder = keyword_spotter.decoder
+    for _ in range(3):
+        keyword_spotter.start_utterance()
+        for _ in range(4):
+            assert keyword_spotter.process(make_noise(0.25)) is None
+        # Audio is resampled to the acoustic model's rate
+        assert keyword_spotter.num_samples_processed == 4 * int(44100 * 0.25) * 16000 // 44100
+        keyword_spotter.end_utterance()
+    assert keyword_spotter.decoder is decoder
+
+
+def test_keyword_in_speech():
+    keyword_spotter = KeywordSpotter(keyword_entries=[("ringo", 1)])
+    detection = keyword_spotter.spot(load_keyword_clip(leading_silence_seconds=0.5))
+    assert detection.keyword == "ringo"
+    assert abs(detection.offset_seconds - (0.5 + KEYWORD_CLIP_OFFSET_SECONDS)) < 0.1
+    assert not keyword_spotter.is_in_utterance
+
+
+def test_keyword_in_streamed_speech():
+    keyword_spotter = KeywordSpotter(keyword_entries=[("ringo", 1)])
+    audio_data = load_keyword_clip(leading_silence_seconds=1)
+    chunk_size = 2 * (audio_data.sample_rate // 4)
+    detections = []
+    keyword_spotter.start_utterance()
+    for index in range(0, len(audio_data.frame_data), chunk_size):
+        chunk = sr.AudioData(audio_data.frame_data[index:index + chunk_size], audio_data.sample_rate, 2)
+        detections.append(keyword_spotter.process(chunk))
+    keyword_spotter.end_utterance()
+    # Nothing is spotted in the leading silence, and the offset is from the start of the utterance, not the chunk
+    assert detections[:4] == [None] * 4
+    detection = next(detection for detection in detections if detection is not None)
+    assert detection.keyword == "ringo"
+    assert abs(detection.offset_seconds - (1 + KEYWORD_CLIP_OFFSET_SECONDS)) < 0.1
@@ -0,0 +1,86 @@
+from modules.MotionEngine import MotionEngine
+import pytest
+import time
+
+
+class RecordingInput:
+    """
+    Records each batch of mouse moves with the time it was sent.
+    """
+    def __init__(self):
+        self.batches = []
+
+    def send_mouse_moves(self, moves):
+        self.batches.append((time.monotonic(), list(moves)))
+
+    @property
+    def total(self):
+        return (sum(dx for _, moves in self.batches for dx, _ in moves),
+                sum(dy for _, moves in self.batches for _, dy in moves))
+
+
+class FakeClock:
+    """
+    A clock that only advances when slept on, by a fixed oversleep on top of the requested time.
+    """
+    def __init__(self, oversleep_seconds: float = 0.0):
+        self.now = 0.0
+        self.oversleep_seconds = oversleep_seconds
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds + self.oversleep_seconds
+
+
+def test_split_adds_up_to_the_move():
+    motion_engine = MotionEngine(send_mouse_moves=lambda moves: None, max_pixels_per_move=10)
+    assert motion_engine.split(25, 0) == [(8, 0), (8, 0), (9, 0)]
+    assert motion_engine.split(-3, 7) == [(-3, 7)]
+    moves = motion_engine.split(-1000, 333)
+    assert sum(dx for dx, _ in moves) == -1000 and sum(dy for _, dy in moves) == 333
+    assert all(abs(dx) <= 10 and abs(dy) <= 10 for dx, dy in moves)
+
+
+def test_move_batches_each_frame():
+    recording_input = RecordingInput()
+    clock = FakeClock()
+    motion_engine = MotionEngine(send_mouse_moves=recording_input.send_mouse_moves, frame_seconds=0.01,
+                                 clock=clock, sleep=clock.sleep)
+    assert motion_engine.move(1000, 0, duration=0.5)
+    assert recording_input.total == (1000, 0)
+    assert len(recording_input.batches) == 50
+    assert clock.now == pytest.approx(0.5)
+
+
+def test_late_frames_keep_the_duration():
+    recording_input = RecordingInput()
+    # Every sleep overshoots by more than a frame, like coarse timer granularity
+    clock = FakeClock(oversleep_seconds=0.015)
+    motion_engine = MotionEngine(send_mouse_moves=recording_input.send_mouse_moves, frame_seconds=0.01,
+                                 clock=clock, sleep=clock.sleep)
+    assert motion_engine.move(0, -250, duration=0.02)
+    assert recording_input.total == (0, -250)
+    assert clock.now < 0.02 + 0.015 + 1e-9
+
+
+def test_move_stops_between_frames():
+    recording_input = RecordingInput()
+    clock = FakeClock()
+    motion_engine = MotionEngine(send_mouse_moves=recording_input.send_mouse_moves, frame_seconds=0.01,
+                                 clock=clock, sleep=clock.sleep)
+    assert not motion_engine.move(1000, 0, duration=0.5, should_stop=lambda: clock.now >= 0.1)
+    assert 0 < recording_input.total[0] <= 200
+
+
+def test_move_keeps_requested_duration_in_real_time():
+    recording_input = RecordingInput()
+    motion_engine = MotionEngine(send_mouse_moves=recording_input.send_mouse_moves)
+    start = time.monotonic()
+    motion_engine.move(1000, 0, duration=0.25)
+    elapsed_seconds = time.monotonic() - start
+    assert recording_input.total == (1000, 0)
+    assert 0.25 <= elapsed_seconds < 0.3
+    # About one batch per frame, instead of one input per pixel
+    assert len(recording_input.batches) <= 0.25 / MotionEngine.FRAME_SECONDS + 2
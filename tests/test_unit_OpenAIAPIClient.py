@@ -1,6 +1,13 @@
-from modules.OpenAIAPIClient import APIClient, ConversationContainer, Conversation, Dialogue, get_num_tokens_from_string
+from modules.OpenAIAPIClient import APIClient, ConversationContainer, Conversation, Dialogue, get_num_tokens_from_string, \
+    get_encoding, get_num_tokens_per_message, get_num_tokens_from_messages, get_num_message_overhead_tokens, \
+    TOKENS_PER_MESSAGE, TOKENS_PER_REPLY
 import os
 import pytest
+from modules.RetryPolicy import APIError, RetryPolicy
+from stub_http_server import StubHTTPServer, StubResponse, chat_completion_body, chat_completion_sse_chunks
+import requests
+import json
+import time
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -24,6 +31,31 @@ def test_get_num_tokens_from_string_english():
     num_tokens = get_num_tokens_from_string(string="What is 9 plus 10?", encoding_name="gpt-3.5-turbo")
     assert num_tokens == 8
 
+def test_get_encoding_is_cached():
+    assert get_encoding(MODEL) is get_encoding(MODEL)
+
+
+def test_get_num_tokens_per_message():
+    messages = [{"role": "user", "content": PROMPT}, {"role": "assistant", "content": RESPONSE}]
+    num_tokens_per_message = get_num_tokens_per_message(messages, MODEL)
+    assert num_tokens_per_message == [
+        TOKENS_PER_MESSAGE + get_num_tokens_from_string("user", MODEL) + get_num_tokens_from_string(PROMPT, MODEL),
+        TOKENS_PER_MESSAGE + get_num_tokens_from_string("assistant", MODEL) + get_num_tokens_from_string(RESPONSE, MODEL),
+    ]
+    assert get_num_tokens_from_messages(messages, MODEL) == sum(num_tokens_per_message) + TOKENS_PER_REPLY
+
+
+def test_dialogue_num_message_tokens(dialogue):
+    messages = [{"role": "user", "content": PROMPT}, {"role": "assistant", "content": RESPONSE}]
+    assert dialogue.num_message_tokens == sum(get_num_tokens_per_message(messages, MODEL))
+    assert get_num_message_overhead_tokens("user", MODEL) == TOKENS_PER_MESSAGE + get_num_tokens_from_string("user", MODEL)
+
+
+def test_dialogue_init_with_known_token_counts():
+    dialogue = Dialogue(PROMPT, RESPONSE, MODEL, prompt_num_tokens=3, response_num_tokens=4)
+    assert dialogue.total_num_tokens == 7
+
+
 def test_dialogue_init(dialogue):
     assert dialogue.prompt == PROMPT
     assert dialogue.response == RESPONSE
@@ -67,3 +99,133 @@ def test_conversation_trim(conversation, dialogue):
     prompt_tokens = get_num_tokens_from_string(PROMPT, MODEL)
     conversation.trim(prompt_tokens=prompt_tokens, token_limit=TOKEN_LIMIT)
     assert len(conversation.dialogues) < conversation.max_length  # Check trimming by token limit
+
+
+def test_conversation_running_totals(conversation, dialogue):
+    for _ in range(7):
+        conversation.add(dialogue.prompt, dialogue.response)
+    assert conversation.get_total_tokens() == sum(d.total_num_tokens for d in conversation.dialogues)
+    assert conversation.get_total_message_tokens() == sum(d.num_message_tokens for d in conversation.dialogues)
+    conversation.trim(prompt_tokens=0, token_limit=dialogue.num_message_tokens * 2)
+    assert len(conversation.dialogues) == 1
+    assert conversation.get_total_message_tokens() == dialogue.num_message_tokens
+
+
+def test_conversation_container_prunes_idle_conversations():
+    container = ConversationContainer(conversation_prune_after_seconds=60, max_dialogues_per_conversation=5, model=MODEL)
+    container.get_conversation("old").add(PROMPT, RESPONSE)
+    container.get_conversation("new").add(PROMPT, RESPONSE)
+    container.prompt_histories["old"].update_epoch -= 120
+    container.prune()
+    assert list(container.prompt_histories) == ["new"]
+    assert container.num_live_conversations == 1
+    assert container.num_pruned_conversations == 1
+    assert container.total_tokens == container.prompt_histories["new"].get_total_message_tokens()
+
+
+
+def test_conversation_container_prunes_conversations_idle_since_last_added_to():
+    container = ConversationContainer(conversation_prune_after_seconds=60, max_dialogues_per_conversation=5, model=MODEL)
+    active_conversation = container.get_conversation("active")
+    container.get_conversation("idle").add(PROMPT, RESPONSE)
+    container.prompt_histories["idle"].update_epoch -= 120
+    # Fetched before the idle conversation, but added to since
+    active_conversation.add(PROMPT, RESPONSE)
+    container.prune()
+    assert list(container.prompt_histories) == ["active"]
+    assert container.num_pruned_conversations == 1
+
+def test_conversation_container_evicts_least_recently_used_over_token_cap(dialogue):
+    container = ConversationContainer(conversation_prune_after_seconds=60, max_dialogues_per_conversation=5, model=MODEL,
+                                      max_retained_tokens=dialogue.num_message_tokens * 2)
+    container.get_conversation("a").add(PROMPT, RESPONSE)
+    container.get_conversation("b").add(PROMPT, RESPONSE)
+    container.get_conversation("a")
+    container.get_conversation("c").add(PROMPT, RESPONSE)
+    assert list(container.prompt_histories) == ["a", "c"]
+    assert container.num_evicted_conversations == 1
+    assert container.total_tokens == dialogue.num_message_tokens * 2
+
+
+def test_api_client_reuses_connections_across_prompts():
+    with StubHTTPServer() as server:
+        api_client = APIClient(base_url=server.url, path="/v1/chat/completions", api_key="test", model=MODEL,
+                               max_conversation_tokens=4096, max_response_tokens=256, max_dialogues_per_conversation=5,
+                               conversation_prune_after_seconds=60, temperature=0.5, pre_connect=True)
+        for _ in range(5):
+            assert api_client.send_prompt(prompt=PROMPT, conversation_id="test") == "TYPE_NORMAL Hello there."
+        api_client.close()
+    assert len(server.requests) == 5
+    assert server.num_connections == 1
+
+
+def test_api_client_stream_prompt_yields_chunks_as_they_arrive():
+    text_chunks = ["TYPE_NORMAL", " The answer", " is 19."]
+    with StubHTTPServer(responses=[StubResponse(chunks=chat_completion_sse_chunks(text_chunks), chunk_delay=0.05)]) as server:
+        api_client = APIClient(base_url=server.url, path="/v1/chat/completions", api_key="test", model=MODEL,
+                               max_conversation_tokens=4096, max_response_tokens=256, max_dialogues_per_conversation=5,
+                               conversation_prune_after_seconds=60, temperature=0.5)
+        start = time.time()
+        stream = api_client.stream_prompt(prompt=PROMPT, conversation_id="test")
+        assert next(stream) == "TYPE_NORMAL"
+        first_chunk_seconds = time.time() - start
+        assert list(stream) == text_chunks[1:]
+        total_seconds = time.time() - start
+        api_client.close()
+    assert json.loads(server.requests[0].body)["stream"] is True
+    # The first chunk arrived well before the rest of the stream
+    assert total_seconds - first_chunk_seconds >= 0.1
+    conversation = api_client.prompt_histories.get_conversation("test")
+    assert conversation.dialogues[0].response == "TYPE_NORMAL The answer is 19."
+
+
+def make_stub_api_client(server: StubHTTPServer, retry_policy: RetryPolicy = None) -> APIClient:
+    return APIClient(base_url=server.url, path="/v1/chat/completions", api_key="test", model=MODEL,
+                     max_conversation_tokens=4096, max_response_tokens=256, max_dialogues_per_conversation=5,
+                     conversation_prune_after_seconds=60, temperature=0.5, retry_policy=retry_policy)
+
+
+def test_api_client_send_prompt_resends_request_until_success():
+    error_body = json.dumps({"error": {"message": "The server is overloaded"}})
+    responses = [StubResponse(status=503, body=error_body),
+                 StubResponse(status=429, body=error_body, headers={"Retry-After": "0"}),
+                 StubResponse(status=500, body=error_body)]
+    with StubHTTPServer(responses=responses) as server:
+        api_client = make_stub_api_client(server, retry_policy=RetryPolicy(max_attempts=5, initial_delay=0.01))
+        assert api_client.send_prompt(prompt=PROMPT) == "TYPE_NORMAL Hello there."
+        api_client.close()
+    assert len(server.requests) == 4
+
+
+def test_api_client_send_prompt_does_not_retry_bad_key():
+    responses = [StubResponse(status=401, body=json.dumps({"error": {"message": "Incorrect API key provided"}}))]
+    with StubHTTPServer(responses=responses) as server:
+        api_client = make_stub_api_client(server, retry_policy=RetryPolicy(max_attempts=5, initial_delay=0.01))
+        with pytest.raises(APIError) as error:
+            api_client.send_prompt(prompt=PROMPT)
+        api_client.close()
+    assert error.value.status_code == 401
+    assert len(server.requests) == 1
+
+
+def test_api_client_send_prompt_retries_timeouts_within_deadline():
+    with StubHTTPServer(default_response=StubResponse(body=chat_completion_body("Too late"), delay=1)) as server:
+        api_client = make_stub_api_client(server, retry_policy=RetryPolicy(max_attempts=10, initial_delay=0.01,
+                                                                           deadline_seconds=0.5))
+        start = time.time()
+        with pytest.raises(requests.Timeout):
+            api_client.send_prompt(prompt=PROMPT)
+        elapsed_seconds = time.time() - start
+        api_client.close()
+    assert elapsed_seconds < 1
+    assert len(server.requests) >= 1
+
+
+def test_api_client_stream_prompt_retries_opening_the_stream():
+    responses = [StubResponse(status=502, body="Bad Gateway"),
+                 StubResponse(chunks=chat_completion_sse_chunks(["TYPE_YES", " Yes."]))]
+    with StubHTTPServer(responses=responses) as server:
+        api_client = make_stub_api_client(server, retry_policy=RetryPolicy(max_attempts=3, initial_delay=0.01))
+        assert "".join(api_client.stream_prompt(prompt=PROMPT)) == "TYPE_YES Yes."
+        api_client.close()
+    assert len(server.requests) == 2
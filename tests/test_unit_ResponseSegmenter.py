@@ -0,0 +1,50 @@
+from modules.ResponseSegmenter import ResponseSegmenter, split_response_type
+from modules.enums.ResponseTypeEnum import ResponseTypeEnum
+
+
+def feed_all(segmenter: ResponseSegmenter, text_chunks: list) -> list:
+    sentences = []
+    for text_chunk in text_chunks:
+        sentences += segmenter.feed(text_chunk)
+    return sentences + segmenter.flush()
+
+
+def test_split_response_type():
+    assert split_response_type("TYPE_NORMAL Hello there.") == (ResponseTypeEnum.NORMAL, "Hello there.")
+    assert split_response_type("TYPE_NO No it isn't.") == (ResponseTypeEnum.NO, "No it isn't.")
+    assert split_response_type("TYPE_CMD_TURN Turning.") == (ResponseTypeEnum.CMD_TURN, "Turning.")
+    assert split_response_type("Hello there.") == (None, "Hello there.")
+
+
+def test_segmenter_detects_response_type_before_the_sentence_is_complete():
+    segmenter = ResponseSegmenter()
+    assert segmenter.feed("TYPE_") == []
+    assert segmenter.feed("NO") == []
+    assert not segmenter.response_type_detected  # Could still become TYPE_NORMAL
+    assert segmenter.feed("RMAL Hel") == []
+    assert segmenter.response_type_detected
+    assert segmenter.response_type == ResponseTypeEnum.NORMAL
+    assert segmenter.feed("lo there. How") == ["Hello there."]
+    assert segmenter.flush() == ["How"]
+
+
+def test_segmenter_splits_sentences_across_chunks():
+    sentences = feed_all(ResponseSegmenter(), ["TYPE_YES Yes", ", 9 plus 10 is 19", ".", " It's 9.5 plus 9.5 too! Right?"])
+    assert sentences == ["Yes, 9 plus 10 is 19.", "It's 9.5 plus 9.5 too!", "Right?"]
+
+
+def test_segmenter_splits_long_sentences_at_clauses():
+    segmenter = ResponseSegmenter(min_clause_chars=10)
+    sentences = feed_all(segmenter, ["TYPE_NORMAL Short, then a much longer clause, and the end."])
+    assert sentences == ["Short, then a much longer clause,", "and the end."]
+
+
+def test_segmenter_without_response_type():
+    segmenter = ResponseSegmenter()
+    assert feed_all(segmenter, ["Hi", "! Bye"]) == ["Hi!", "Bye"]
+    assert segmenter.response_type_detected
+    assert segmenter.response_type is None
+
+
+def test_segmenter_splits_full_width_sentences():
+    assert feed_all(ResponseSegmenter(), ["TYPE_NORMAL 19です。", "ほかに何か？"]) == ["19です。", "ほかに何か？"]
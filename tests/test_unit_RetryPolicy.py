@@ -0,0 +1,82 @@
+from modules.RetryPolicy import APIError, RetryPolicy, parse_retry_after
+import asyncio
+import pytest
+import requests
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("not a date") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_get_delay_backs_off_exponentially_with_jitter():
+    retry_policy = RetryPolicy(initial_delay=1.0, max_delay=5.0, backoff_factor=2.0)
+    for attempt, max_expected_delay in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 5.0), (10, 5.0)]:
+        delays = [retry_policy.get_delay(attempt) for _ in range(100)]
+        assert all(0 <= delay <= max_expected_delay for delay in delays)
+        assert len(set(delays)) > 1
+    assert retry_policy.get_delay(1, retry_after=7.5) == 7.5
+
+
+def test_is_retryable():
+    retry_policy = RetryPolicy()
+    assert retry_policy.is_retryable(APIError("rate limited", status_code=429, retryable=True))
+    assert retry_policy.is_retryable(APIError("server error", status_code=503, retryable=True))
+    assert retry_policy.is_retryable(requests.Timeout())
+    assert retry_policy.is_retryable(requests.ConnectionError())
+    assert not retry_policy.is_retryable(APIError("bad key", status_code=401, retryable=True))
+    assert not retry_policy.is_retryable(APIError("out of quota", status_code=429, retryable=False))
+    assert not retry_policy.is_retryable(ValueError())
+
+
+def test_call_retries_until_success():
+    attempts = []
+
+    def request(remaining_seconds):
+        attempts.append(remaining_seconds)
+        if len(attempts) < 3:
+            raise APIError("server error", status_code=500, retryable=True)
+        return "ok"
+
+    assert RetryPolicy(max_attempts=5, initial_delay=0.01).call(request) == "ok"
+    assert len(attempts) == 3
+    assert attempts[0] > attempts[2]
+
+
+def test_call_gives_up_after_max_attempts():
+    attempts = []
+
+    def request(remaining_seconds):
+        attempts.append(remaining_seconds)
+        raise requests.ConnectionError()
+
+    with pytest.raises(requests.ConnectionError):
+        RetryPolicy(max_attempts=3, initial_delay=0.01).call(request)
+    assert len(attempts) == 3
+
+
+def test_call_gives_up_when_retry_would_pass_deadline():
+    attempts = []
+
+    def request(remaining_seconds):
+        attempts.append(remaining_seconds)
+        raise APIError("rate limited", status_code=429, retry_after=10, retryable=True)
+
+    with pytest.raises(APIError):
+        RetryPolicy(max_attempts=5, deadline_seconds=1).call(request)
+    assert len(attempts) == 1
+
+
+def test_call_async_retries_until_success():
+    attempts = []
+
+    async def request(remaining_seconds):
+        attempts.append(remaining_seconds)
+        if len(attempts) < 3:
+            raise requests.Timeout()
+        return "ok"
+
+    assert asyncio.run(RetryPolicy(max_attempts=5, initial_delay=0.01).call_async(request)) == "ok"
+    assert len(attempts) == 3
@@ -0,0 +1,201 @@
+from modules import SpeechToText
+from modules.KeywordSpotter import KeywordDetection
+from modules.engines.EngineRegistry import EngineRegistry
+from modules.engines.FakeEngine import FakeEngine
+from modules.TranscriptionRecord import TranscriptionRecord
+from modules.VoiceActivityDetector import VoiceActivityDetector
+from modules.enums.OverflowPolicyEnum import OverflowPolicyEnum
+import functools
+import numpy as np
+import speech_recognition as sr
+import threading
+import time
+
+
+def make_audio_data(index: int) -> sr.AudioData:
+    return sr.AudioData(frame_data=bytes([index]) * 320, sample_rate=16000, sample_width=2)
+
+
+class ReversedLatencyEngine(FakeEngine):
+    """
+    Transcribes chunk i to "<name> chunk i", and later chunks finish first.
+    """
+    def recognize(self, audio_data: sr.AudioData) -> (str, float):
+        index = audio_data.frame_data[0]
+        time.sleep(0.05 * (4 - index % 4))
+        return f"{self.name} chunk {index}", index / 10
+
+
+def make_engine_registry() -> EngineRegistry:
+    engine_registry = EngineRegistry()
+    for name in ["sphinx", "google"]:
+        engine_registry.register(name, functools.partial(ReversedLatencyEngine, name=name))
+    return engine_registry
+
+
+def test_transcriptions_are_queued_in_capture_order():
+    speech_to_text = SpeechToText.SpeechToText(engine_registry=make_engine_registry(),
+                                               num_transcription_workers=4, max_transcriptions=16,
+                                               transcription_overflow_policy=OverflowPolicyEnum.BLOCK)
+    audio_chunks = [make_audio_data(index) for index in range(8)]
+    for index, audio_chunk in enumerate(audio_chunks):
+        speech_to_text.enqueue_audio(audio_chunk, capture_epoch=1000 + index)
+
+    threading.Thread(target=speech_to_text.start_transcription, daemon=True).start()
+    threading.Thread(target=speech_to_text.collect_transcriptions, daemon=True).start()
+    start = time.time()
+    transcription_records = [speech_to_text.transcription.get(timeout=5) for _ in audio_chunks]
+    elapsed_seconds = time.time() - start
+    speech_to_text.stop()
+
+    assert [record.sequence_number for record in transcription_records] == list(range(8))
+    assert [record.text for record in transcription_records] == [f"sphinx chunk {index}" for index in range(8)]
+    assert [record.audio_data for record in transcription_records] == audio_chunks
+    assert [record.capture_epoch for record in transcription_records] == [1000 + index for index in range(8)]
+    assert [record.confidence for record in transcription_records] == [index / 10 for index in range(8)]
+    # 8 chunks take 1 second one at a time
+    assert elapsed_seconds < 0.8
+
+
+def test_retranscribe_uses_the_records_own_audio():
+    speech_to_text = SpeechToText.SpeechToText(engine_registry=make_engine_registry())
+    transcription_record = TranscriptionRecord(text="sphinx chunk 3", engine="sphinx", confidence=0.3,
+                                               audio_data=make_audio_data(3), capture_epoch=time.time() - 30,
+                                               sequence_number=5)
+    google_record = speech_to_text.retranscribe(transcription_record, engine="google")
+
+    assert google_record.text == "google chunk 3"
+    assert google_record.engine == "google"
+    assert google_record.audio_data is transcription_record.audio_data
+    assert google_record.sequence_number == 5
+    assert google_record.duration_seconds == 0.01
+    assert google_record.is_stale(max_age_seconds=10)
+    assert not google_record.is_stale(max_age_seconds=60)
+
+
+class FakeKeywordSpotter:
+    """
+    Spots a keyword in any chunk whose first byte is 7.
+    """
+    def __init__(self):
+        self.num_chunks_processed = 0
+
+    def start_utterance(self):
+        pass
+
+    def end_utterance(self):
+        pass
+
+    def process(self, audio_data: sr.AudioData):
+        self.num_chunks_processed += 1
+        if audio_data.frame_data[0] == 7:
+            return KeywordDetection(keyword="ringo", offset_seconds=0.5)
+        return None
+
+
+class FakeSource:
+    SAMPLE_RATE = 16000
+    SAMPLE_WIDTH = 2
+
+
+def test_only_utterances_with_a_keyword_are_queued(monkeypatch):
+    keyword_spotter = FakeKeywordSpotter()
+    speech_to_text = SpeechToText.SpeechToText(keyword_spotter=keyword_spotter)
+    utterances = [[make_audio_data(1), make_audio_data(2)], [make_audio_data(3), make_audio_data(7), make_audio_data(8)]]
+    monkeypatch.setattr(speech_to_text.recognizer, "listen", lambda source, stream: iter(utterances.pop(0)))
+
+    speech_to_text._capture_utterance_with_keyword(FakeSource())
+    assert speech_to_text.buffer.depth == 0
+    assert speech_to_text.num_utterances_without_keyword == 1
+
+    speech_to_text._capture_utterance_with_keyword(FakeSource())
+    audio_data, _, keyword_detection, _ = speech_to_text.buffer.get_nowait()
+    assert audio_data.frame_data == bytes([3]) * 320 + bytes([7]) * 320 + bytes([8]) * 320
+    assert keyword_detection.offset_seconds == 0.5
+    # Chunks after the keyword aren't spotted
+    assert keyword_spotter.num_chunks_processed == 4
+
+
+class FakeStream:
+    def __init__(self, pcm: bytes):
+        self.pcm = pcm
+        self.offset = 0
+
+    def read(self, size: int) -> bytes:
+        buffer = self.pcm[self.offset:self.offset + size * 2]
+        self.offset += size * 2
+        return buffer
+
+
+def test_voice_segments_are_queued_as_soon_as_speech_ends():
+    voice_activity_detector = VoiceActivityDetector(sample_rate=16000, hangover_ms=300)
+    speech_to_text = SpeechToText.SpeechToText(voice_activity_detector=voice_activity_detector)
+    speech = (np.sin(2 * np.pi * 220 * np.arange(16000) / 16000) * 8000).astype(np.int16).tobytes()
+    source = FakeSource()
+    source.CHUNK = 1024
+    source.stream = FakeStream(bytes(16000) + speech + bytes(32000))
+
+    while speech_to_text.buffer.depth == 0:
+        speech_to_text._capture_voice_segments(source)
+    audio_data, _, keyword_detection, _ = speech_to_text.buffer.get_nowait()
+    assert keyword_detection is None
+    assert audio_data.sample_rate == 16000
+    # Queued after the hangover, without reading the rest of the silence
+    assert source.stream.offset < (16000 + 16000 * 2 + 16000 * 0.4 * 2)
+
+
+def test_speculative_transcription_is_used_or_discarded():
+    speech_to_text = SpeechToText.SpeechToText(engine_registry=make_engine_registry(), speculative_engine="google",
+                                               speculate_while=lambda: True)
+    for index in range(3):
+        speech_to_text.enqueue_audio(make_audio_data(index))
+
+    threading.Thread(target=speech_to_text.start_transcription, daemon=True).start()
+    threading.Thread(target=speech_to_text.collect_transcriptions, daemon=True).start()
+    transcription_records = [speech_to_text.transcription.get(timeout=5) for _ in range(3)]
+    speech_to_text.stop()
+
+    google_record = speech_to_text.transcribe_second_stage(transcription_records[0], engine="google")
+    assert google_record.text == "google chunk 0"
+    assert google_record.engine == "google"
+    # The speculative transcription finished along with the first stage, so discarding it wastes it
+    speech_to_text.discard_speculation(transcription_records[1])
+    # Discarding twice doesn't count twice
+    speech_to_text.discard_speculation(transcription_records[1])
+
+    speculation_stats = speech_to_text.get_speculation_stats()
+    assert speculation_stats["speculations"] == 3
+    assert speculation_stats["hits"] == 1
+    assert speculation_stats["wasted"] == 1
+    assert speculation_stats["hit_rate"] == 0.5
+
+
+def test_short_utterances_are_not_speculated_on():
+    speech_to_text = SpeechToText.SpeechToText(speculative_engine="google", speculate_while=lambda: False)
+    assert not speech_to_text.should_speculate(make_audio_data(0))
+    assert speech_to_text.should_speculate(sr.AudioData(bytes(16000 * 2), 16000, 2))
+    speech_to_text.speculate_while = lambda: True
+    assert speech_to_text.should_speculate(make_audio_data(0))
+
+
+def test_evicted_and_cleared_transcriptions_discard_their_speculations():
+    speech_to_text = SpeechToText.SpeechToText(engine_registry=make_engine_registry(), speculative_engine="google",
+                                               speculate_while=lambda: True, max_transcriptions=1,
+                                               transcription_overflow_policy=OverflowPolicyEnum.DROP_OLDEST)
+    for index in range(3):
+        speech_to_text.enqueue_audio(make_audio_data(index))
+
+    threading.Thread(target=speech_to_text.start_transcription, daemon=True).start()
+    threading.Thread(target=speech_to_text.collect_transcriptions, daemon=True).start()
+    deadline = time.time() + 5
+    while speech_to_text.transcription.num_put < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    speech_to_text.stop()
+
+    speculation_stats = speech_to_text.get_speculation_stats()
+    assert speech_to_text.transcription.num_dropped == 2
+    assert speculation_stats["cancelled"] + speculation_stats["wasted"] == 2
+    speech_to_text.clear_transcriptions()
+    speculation_stats = speech_to_text.get_speculation_stats()
+    assert speculation_stats["speculations"] == 3
+    assert speculation_stats["cancelled"] + speculation_stats["wasted"] == 3
@@ -0,0 +1,82 @@
+from modules.SpeechToTextBenchmark import SpeechToTextBenchmark, get_precision_recall, get_word_error_rate, write_report
+from modules.engines.EngineRegistry import EngineRegistry
+from modules.engines.FakeEngine import FakeEngine
+import functools
+import json
+import numpy as np
+import os
+import wave
+
+TRANSCRIPTS = ["hey ringo how are you", "what a nice day", "ringo turn left"]
+
+
+def write_corpus(directory: str):
+    rng = np.random.default_rng(0)
+    for index, transcript in enumerate(TRANSCRIPTS):
+        with wave.open(os.path.join(directory, f"utterance_{index}.wav"), "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(16000)
+            wav_file.writeframes(rng.normal(0, 1000, 16000).astype(np.int16).tobytes())
+        with open(os.path.join(directory, f"utterance_{index}.txt"), "w") as transcript_file:
+            transcript_file.write(transcript)
+
+
+def test_word_error_rate():
+    assert get_word_error_rate("hey ringo how are you", "Hey, Ringo! How are you?") == 0
+    assert get_word_error_rate("hey ringo how are you", "hey bingo how you") == 2 / 5
+    assert get_word_error_rate("ringo", "") == 1
+
+
+def test_precision_recall():
+    assert get_precision_recall([True, False, True, False], [True, True, False, False]) == (0.5, 0.5)
+    assert get_precision_recall([False], [False]) == (None, None)
+
+
+def test_benchmark_report(tmp_path):
+    corpus_directory = tmp_path / "corpus"
+    corpus_directory.mkdir()
+    write_corpus(str(corpus_directory))
+    engine_registry = EngineRegistry()
+    engine_registry.register("fake", functools.partial(FakeEngine, default_text="hey ringo how are you"))
+
+    benchmark = SpeechToTextBenchmark(corpus_directory=str(corpus_directory), engine_registry=engine_registry,
+                                      keyword="ringo", isolate_engines=False)
+    report = benchmark.run(["fake"])
+    report_path = str(tmp_path / "report.json")
+    write_report(report, report_path)
+    with open(report_path) as report_file:
+        report = json.load(report_file)
+
+    assert report["corpus"] == {"num_files": 3, "audio_seconds": 3.0}
+    fake_report = report["engines"]["fake"]
+    assert [file["transcript"] for file in fake_report["files"]] == ["hey ringo how are you"] * 3
+    # Every utterance is transcribed as addressing the character, but one of them doesn't
+    assert fake_report["keyword_precision"] == round(2 / 3, 4)
+    assert fake_report["keyword_recall"] == 1.0
+    assert fake_report["latency_p50_seconds"] <= fake_report["latency_p95_seconds"] <= fake_report["latency_p99_seconds"]
+    assert fake_report["real_time_factor"] > 0
+    assert "keyword_spotter" in report["engines"]
+
+
+def test_whole_files_are_transcribed_across_pauses(tmp_path):
+    rng = np.random.default_rng(0)
+    t = np.arange(16000) / 16000
+    phrase = np.sin(2 * np.pi * 220 * t) * 8000
+    pause = rng.normal(0, 50, 16000 * 2)
+    pcm = np.concatenate((pause[:8000], phrase, pause, phrase, pause[:8000])).astype(np.int16).tobytes()
+    with wave.open(str(tmp_path / "two_phrases.wav"), "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(16000)
+        wav_file.writeframes(pcm)
+    (tmp_path / "two_phrases.txt").write_text("hey ringo how are you")
+    engine_registry = EngineRegistry()
+    # Only the file's whole audio is understood, not its first phrase
+    engine_registry.register("fake", functools.partial(FakeEngine, transcriptions={pcm: "hey ringo how are you"}))
+
+    benchmark = SpeechToTextBenchmark(corpus_directory=str(tmp_path), engine_registry=engine_registry,
+                                      isolate_engines=False)
+    fake_report = benchmark.run(["fake"])["engines"]["fake"]
+    assert fake_report["files"][0]["transcript"] == "hey ringo how are you"
+    assert fake_report["word_error_rate"] == 0
@@ -0,0 +1,117 @@
+from modules.AudioBuffer import AudioBuffer
+from modules.AudioDevice import AudioDevice
+from modules.TextToSpeechService import TextToSpeechService
+from concurrent.futures import CancelledError, Future
+import pytest
+import queue
+import threading
+import time
+
+AUDIO_DEVICE = AudioDevice(device_name="cable-a", device_index=3, is_input=True)
+
+
+class FakeTextToSpeech:
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.synthesized = []
+        self.prerendered = []
+
+    def synthesize(self, text: str) -> AudioBuffer:
+        self.synthesized.append(text)
+        return AudioBuffer(pcm=text.encode("utf-8"), sample_width=1, channels=1, frame_rate=8000)
+
+    def prerender(self, phrases):
+        self.prerendered += phrases
+
+
+class FakeAudioPlayer:
+    """
+    Plays each buffer for a fixed time, and stops early when cancelled.
+    """
+    def __init__(self, playback_seconds: float = 0.05):
+        self.playback_seconds = playback_seconds
+        self.played = []
+        self.lock = threading.Lock()
+
+    def enqueue(self, audio_buffer, audio_device, cancel_event=None, on_start=None) -> Future:
+        future = Future()
+
+        def play():
+            with self.lock:
+                if on_start is not None:
+                    on_start()
+                if cancel_event.wait(self.playback_seconds):
+                    future.set_exception(CancelledError())
+                    return
+                self.played.append(audio_buffer.pcm.decode("utf-8"))
+                future.set_result(None)
+
+        threading.Thread(target=play).start()
+        return future
+
+
+def make_service(audio_player: FakeAudioPlayer, **kwargs) -> (TextToSpeechService, list):
+    text_to_speeches = []
+
+    def text_to_speech_factory():
+        text_to_speeches.append(FakeTextToSpeech())
+        return text_to_speeches[-1]
+
+    return TextToSpeechService(text_to_speech_factory=text_to_speech_factory, audio_player=audio_player, **kwargs), text_to_speeches
+
+
+def test_speak_does_not_block_and_reports_is_speaking():
+    audio_player = FakeAudioPlayer()
+    service, text_to_speeches = make_service(audio_player, prerendered_phrases=["Goodbye"])
+    start = time.time()
+    futures = [service.speak(text, AUDIO_DEVICE) for text in ["One.", "Two.", "Three."]]
+    assert time.time() - start < 0.05
+    assert service.is_speaking
+    for future in futures:
+        future.result(timeout=5)
+    assert not service.is_speaking
+    assert audio_player.played == ["One.", "Two.", "Three."]
+    # The engine was created and used on the service's own thread
+    assert text_to_speeches[0].thread is service.thread
+    assert text_to_speeches[0].prerendered == ["Goodbye"]
+
+
+def test_cancel_stops_queued_and_playing_speech():
+    audio_player = FakeAudioPlayer(playback_seconds=5)
+    service, _ = make_service(audio_player)
+    futures = [service.speak(text, AUDIO_DEVICE) for text in ["One.", "Two.", "Three."]]
+    time.sleep(0.1)
+    start = time.time()
+    service.cancel()
+    assert not service.is_speaking
+    for future in futures:
+        with pytest.raises(CancelledError):
+            future.result(timeout=1)
+    assert time.time() - start < 1
+    assert audio_player.played == []
+
+
+def test_speak_rejects_utterances_when_queue_is_full():
+    service, _ = make_service(FakeAudioPlayer(), max_queued_utterances=1)
+    # The service hasn't started consuming yet, so the second utterance doesn't fit
+    service.start = lambda: None
+    service.speak("One.", AUDIO_DEVICE)
+    with pytest.raises(queue.Full):
+        service.speak("Two.", AUDIO_DEVICE).result(timeout=1)
+
+
+def test_blocking_speak_waits_for_room_instead_of_dropping():
+    audio_player = FakeAudioPlayer(playback_seconds=0)
+    service, _ = make_service(audio_player, max_queued_utterances=1)
+    start_service = service.start
+    service.start = lambda: None
+    service.speak("One.", AUDIO_DEVICE)
+    with pytest.raises(queue.Full):
+        service.speak("Two.", AUDIO_DEVICE, block=True, timeout=0.05).result(timeout=1)
+
+    # Once the service starts consuming, there's room for the rest
+    threading.Timer(0.05, start_service).start()
+    futures = [service.speak(text, AUDIO_DEVICE, block=True, timeout=5) for text in ["Three.", "Four.", "Five."]]
+    for future in futures:
+        future.result(timeout=5)
+    assert sorted(audio_player.played) == ["Five.", "Four.", "One.", "Three."]
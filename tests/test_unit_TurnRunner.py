@@ -0,0 +1,238 @@
+from modules.AudioDevice import AudioDevice
+from modules.Character import ConversingState, PerformingActionState, WanderingState
+from modules.TranscriptionRecord import TranscriptionRecord
+from modules.TurnRunner import AsyncTurnRunner, handle_response_type
+from modules.enums.ActionEnum import ActionEnum
+from modules.enums.ResponseTypeEnum import ResponseTypeEnum
+from concurrent.futures import Future
+import asyncio
+import pytest
+import speech_recognition as sr
+import time
+
+AUDIO_DEVICE = AudioDevice(device_name="cable-a", device_index=3, is_input=False)
+
+
+class FakeTextToSpeechService:
+    def __init__(self):
+        self.spoken = []
+        self.num_cancels = 0
+        self.is_speaking = False
+
+    def speak(self, text, audio_device, trace_id=None, block=False) -> Future:
+        self.spoken.append((text, block))
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def cancel(self):
+        self.num_cancels += 1
+        self.is_speaking = False
+
+
+class FakeActions:
+    def __init__(self):
+        self.enqueued = []
+        self.num_cancel_alls = 0
+
+    def enqueue_action(self, action, trace_id=None):
+        self.enqueued.append(action)
+
+    def cancel_all(self):
+        self.num_cancel_alls += 1
+
+
+class FakeCharacter:
+    """
+    The parts of Character the turn runner uses, without a window or input devices.
+    """
+    def __init__(self, state=None):
+        self.name = "ringo"
+        self.speaking_device = AUDIO_DEVICE
+        self.text_to_speech_service = FakeTextToSpeechService()
+        self.actions = FakeActions()
+        self.window_is_focused = True
+        self.consecutive_confused_responses = 0
+        self.conversation_uuid = None
+        self.state = None
+        self.previous_state = None
+        self.set_state(state or WanderingState())
+
+    def start_conversation(self):
+        self.conversation_uuid = "conversation"
+        self.set_state(ConversingState())
+
+    def end_conversation(self):
+        self.conversation_uuid = None
+        self.text_to_speech_service.speak("Goodbye", self.speaking_device)
+        self.set_state(WanderingState())
+
+    def set_state(self, state):
+        self.previous_state = self.state
+        self.state = state
+
+    def update(self):
+        pass
+
+
+class FakeSpeechToText:
+    def __init__(self, second_stage_text: str):
+        self.second_stage_text = second_stage_text
+        self.second_stage_records = []
+        self.discarded_records = []
+        self.num_clears = 0
+
+    def transcribe_second_stage(self, transcription_record, engine):
+        self.second_stage_records.append(transcription_record)
+        return transcription_record.with_transcription(text=self.second_stage_text, engine=engine, confidence=0.9)
+
+    def discard_speculation(self, transcription_record):
+        self.discarded_records.append(transcription_record)
+
+    def clear_transcriptions(self):
+        self.num_clears += 1
+
+
+class FakeAPIClient:
+    def __init__(self, response: str):
+        self.response = response
+        self.prompts = []
+
+    async def send_prompt_async(self, prompt, conversation_id=None, trace_id=None):
+        self.prompts.append(prompt)
+        return self.response
+
+    async def stream_prompt_async(self, prompt, conversation_id=None, trace_id=None):
+        self.prompts.append(prompt)
+        # Split mid-word and mid-prefix, like the API does
+        for index in range(0, len(self.response), 7):
+            await asyncio.sleep(0)
+            yield self.response[index:index + 7]
+
+
+def make_record(text: str, capture_epoch: float = None) -> TranscriptionRecord:
+    return TranscriptionRecord(text=text, engine="sphinx", confidence=0.5,
+                               audio_data=sr.AudioData(bytes(320), 16000, 2),
+                               capture_epoch=capture_epoch or time.time(), sequence_number=0)
+
+
+def run_turn(character: FakeCharacter, text: str, second_stage_text: str = None, response: str = "TYPE_NORMAL Hi.",
+             stream: bool = True, capture_epoch: float = None) -> (FakeSpeechToText, FakeAPIClient):
+    speech_to_text = FakeSpeechToText(second_stage_text if second_stage_text is not None else text)
+    api_client = FakeAPIClient(response)
+    turn_runner = AsyncTurnRunner(character, speech_to_text, api_client, stream=stream)
+    asyncio.run(turn_runner.run_turn(make_record(text, capture_epoch)))
+    return speech_to_text, api_client
+
+
+def get_spoken_texts(character: FakeCharacter) -> list:
+    return [text for text, _ in character.text_to_speech_service.spoken]
+
+
+def test_stale_transcriptions_are_discarded():
+    character = FakeCharacter()
+    speech_to_text, api_client = run_turn(character, "hey ringo", capture_epoch=time.time() - 60)
+    assert len(speech_to_text.discarded_records) == 1
+    assert speech_to_text.second_stage_records == []
+    assert api_client.prompts == []
+    assert character.state.is_wandering
+
+
+def test_transcriptions_not_addressing_the_character_are_discarded():
+    character = FakeCharacter(ConversingState())
+    speech_to_text, api_client = run_turn(character, "what a nice day")
+    assert len(speech_to_text.discarded_records) == 1
+    assert api_client.prompts == []
+    assert character.text_to_speech_service.spoken == []
+
+
+def test_addressing_the_character_starts_a_conversation_and_answers():
+    character = FakeCharacter()
+    speech_to_text, api_client = run_turn(character, "hey ringo", second_stage_text="Hey Ringo, how are you?",
+                                          response="TYPE_NORMAL I'm great. Thanks for asking!")
+    assert character.state.is_conversing
+    # The second stage transcribes the same audio, and its text is what's answered
+    assert len(speech_to_text.second_stage_records) == 1
+    assert api_client.prompts == ["Hey Ringo, how are you?"]
+    assert character.actions.enqueued == [ActionEnum.NOD_HEAD]
+    # Each sentence is spoken as it arrives, waiting for room instead of being dropped
+    assert character.text_to_speech_service.spoken == [("I'm great.", True), ("Thanks for asking!", True)]
+    assert speech_to_text.num_clears == 1
+
+
+def test_non_streamed_responses_are_spoken_whole():
+    character = FakeCharacter(ConversingState())
+    character.conversation_uuid = "conversation"
+    _, api_client = run_turn(character, "ringo how are you", response="TYPE_NORMAL I'm great. Thanks for asking!",
+                             stream=False)
+    assert api_client.prompts == ["ringo how are you"]
+    assert get_spoken_texts(character) == ["I'm great. Thanks for asking!"]
+
+
+def test_addressing_the_character_while_it_speaks_cancels_its_speech():
+    character = FakeCharacter(ConversingState())
+    character.text_to_speech_service.is_speaking = True
+    run_turn(character, "ringo wait")
+    assert character.text_to_speech_service.num_cancels == 1
+
+
+def test_goodbye_ends_the_conversation_without_answering():
+    character = FakeCharacter(ConversingState())
+    _, api_client = run_turn(character, "bye ringo")
+    assert api_client.prompts == []
+    assert character.state.is_wandering
+    assert get_spoken_texts(character) == ["Goodbye"]
+
+
+def test_stop_keyword_cancels_actions_and_restores_the_previous_state():
+    character = FakeCharacter(ConversingState())
+    character.set_state(PerformingActionState())
+    _, api_client = run_turn(character, "ringo stop")
+    assert character.actions.num_cancel_alls == 1
+    assert character.state.is_conversing
+    assert api_client.prompts == []
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_ending_response_ends_the_conversation(stream):
+    character = FakeCharacter(ConversingState())
+    run_turn(character, "ringo i have to go", response="TYPE_ENDING See you later.", stream=stream)
+    assert character.state.is_wandering
+    assert get_spoken_texts(character) == ["See you later.", "Goodbye"]
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_command_response_performs_the_action(stream):
+    character = FakeCharacter(ConversingState())
+    run_turn(character, "ringo turn left", response="TYPE_CMD_TURN Turning left.", stream=stream)
+    assert character.actions.enqueued == [ActionEnum.NOD_HEAD, ActionEnum.TURN_LEFT_UNTIL_STOP_FLAG]
+    assert character.state.is_performing_action
+    assert get_spoken_texts(character) == ["Turning left."]
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_command_response_is_replaced_when_the_window_is_not_focused(stream):
+    character = FakeCharacter(ConversingState())
+    character.window_is_focused = False
+    run_turn(character, "ringo move forward", response="TYPE_CMD_FORWARD Moving forward.", stream=stream)
+    assert character.actions.enqueued == [ActionEnum.NOD_HEAD]
+    assert character.state.is_conversing
+    assert get_spoken_texts(character) == ["Sorry, I cannot move right now."]
+
+
+def test_handle_response_type():
+    character = FakeCharacter(ConversingState())
+    character.consecutive_confused_responses = 2
+    assert handle_response_type(character, ResponseTypeEnum.CONFUSED, "ringo what") == (None, False, False)
+    assert character.consecutive_confused_responses == 3
+    assert handle_response_type(character, ResponseTypeEnum.NORMAL, "ringo hi") == (None, False, False)
+    assert character.consecutive_confused_responses == 0
+
+    assert handle_response_type(character, ResponseTypeEnum.YES, "ringo yes?") == (None, False, False)
+    assert handle_response_type(character, ResponseTypeEnum.NO, "ringo no?") == (None, False, False)
+    assert handle_response_type(character, ResponseTypeEnum.CMD_TURN, "ringo turn around") == (None, False, True)
+    assert handle_response_type(character, ResponseTypeEnum.CMD_BACK, "ringo back up") == (None, False, True)
+    assert character.actions.enqueued == [ActionEnum.NOD_HEAD_TWICE, ActionEnum.SHAKE_HEAD,
+                                          ActionEnum.TURN_RIGHT_UNTIL_STOP_FLAG, ActionEnum.MOVE_BACK_UNTIL_STOP_FLAG]
+    assert handle_response_type(character, ResponseTypeEnum.ENDING, "ringo bye") == (None, True, False)
+    assert handle_response_type(character, None, "ringo hi") == (None, False, False)
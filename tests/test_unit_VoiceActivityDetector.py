@@ -0,0 +1,82 @@
+from modules.VoiceActivityDetector import VoiceActivityDetector
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def make_audio(pattern: list[tuple[float, bool]]) -> bytes:
+    """
+    :param pattern: (seconds, is_speech) spans. Speech is a loud tone, silence is quiet noise.
+    """
+    rng = np.random.default_rng(0)
+    spans = []
+    for seconds, is_speech in pattern:
+        num_samples = int(SAMPLE_RATE * seconds)
+        if is_speech:
+            t = np.arange(num_samples) / SAMPLE_RATE
+            spans.append(np.sin(2 * np.pi * 220 * t) * 8000)
+        else:
+            spans.append(rng.normal(0, 50, num_samples))
+    return np.concatenate(spans).astype(np.int16).tobytes()
+
+
+def process_in_chunks(voice_activity_detector: VoiceActivityDetector, pcm: bytes, chunk_size: int = 2048) -> list:
+    segments = []
+    for offset in range(0, len(pcm), chunk_size):
+        segments += voice_activity_detector.process(pcm[offset:offset + chunk_size])
+    return segments
+
+
+def test_segments_are_emitted_after_the_hangover():
+    voice_activity_detector = VoiceActivityDetector(sample_rate=SAMPLE_RATE, frame_ms=30, hangover_ms=300)
+    segments = process_in_chunks(voice_activity_detector, make_audio([(1.0, False), (1.2, True), (1.0, False),
+                                                                      (0.6, True), (1.0, False)]))
+    assert len(segments) == 2
+    assert abs(segments[0].start_seconds - 1.0) < 0.06
+    assert abs(segments[0].end_seconds - 2.2) < 0.06
+    assert abs(segments[1].start_seconds - 3.2) < 0.06
+    assert abs(segments[1].end_seconds - 3.8) < 0.06
+    for segment in segments:
+        assert abs(segment.detected_seconds - segment.end_seconds - 0.3) < 0.06
+    # The segment includes the pre-roll and the hangover
+    assert len(segments[0].pcm) > 1.2 * SAMPLE_RATE * 2
+
+
+def test_short_noises_are_discarded_and_long_speech_is_cut():
+    voice_activity_detector = VoiceActivityDetector(sample_rate=SAMPLE_RATE, min_segment_ms=250, max_segment_ms=1500)
+    segments = process_in_chunks(voice_activity_detector, make_audio([(0.5, False), (0.1, True), (0.5, False),
+                                                                      (2.0, True)]))
+    assert len(segments) == 1
+    assert abs(segments[0].duration_seconds - 1.5) < 0.06
+    final_segment = voice_activity_detector.flush()
+    assert final_segment is not None and abs(final_segment.duration_seconds - 0.5) < 0.06
+
+
+def test_chunk_size_does_not_change_segments():
+    pcm = make_audio([(0.5, False), (0.8, True), (0.6, False), (0.4, True), (0.6, False)])
+    boundaries = []
+    for chunk_size in [100, 1024, 32000]:
+        segments = process_in_chunks(VoiceActivityDetector(sample_rate=SAMPLE_RATE), pcm, chunk_size)
+        boundaries.append([(segment.start_seconds, segment.end_seconds) for segment in segments])
+    assert boundaries[0] == boundaries[1] == boundaries[2]
+
+
+def test_noise_floor_rises_to_steady_background_noise():
+    rng = np.random.default_rng(0)
+    noise = rng.normal(0, 1200, SAMPLE_RATE * 30)
+    t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+    speech = np.sin(2 * np.pi * 220 * t) * 8000 + rng.normal(0, 1200, SAMPLE_RATE)
+    pcm = np.concatenate((noise, speech, rng.normal(0, 1200, SAMPLE_RATE))).astype(np.int16).tobytes()
+
+    voice_activity_detector = VoiceActivityDetector(sample_rate=SAMPLE_RATE)
+    segments = process_in_chunks(voice_activity_detector, pcm)
+    # At most the noise before the floor caught up to it is mistaken for speech
+    noise_segments = [segment for segment in segments if segment.start_seconds < 30.0]
+    assert len(noise_segments) <= 1
+    assert all(segment.end_seconds < 5.0 for segment in noise_segments)
+    assert 1000 < voice_activity_detector.noise_floor < 1400
+    # Speech over the noise is still detected
+    speech_segments = [segment for segment in segments if segment.start_seconds >= 30.0]
+    assert len(speech_segments) == 1
+    assert abs(speech_segments[0].start_seconds - 30.0) < 0.06
+    assert abs(speech_segments[0].end_seconds - 31.0) < 0.06
@@ -0,0 +1,91 @@
+from modules.WindowFocusTracker import WindowFocusTracker
+import pytest
+import time
+
+
+class FakeDesktop:
+    def __init__(self, active_window_title=None):
+        self.active_window_title = active_window_title
+        self.num_queries = 0
+
+    def get_active_window_title(self):
+        self.num_queries += 1
+        return self.active_window_title
+
+
+def wait_until(condition, timeout_seconds: float = 5.0):
+    deadline = time.monotonic() + timeout_seconds
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def desktop():
+    return FakeDesktop(active_window_title="NeosVR")
+
+
+def create_tracker(desktop: FakeDesktop, **kwargs) -> WindowFocusTracker:
+    return WindowFocusTracker(window_title="neosvr", get_active_window_title=desktop.get_active_window_title,
+                              use_event_hook=False, **kwargs)
+
+
+def test_focus_is_checked_at_creation(desktop: FakeDesktop):
+    assert create_tracker(desktop).is_focused
+    desktop.active_window_title = None
+    assert not create_tracker(desktop).is_focused
+
+
+def test_subscribers_are_told_about_transitions(desktop: FakeDesktop):
+    tracker = create_tracker(desktop)
+    transitions = []
+    tracker.subscribe(transitions.append)
+    tracker.start()
+    try:
+        desktop.active_window_title = "Desktop"
+        wait_until(lambda: transitions == [False])
+        desktop.active_window_title = "NeosVR"
+        wait_until(lambda: transitions == [False, True])
+        assert tracker.is_focused
+
+        tracker.unsubscribe(transitions.append)
+        desktop.active_window_title = "Desktop"
+        wait_until(lambda: not tracker.is_focused)
+        assert transitions == [False, True]
+    finally:
+        tracker.close()
+
+
+def test_polling_backs_off_while_focus_is_stable(desktop: FakeDesktop):
+    tracker = create_tracker(desktop, min_poll_interval_seconds=0.01, max_poll_interval_seconds=0.1)
+    tracker.start()
+    try:
+        time.sleep(1.0)
+        # Polling every 10 ms would have taken 100 queries
+        assert desktop.num_queries < 25
+
+        # A change is still noticed within the longest interval
+        desktop.active_window_title = "Desktop"
+        start = time.monotonic()
+        wait_until(lambda: not tracker.is_focused)
+        assert time.monotonic() - start < 0.2
+    finally:
+        tracker.close()
+
+
+def test_failing_subscriber_does_not_stop_others(desktop: FakeDesktop):
+    tracker = create_tracker(desktop)
+    transitions = []
+    tracker.subscribe(lambda is_focused: 1 / 0)
+    tracker.subscribe(transitions.append)
+    tracker._update(False)
+    assert transitions == [False]
+
+
+def test_close_right_after_start_stops_the_thread(desktop: FakeDesktop):
+    tracker = create_tracker(desktop, max_poll_interval_seconds=1.0)
+    tracker.start()
+    start = time.monotonic()
+    tracker.close()
+    assert time.monotonic() - start < tracker.CLOSE_TIMEOUT_SECONDS
+    assert not tracker.thread.is_alive()
@@ -0,0 +1,76 @@
+from modules.helpers.tracing_helper import NO_SPAN, Tracer
+import json
+import pytest
+import time
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    assert tracer.new_trace_id() is None
+    assert tracer.span("stage", "trace") is NO_SPAN
+    tracer.record("stage", "trace", time.time())
+    assert tracer.get_spans() == []
+
+
+def test_spans_are_grouped_by_trace():
+    tracer = Tracer()
+    tracer.configure(enabled=True)
+    trace_id = tracer.new_trace_id()
+    other_trace_id = tracer.new_trace_id()
+    assert trace_id != other_trace_id
+
+    with tracer.span("stt.first_stage", trace_id, engine="sphinx"):
+        time.sleep(0.01)
+    tracer.record("llm.network", other_trace_id, time.time() - 0.5)
+    # Spans of audio captured before tracing started have no trace
+    tracer.record("llm.network", None, time.time() - 0.5)
+
+    spans = tracer.get_spans(trace_id)
+    assert [span.name for span in spans] == ["stt.first_stage"]
+    assert spans[0].duration_seconds >= 0.01
+    assert spans[0].attributes == {"engine": "sphinx"}
+    assert len(tracer.get_spans()) == 2
+
+
+def test_failed_span_is_recorded_with_its_error():
+    tracer = Tracer()
+    tracer.configure(enabled=True)
+    with pytest.raises(ValueError):
+        with tracer.span("llm.parse", "trace"):
+            raise ValueError()
+    assert tracer.get_spans()[0].attributes == {"error": "ValueError"}
+
+
+def test_ring_buffer_keeps_latest_spans():
+    tracer = Tracer()
+    tracer.configure(enabled=True, ring_buffer_size=3)
+    for i in range(5):
+        tracer.record("tts.render", str(i), 0.0, 1.0)
+    assert [span.trace_id for span in tracer.get_spans()] == ["2", "3", "4"]
+
+
+def test_summary_percentiles():
+    tracer = Tracer()
+    tracer.configure(enabled=True)
+    for i in range(1, 101):
+        tracer.record("tts.render", "trace", 0.0, i / 100)
+    tracer.record("tts.playback", "trace", 0.0, 2.0)
+
+    summary = tracer.get_summary()
+    assert list(summary) == ["tts.playback", "tts.render"]
+    assert summary["tts.render"]["count"] == 100
+    assert summary["tts.render"]["p50_seconds"] == pytest.approx(0.505)
+    assert summary["tts.render"]["p99_seconds"] == pytest.approx(0.9901)
+    assert summary["tts.playback"]["p95_seconds"] == 2.0
+
+
+def test_spans_are_exported_to_jsonl(tmp_path):
+    jsonl_path = tmp_path / "spans.jsonl"
+    tracer = Tracer()
+    tracer.configure(enabled=True, jsonl_file_path=str(jsonl_path))
+    tracer.record("action.execute", "trace", 10.0, 10.25, action="nod_head")
+    tracer.configure(enabled=False)
+
+    lines = jsonl_path.read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [{"name": "action.execute", "trace_id": "trace", "start_epoch": 10.0,
+                                                    "duration_seconds": 0.25, "attributes": {"action": "nod_head"}}]